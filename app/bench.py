@@ -0,0 +1,340 @@
+import sys
+import os
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+from app.main import in_repository, read_ref
+
+# Root of the checkout, so the CLI can be run as `python -m app.main` from any directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Version of the results file layout written by `run` and read by `compare`
+RESULTS_VERSION = 1
+
+# A benchmark whose median time grows by more than this fraction is a regression
+DEFAULT_THRESHOLD = 0.10
+
+DEFAULT_REPO_OPTIONS = {
+    "files": 500,
+    "depth": 3,
+    "fanout": 4,
+    "median_size": 4096,
+    "size_sigma": 1.5,
+    "max_size": 1024 * 1024,
+    "binary_ratio": 0.1,
+    "commits": 10,
+    "changes": 0.05,
+    "seed": 1,
+}
+
+BENCHMARKS = [
+    "write-tree-cold",
+    "write-tree",
+    "stage",
+    "checkout",
+    "show-history",
+    "merge",
+    "clone",
+]
+
+def run_cli(repo, *args, perf_log=None):
+    """
+    Run one CLI command inside repo and return its stdout. Raises RuntimeError with
+    the command's stderr if it fails.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = PROJECT_ROOT
+    env.pop("GIT_TRACE", None)
+    env.pop("GIT_TRACE_PERF", None)
+    if perf_log:
+        env["GIT_TRACE_PERF"] = perf_log
+    result = subprocess.run(
+        [sys.executable, "-m", "app.main", *args],
+        cwd=repo, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed in {repo}:\n{result.stderr}")
+    return result.stdout
+
+def random_file_size(rng, options):
+    """
+    Draw a file size from a log-normal distribution around median_size, which gives
+    the many-small, few-large mix of a real source tree.
+    """
+    size = int(rng.lognormvariate(0, options["size_sigma"]) * options["median_size"])
+    return max(1, min(size, options["max_size"]))
+
+def random_file_content(rng, size, binary):
+    if binary:
+        return rng.randbytes(size)
+    words = [b"alpha", b"beta", b"gamma", b"delta", b"return", b"value", b"index", b"tree"]
+    lines = []
+    length = 0
+    while length < size:
+        line = b" ".join(rng.choice(words) for _ in range(rng.randint(1, 12))) + b"\n"
+        lines.append(line)
+        length += len(line)
+    return b"".join(lines)[:size]
+
+def generate_paths(rng, options):
+    """
+    Spread the files over a directory tree up to depth levels deep with at most
+    fanout subdirectories per directory.
+    """
+    directories = [""]
+    frontier = [""]
+    for _ in range(options["depth"]):
+        next_frontier = []
+        for parent in frontier:
+            for i in range(options["fanout"]):
+                path = os.path.join(parent, f"dir{i}")
+                directories.append(path)
+                next_frontier.append(path)
+        frontier = next_frontier
+
+    paths = []
+    for i in range(options["files"]):
+        paths.append(os.path.join(rng.choice(directories), f"file{i}.{'bin' if rng.random() < options['binary_ratio'] else 'txt'}"))
+    return paths
+
+def write_files(rng, repo, paths, options):
+    for path in paths:
+        full_path = os.path.join(repo, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "wb") as f:
+            f.write(random_file_content(rng, random_file_size(rng, options), path.endswith(".bin")))
+
+def commit_worktree(repo, message):
+    tree_sha = run_cli(repo, "write-tree").split()[-1]
+    output = run_cli(repo, "commit-tree", tree_sha, "-p", "0" * 40, "-m", message)
+    return output.split()[-1]
+
+def generate_repository(repo, options):
+    """
+    Build a synthetic repository at repo: a main branch with options["commits"]
+    commits, each rewriting a fraction of the files, and a "side" branch forked
+    from the middle of main with its own commits touching other files, so that
+    merging it needs a real three-way merge.
+    """
+    rng = random.Random(options["seed"])
+    os.makedirs(repo)
+    run_cli(repo, "init")
+
+    paths = generate_paths(rng, options)
+    write_files(rng, repo, paths, options)
+    history = [commit_worktree(repo, "Initial commit")]
+
+    changes = max(1, int(len(paths) * options["changes"]))
+    # Main only touches the first half of the files and side the second half
+    half = len(paths) // 2 or 1
+    fork_point = None
+    for i in range(1, options["commits"]):
+        write_files(rng, repo, rng.sample(paths[:half], min(changes, half)), options)
+        history.append(commit_worktree(repo, f"Commit {i}"))
+        if i == options["commits"] // 2:
+            fork_point = history[-1]
+    fork_point = fork_point or history[0]
+
+    run_cli(repo, "create-branch", "side", fork_point)
+    run_cli(repo, "create-branch", "first", history[0])
+    run_cli(repo, "checkout", "side")
+    for i in range(max(1, options["commits"] // 2)):
+        side_paths = paths[half:] or paths
+        write_files(rng, repo, rng.sample(side_paths, min(changes, len(side_paths))), options)
+        commit_worktree(repo, f"Side commit {i}")
+    run_cli(repo, "checkout", "main")
+    return paths
+
+def read_perf_report(perf_log):
+    """
+    Return the last report the CLI appended to perf_log, or None.
+    """
+    try:
+        with open(perf_log) as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return None
+    return json.loads(lines[-1]) if lines else None
+
+def time_command(repo, args, perf_log):
+    start = time.perf_counter()
+    run_cli(repo, *args, perf_log=perf_log)
+    return time.perf_counter() - start
+
+def run_benchmark(name, repo, paths, workdir, perf_log):
+    """
+    Run one repetition of a benchmark and return its wall time. Each benchmark puts
+    the repository back the way it found it.
+    """
+    if name == "write-tree-cold":
+        # Without an index every file has to be read and hashed again
+        index_path = os.path.join(repo, ".git", "index")
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        return time_command(repo, ["write-tree"], perf_log)
+    if name == "write-tree":
+        return time_command(repo, ["write-tree"], perf_log)
+    if name == "stage":
+        index_path = os.path.join(repo, ".git", "index")
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        return time_command(repo, ["stage", *paths], perf_log)
+    if name == "checkout":
+        elapsed = time_command(repo, ["checkout", "first"], perf_log)
+        run_cli(repo, "checkout", "main")
+        return elapsed
+    if name == "show-history":
+        return time_command(repo, ["show-history", "main"], perf_log)
+    if name == "merge":
+        # Merge into a throwaway branch that is not checked out, then drop it
+        # Resolved like the CLI does, so packed refs work too
+        with in_repository(repo):
+            main_sha = read_ref("refs/heads/main")
+        run_cli(repo, "create-branch", "bench-merge", main_sha)
+        elapsed = time_command(repo, ["merge", "bench-merge", "side"], perf_log)
+        os.remove(os.path.join(repo, ".git", "refs", "heads", "bench-merge"))
+        return elapsed
+    if name == "clone":
+        destination = os.path.join(workdir, "clone")
+        shutil.rmtree(destination, ignore_errors=True)
+        elapsed = time_command(workdir, ["clone", repo, destination], perf_log)
+        shutil.rmtree(destination)
+        return elapsed
+    raise RuntimeError(f"Unknown benchmark {name}")
+
+def summarize(times):
+    return {
+        "runs": times,
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+    }
+
+def run_suite(options, benchmarks, repeat, workdir):
+    """
+    Generate the repository under workdir and time each benchmark repeat times.
+    Returns the results document.
+    """
+    repo = os.path.join(workdir, "repo")
+    perf_log = os.path.join(workdir, "perf.log")
+
+    start = time.perf_counter()
+    paths = generate_repository(repo, options)
+    generate_seconds = time.perf_counter() - start
+    print(f"Generated {len(paths)} files and {options['commits']} commits in {generate_seconds:.2f}s", file=sys.stderr)
+
+    results = {}
+    for name in benchmarks:
+        times = []
+        for _ in range(repeat):
+            if os.path.exists(perf_log):
+                os.remove(perf_log)
+            times.append(run_benchmark(name, repo, paths, workdir, perf_log))
+        results[name] = summarize(times)
+        report = read_perf_report(perf_log)
+        if report:
+            results[name]["phases"] = report["phases"]
+            results[name]["counters"] = report["counters"]
+        print(f"{name:16} median {results[name]['median'] * 1000:9.1f} ms  min {results[name]['min'] * 1000:9.1f} ms", file=sys.stderr)
+
+    return {
+        "version": RESULTS_VERSION,
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "repeat": repeat,
+        "repository": options,
+        "generate_seconds": generate_seconds,
+        "results": results,
+    }
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare the median times of two result documents. Returns a list of
+    (benchmark, baseline median, current median, relative change, regressed).
+    """
+    if baseline.get("repository") != current.get("repository"):
+        print("Warning: the runs used different repository options", file=sys.stderr)
+
+    rows = []
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        old = baseline["results"][name]["median"]
+        new = result["median"]
+        change = (new - old) / old if old else 0.0
+        rows.append((name, old, new, change, change > threshold))
+    return rows
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m app.bench", description="Benchmark the CLI against a synthetic repository.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="generate a repository and time the commands")
+    run.add_argument("--files", type=int, default=DEFAULT_REPO_OPTIONS["files"], help="number of files")
+    run.add_argument("--depth", type=int, default=DEFAULT_REPO_OPTIONS["depth"], help="directory depth")
+    run.add_argument("--fanout", type=int, default=DEFAULT_REPO_OPTIONS["fanout"], help="subdirectories per directory")
+    run.add_argument("--median-size", type=int, default=DEFAULT_REPO_OPTIONS["median_size"], help="median file size in bytes")
+    run.add_argument("--size-sigma", type=float, default=DEFAULT_REPO_OPTIONS["size_sigma"], help="spread of the log-normal file size distribution")
+    run.add_argument("--max-size", type=int, default=DEFAULT_REPO_OPTIONS["max_size"], help="largest file size in bytes")
+    run.add_argument("--binary-ratio", type=float, default=DEFAULT_REPO_OPTIONS["binary_ratio"], help="fraction of files with random binary content")
+    run.add_argument("--commits", type=int, default=DEFAULT_REPO_OPTIONS["commits"], help="number of commits on main")
+    run.add_argument("--changes", type=float, default=DEFAULT_REPO_OPTIONS["changes"], help="fraction of files rewritten per commit")
+    run.add_argument("--seed", type=int, default=DEFAULT_REPO_OPTIONS["seed"], help="random seed")
+    run.add_argument("--repeat", type=int, default=5, help="repetitions per benchmark")
+    run.add_argument("--only", action="append", choices=BENCHMARKS, help="run only this benchmark (repeatable)")
+    run.add_argument("--output", "-o", help="write the results as JSON to this file instead of stdout")
+    run.add_argument("--keep", help="generate the repository in this directory and keep it")
+
+    compare = commands.add_parser("compare", help="compare two results files")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="relative slowdown reported as a regression")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.command == "run":
+        options = {key: getattr(args, key) for key in DEFAULT_REPO_OPTIONS}
+        benchmarks = args.only or BENCHMARKS
+        if args.keep:
+            if os.path.exists(args.keep):
+                raise RuntimeError(f"{args.keep} already exists")
+            os.makedirs(args.keep)
+            results = run_suite(options, benchmarks, args.repeat, os.path.abspath(args.keep))
+        else:
+            with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+                results = run_suite(options, benchmarks, args.repeat, workdir)
+
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(output + "\n")
+        else:
+            print(output)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    regressions = 0
+    for name, old, new, change, regressed in compare_results(baseline, current, args.threshold):
+        marker = "SLOWER" if regressed else ""
+        print(f"{name:16} {old * 1000:9.1f} ms -> {new * 1000:9.1f} ms  {change:+7.1%}  {marker}")
+        regressions += regressed
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,7 +5,155 @@ import hashlib
 import time
 import shutil
 import re
-import chardet
+import mmap
+import heapq
+import itertools
+import bisect
+import math
+import functools
+import operator
+import difflib
+import stat
+import struct
+import tempfile
+import atexit
+import configparser
+import json
+import contextlib
+import threading
+import signal
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# SHA of the tree with no entries, which Git never records as a subtree
+EMPTY_TREE_SHA = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+
+# Pack files live next to the loose objects and hold many objects in one file
+PACK_DIR = ".git/objects/pack"
+PACK_SIGNATURE = b"PACK"
+PACK_VERSION = 2
+
+# Object type codes used in pack entry headers (same numbering as Git)
+PACK_TYPE_CODES = {"commit": 1, "tree": 2, "blob": 3, "tag": 4}
+PACK_TYPE_NAMES = {code: name for name, code in PACK_TYPE_CODES.items()}
+PACK_OFS_DELTA = 6
+
+# Pack index (.idx) version 2: magic, version, 256-entry fan-out table, then sorted SHAs
+PACK_IDX_SIGNATURE = b"\377tOc"
+PACK_IDX_VERSION = 2
+PACK_IDX_HEADER_SIZE = 8 + 256 * 4
+
+# Delta search tuning for repack
+DELTA_WINDOW = 10
+DELTA_MAX_DEPTH = 50
+DELTA_BLOCK_SIZE = 16
+DELTA_MAX_OBJECT_SIZE = 1024 * 1024
+
+# Decompressed-object cache defaults (override with core.objectCacheSize / core.objectCacheMaxEntry)
+OBJECT_CACHE_SIZE = 64 * 1024 * 1024
+OBJECT_CACHE_MAX_ENTRY = 1024 * 1024
+
+CONFIG_PATH = ".git/config"
+
+# Commit-graph file: Git's chunked layout (OIDF fan-out, OIDL SHAs, CDAT rows, EDGE extra parents)
+COMMIT_GRAPH_PATH = ".git/objects/info/commit-graph"
+# Split commit-graph: layers named by checksum, listed oldest first in the chain file
+COMMIT_GRAPHS_DIR = ".git/objects/info/commit-graphs"
+COMMIT_GRAPH_CHAIN_PATH = COMMIT_GRAPHS_DIR + "/commit-graph-chain"
+COMMIT_GRAPH_SIZE_MULTIPLE = 2
+COMMIT_GRAPH_SIGNATURE = b"CGPH"
+COMMIT_GRAPH_NO_PARENT = 0x70000000
+COMMIT_GRAPH_EXTRA_EDGES = 0x80000000
+COMMIT_GRAPH_LAST_EDGE = 0x80000000
+
+# Binary index (.git/index): Git's version 2 layout, one fixed-size record per path
+INDEX_PATH = ".git/index"
+# Cache-tree kept next to the index: the tree SHA of each directory whose entries
+# are unchanged since write-tree, so status can skip it when HEAD has the same tree
+CACHE_TREE_SUFFIX = ".trees"
+
+# Large blobs split into chunks are stored as a manifest here instead of a loose object
+CHUNKED_DIR = ".git/objects/chunked"
+# Target average chunk size for chunking.averageSize
+CHUNK_AVERAGE_SIZE = 64 * 1024
+# Chunk boundaries come from a gear rolling hash over the last CHUNK_WINDOW bytes, so
+# they depend only on nearby content and survive insertions. The hash is as many
+# bits wide as the window, so older bytes shift out of it. Candidate positions are
+# prefiltered a segment at a time on hash bits 8-15.
+CHUNK_WINDOW = 48
+CHUNK_HASH_MASK = (1 << CHUNK_WINDOW) - 1
+CHUNK_PREFILTER_SHIFT = 8
+CHUNK_SCAN_SEGMENT = 16 * 1024
+
+# fsmonitor: the daemon's event log and pid, and the CLI's progress through the log
+FSMONITOR_LOG_PATH = ".git/fsmonitor.log"
+FSMONITOR_PID_PATH = ".git/fsmonitor.pid"
+FSMONITOR_STATE_PATH = ".git/fsmonitor.state"
+FSMONITOR_COOKIE_PREFIX = "fsmonitor-cookie-"
+# Seconds to wait for the daemon to echo a sync cookie
+FSMONITOR_TIMEOUT = 2.0
+# The daemon starts a new, compacted log once the current one grows past this size
+FSMONITOR_LOG_LIMIT = 1024 * 1024
+# struct inotify_event: wd, mask, cookie, len, then len bytes of NUL-padded name
+FSMONITOR_EVENT_FORMAT = struct.Struct("iIII")
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+FSMONITOR_WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM
+                        | IN_MOVED_TO | IN_CREATE | IN_DELETE)
+
+# Repository daemon: serves read-only commands from warm caches over a Unix socket
+DAEMON_SOCKET_PATH = ".git/daemon.sock"
+DAEMON_PID_PATH = ".git/daemon.pid"
+DAEMON_COMMANDS = {"cat-file", "ls-tree", "show-history", "diff", "blame"}
+# Parsed trees and commits the daemon keeps, least recently used dropped first
+DAEMON_PARSED_OBJECTS = 50_000
+# Seconds to wait for a background daemon to start or stop
+DAEMON_START_TIMEOUT = 2.0
+
+PACKED_REFS_PATH = ".git/packed-refs"
+# Header of the packed-refs file; "sorted" lets readers binary-search it
+PACKED_REFS_HEADER = b"# pack-refs with: peeled fully-peeled sorted \n"
+INDEX_SIGNATURE = b"DIRC"
+INDEX_VERSION = 2
+INDEX_ENTRY_FORMAT = struct.Struct(">10I20sH")
+# Stat fields that must match the index entry for a file to count as unchanged
+INDEX_STAT_FIELDS = ("mtime", "ctime", "size", "ino", "mode")
+
+# Files are hashed and compressed in chunks of this size so memory use stays flat
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Binary blobs are test-compressed on a sample of this many bytes
+COMPRESSION_SAMPLE_SIZE = 16 * 1024
+# A sample that deflates to more than this fraction of its size counts as incompressible
+INCOMPRESSIBLE_RATIO = 0.95
+# Running totals of the work the compression policy skipped
+COMPRESSION_STATS_PATH = ".git/compression-stats"
+
+# Linux ioctl that makes dst share src's data blocks (copy-on-write) on btrfs, XFS etc.
+FICLONE = 0x40049409
+
+# Files under .git a local clone copies; objects are linked instead
+CLONE_METADATA = ["HEAD", "config", "packed-refs", "refs"]
+
+# Shallow clones list the commits whose parents were left out; partial clones fetch
+# filtered-out blobs from this remote
+SHALLOW_PATH = ".git/shallow"
+PROMISOR_REMOTE = "origin"
+
+# log --since/--until: relative units ("2 weeks ago") and absolute date formats
+LOG_DATE_UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400,
+                  "week": 7 * 86400, "month": 30 * 86400, "year": 365 * 86400}
+LOG_DATE_FORMATS = ["%Y-%m-%d", "%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"]
 
 
 def initialize_git_repo():
@@ -21,40 +169,267 @@ def initialize_git_repo():
     with open('.git/HEAD', 'w') as f:
         f.write('ref: refs/heads/main\n')
 
-def get_blob_content(blob_sha):
+# Instrumentation state for this command: debug output switch, perf trace target,
+# per-phase wall time and counters
+_trace = {
+    "debug": False,
+    "perf_target": None,
+    "start": time.perf_counter(),
+    "phases": {},
+    "counters": {},
+    "lock": threading.Lock(),
+}
+
+def configure_tracing(argv):
     """
-    Retrieve the content of a blob object from the .git/objects directory.
+    Set up tracing from the environment and the global --trace flag (which is removed
+    from argv). --trace or GIT_TRACE=1 turns on debug output on stderr and the perf
+    report; GIT_TRACE_PERF=1 sends only the perf report to stderr, and
+    GIT_TRACE_PERF=<absolute path> appends it to that file as one JSON line.
+    """
+    if "--trace" in argv:
+        argv.remove("--trace")
+        _trace["debug"] = True
+    elif os.environ.get("GIT_TRACE", "").lower() in ("1", "true"):
+        _trace["debug"] = True
+
+    perf = os.environ.get("GIT_TRACE_PERF", "")
+    if os.path.isabs(perf):
+        _trace["perf_target"] = perf
+    elif perf.lower() in ("1", "true") or _trace["debug"]:
+        _trace["perf_target"] = "stderr"
+
+    if _trace["perf_target"]:
+        atexit.register(emit_perf_trace, list(argv[1:2]))
+
+def trace(message):
+    """
+    Print a debug line to stderr, only when tracing is on. Hot paths call this
+    instead of print so quiet runs pay nothing for the formatting or the I/O.
     """
-    # Construct the file path for the blob object
-    blob_dir = f".git/objects/{blob_sha[:2]}"
-    blob_file = f"{blob_dir}/{blob_sha[2:]}"
+    if _trace["debug"]:
+        print(message, file=sys.stderr)
 
-    if not os.path.exists(blob_file):
-        raise RuntimeError(f"Blob {blob_sha} not found")
+def perf_count(counter, amount=1):
+    # Hashing workers count from several threads at once
+    with _trace["lock"]:
+        counters = _trace["counters"]
+        counters[counter] = counters.get(counter, 0) + amount
+
+@contextlib.contextmanager
+def trace_phase(name):
+    """
+    Accumulate the wall time spent in a named phase of the command.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phase = _trace["phases"].setdefault(name, {"seconds": 0.0, "calls": 0})
+        phase["seconds"] += time.perf_counter() - start
+        phase["calls"] += 1
+
+def emit_perf_trace(command):
+    """
+    Write the phase timings and counters for this command as one JSON object.
+    """
+    report = {
+        "command": command[0] if command else None,
+        "pid": os.getpid(),
+        "timestamp": time.time(),
+        "wall_seconds": time.perf_counter() - _trace["start"],
+        "phases": _trace["phases"],
+        "counters": dict(_trace["counters"]),
+    }
+    if _object_cache is not None:
+        stats = get_object_cache_stats()
+        report["counters"]["cache_hits"] = stats["hits"]
+        report["counters"]["cache_misses"] = stats["misses"]
+        report["object_cache"] = stats
+
+    line = json.dumps(report, sort_keys=True)
+    if _trace["perf_target"] == "stderr":
+        print(line, file=sys.stderr)
+    else:
+        with open(_trace["perf_target"], "a") as f:
+            f.write(line + "\n")
+
+# Parsed .git/config, loaded on first use
+_config = None
 
-    # Read the compressed data from the blob file
-    with open(blob_file, "rb") as f:
-        compressed_data = f.read()
+def read_config():
+    """
+    Load .git/config once per process. Sections follow Git's layout, e.g. [core]
+    or [remote "origin"]; keys are case-insensitive.
+    """
+    global _config
+    if _config is None:
+        # Publish the parser only once it is filled, as worker threads read it too
+        config = configparser.ConfigParser(interpolation=None)
+        config.read(CONFIG_PATH)
+        _config = config
+    return _config
+
+def split_config_key(key):
+    """
+    Split "section.key" or "section.subsection.key" into a configparser section and key.
+    """
+    parts = key.split(".")
+    if len(parts) < 2:
+        raise RuntimeError(f"Invalid config key: {key}")
+    if len(parts) == 2:
+        return parts[0].lower(), parts[1].lower()
+    return f'{parts[0].lower()} "{".".join(parts[1:-1])}"', parts[-1].lower()
+
+def get_config(key, default=None):
+    section, option = split_config_key(key)
+    return read_config().get(section, option, fallback=default)
+
+def get_config_size(key, default):
+    """
+    Read a byte size from config, accepting k/m/g suffixes like Git does.
+    """
+    value = get_config(key)
+    if value is None:
+        return default
+    return parse_size(value)
+
+def parse_size(value):
+    value = value.strip().lower()
+    units = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+    if value and value[-1] in units:
+        return int(value[:-1]) * units[value[-1]]
+    return int(value)
+
+def get_config_bool(key, default=False):
+    """
+    Read a boolean from config, accepting the spellings Git does.
+    """
+    value = get_config(key)
+    if value is None:
+        return default
+    value = value.strip().lower()
+    if value in ("true", "yes", "on", "1", ""):
+        return True
+    if value in ("false", "no", "off", "0"):
+        return False
+    raise RuntimeError(f"Invalid boolean for {key}: {value}")
+
+def set_config(key, value):
+    """
+    Set a config value and write .git/config back out.
+    """
+    config = read_config()
+    section, option = split_config_key(key)
+    if not config.has_section(section):
+        config.add_section(section)
+    config.set(section, option, value)
+    with open(CONFIG_PATH, "w") as f:
+        config.write(f)
+
+# Process-wide LRU cache of decompressed objects: key -> (type, content)
+_object_cache = None
+
+def get_object_cache():
+    """
+    Return the object cache, creating it with the configured byte budget on first use.
+    """
+    global _object_cache
+    if _object_cache is None:
+        _object_cache = {
+            "entries": OrderedDict(),
+            "bytes": 0,
+            "budget": get_config_size("core.objectCacheSize", OBJECT_CACHE_SIZE),
+            "max_entry": get_config_size("core.objectCacheMaxEntry", OBJECT_CACHE_MAX_ENTRY),
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "bypassed": 0,
+            # Parallel checkout reads objects from worker threads
+            "lock": threading.Lock(),
+        }
+    return _object_cache
 
-    # Decompress the data
-    decompressed_data = zlib.decompress(compressed_data)
+def cache_get(key):
+    """
+    Look up a decompressed object and mark it most recently used.
+    """
+    cache = get_object_cache()
+    with cache["lock"]:
+        value = cache["entries"].get(key)
+        if value is None:
+            cache["misses"] += 1
+            return None
+        cache["entries"].move_to_end(key)
+        cache["hits"] += 1
+        return value
+
+def cache_put(key, value):
+    """
+    Store a decompressed object, evicting least recently used entries to stay within
+    the byte budget. Objects larger than the per-entry limit bypass the cache.
+    """
+    cache = get_object_cache()
+    size = len(value[1])
+    if size > cache["max_entry"] or size > cache["budget"]:
+        cache["bypassed"] += 1
+        return
+    with cache["lock"]:
+        if key in cache["entries"]:
+            return
+
+        cache["entries"][key] = value
+        cache["bytes"] += size
+        while cache["bytes"] > cache["budget"]:
+            _, (_, evicted) = cache["entries"].popitem(last=False)
+            cache["bytes"] -= len(evicted)
+            cache["evictions"] += 1
+
+def get_object_cache_stats():
+    """
+    Return the cache counters so the budget can be sized against real workloads.
+    """
+    cache = get_object_cache()
+    lookups = cache["hits"] + cache["misses"]
+    return {
+        "hits": cache["hits"],
+        "misses": cache["misses"],
+        "hit_rate": cache["hits"] / lookups if lookups else 0.0,
+        "evictions": cache["evictions"],
+        "bypassed": cache["bypassed"],
+        "entries": len(cache["entries"]),
+        "bytes": cache["bytes"],
+        "budget": cache["budget"],
+    }
+
+def print_object_cache_stats():
+    if _object_cache is not None:
+        stats = get_object_cache_stats()
+        print("Object cache: " + " ".join(f"{key}={value}" for key, value in stats.items()), file=sys.stderr)
 
-    # Split the decompressed data into the header and content
-    header, content = decompressed_data.split(b'\0', 1)
-    blob_type, size = header.split(b' ', 1)
+def get_blob_content(blob_sha):
+    """
+    Retrieve the content of a blob object from the .git/objects directory.
+    """
+    # Read the object from loose storage or a pack
+    try:
+        blob = load_object(blob_sha)
+    except RuntimeError:
+        raise RuntimeError(f"Blob {blob_sha} not found")
 
-    if blob_type != b"blob":
-        raise RuntimeError(f"Unexpected object type: {blob_type.decode()}")
+    if not isinstance(blob, Blob):
+        raise RuntimeError(f"Unexpected object type: {blob.type_name}")
+    content = blob.data
 
     # Check if the content is binary by looking for non-printable characters
     if is_binary_content(content):
-        print(f"Blob {blob_sha} is binary. Returning raw binary content.")
+        trace(f"Blob {blob_sha} is binary. Returning raw binary content.")
         return content  # Return binary content as-is
     else:
         try:
             return content.decode('utf-8')
         except UnicodeDecodeError:
-            print(f"Blob {blob_sha} could not be decoded as UTF-8. Returning raw binary content.")
+            trace(f"Blob {blob_sha} could not be decoded as UTF-8. Returning raw binary content.")
             return content  # Return binary content as-is
 
 def is_binary_content(content):
@@ -67,36 +442,473 @@ def is_binary_content(content):
     # If any character is not in the text_characters set, treat as binary
     return bool(content.translate(None, text_characters))
 
-def hash_object(file_path):
-    # Read the file's content
-    with open(file_path, 'rb') as f:
-        content = f.read()
+# zlib level per object type, read from this repository's config on first use
+_compression_levels = None
+
+# This command's additions to the persisted compression stats
+_compression = {
+    "stats": {},
+    "stats_path": None,
+    "lock": threading.Lock(),
+}
+
+def get_compression_level(obj_type):
+    """
+    Return the zlib level for an object type: compression.<type>, else
+    core.looseCompression, else core.compression, else zlib's default.
+    """
+    global _compression_levels
+    if _compression_levels is None:
+        _compression_levels = {}
+    levels = _compression_levels
+    if obj_type not in levels:
+        level = -1
+        for key in (f"compression.{obj_type}", "core.looseCompression", "core.compression"):
+            value = get_config(key)
+            if value is not None:
+                level = int(value)
+                break
+        if not -1 <= level <= 9:
+            raise RuntimeError(f"Invalid compression level for {obj_type}: {level}")
+        levels[obj_type] = level
+    return levels[obj_type]
+
+def sample_content(data):
+    """
+    Take COMPRESSION_SAMPLE_SIZE bytes from the start, middle and end of data.
+    """
+    if len(data) <= COMPRESSION_SAMPLE_SIZE:
+        return data
+    part = COMPRESSION_SAMPLE_SIZE // 3
+    middle = len(data) // 2
+    return data[:part] + data[middle:middle + part] + data[-part:]
 
-    # Compute the SHA-1 hash over the uncompressed content
-    file_size = len(content)
-    header = f'blob {file_size}\0'.encode()  # Format: blob <size>\0
-    data_to_hash = header + content
-    sha1_hash = hashlib.sha1(data_to_hash).hexdigest()
+def choose_compression_level(obj_type, sample, size):
+    """
+    Return the zlib level to store an object at. Binary blobs whose sample doesn't
+    shrink (already-compressed media, archives, encrypted data) are stored at level
+    0: still a valid zlib stream, so readers are unaffected, but without the
+    deflate work. The CPU and bytes this saves are estimated from the sample.
+    """
+    level = get_compression_level(obj_type)
+    if obj_type != "blob" or level == 0 or len(sample) < 1024 or not is_binary_content(sample):
+        return level
+
+    start = time.thread_time()
+    compressed_size = len(zlib.compress(sample, 1))
+    sample_seconds = time.thread_time() - start
+    record_compression_stat("sampled_blobs", 1)
+    record_compression_stat("sample_cpu_seconds", sample_seconds)
+    if compressed_size < len(sample) * INCOMPRESSIBLE_RATIO:
+        return level
+
+    # Scale the sample up to the whole object to estimate what was skipped
+    scale = size / len(sample)
+    record_compression_stat("uncompressed_blobs", 1)
+    record_compression_stat("uncompressed_bytes", size)
+    record_compression_stat("cpu_seconds_saved", sample_seconds * scale)
+    record_compression_stat("bytes_saved", max(0, int((compressed_size - len(sample)) * scale)))
+    perf_count("compression_skipped")
+    return 0
+
+def record_compression_stat(name, amount):
+    with _compression["lock"]:
+        stats = _compression["stats"]
+        if _compression["stats_path"] is None:
+            # Saved at exit, to the repository the objects were written to
+            _compression["stats_path"] = os.path.abspath(COMPRESSION_STATS_PATH)
+            atexit.register(save_compression_stats)
+        stats[name] = stats.get(name, 0) + amount
+
+def read_compression_stats(stats_path=COMPRESSION_STATS_PATH):
+    try:
+        with open(stats_path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_compression_stats():
+    """
+    Add this command's compression stats to the running totals in the stats file.
+    """
+    stats_path = _compression["stats_path"]
+    if not _compression["stats"] or not os.path.isdir(os.path.dirname(stats_path)):
+        return
+    totals = read_compression_stats(stats_path)
+    for name, amount in _compression["stats"].items():
+        totals[name] = totals.get(name, 0) + amount
+    tmp_path = stats_path + ".lock"
+    with open(tmp_path, "w") as f:
+        json.dump(totals, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, stats_path)
+    _compression["stats"] = {}
+
+def print_repository_stats():
+    """
+    Print object storage totals and what the compression policy has saved so far.
+    """
+    loose_count = loose_bytes = 0
+    for sha in list_loose_objects():
+        loose_count += 1
+        loose_bytes += os.path.getsize(loose_object_path(sha))
+    packs = load_packs(rescan=True)
+    pack_objects = sum(pack["count"] for pack in packs)
+    pack_bytes = sum(os.path.getsize(pack["path"]) for pack in packs)
+    chunked = sum(len(files) for _, _, files in os.walk(CHUNKED_DIR))
+
+    print(f"Loose objects: {loose_count} ({loose_bytes / 1024:.1f} KiB)")
+    print(f"Packed objects: {pack_objects} in {len(packs)} packs ({pack_bytes / 1024:.1f} KiB)")
+    print(f"Chunked blobs: {chunked}")
+
+    stats = read_compression_stats()
+    print(f"Binary blobs sampled: {stats.get('sampled_blobs', 0)} "
+          f"({stats.get('sample_cpu_seconds', 0):.3f}s CPU)")
+    print(f"Stored uncompressed: {stats.get('uncompressed_blobs', 0)} blobs "
+          f"({stats.get('uncompressed_bytes', 0) / 1024:.1f} KiB)")
+    print(f"Estimated CPU saved: {stats.get('cpu_seconds_saved', 0):.3f}s")
+    print(f"Estimated bytes saved: {stats.get('bytes_saved', 0)}")
+
+# Loose-object writer state: object directories known to exist, and the objects of
+# the open batch (SHA -> (temp file, final path)), already fsynced, whose renames
+# wait for the end of the batch
+_object_writer = {
+    "dirs": set(),
+    "batch": None,
+    "lock": threading.Lock(),
+}
+
+def loose_object_path(object_sha):
+    return f".git/objects/{object_sha[:2]}/{object_sha[2:]}"
+
+def object_exists(object_sha):
+    """
+    Return True if the object is already stored, loose, in a pack or in the open batch.
+    """
+    batch = _object_writer["batch"]
+    if batch is not None and object_sha in batch:
+        return True
+    if os.path.exists(loose_object_path(object_sha)) or os.path.exists(chunk_manifest_path(object_sha)):
+        return True
+    return any(find_pack_offset(pack, object_sha) is not None for pack in load_packs())
+
+def ensure_object_dir(object_path):
+    """
+    Create the fan-out directory for an object path, remembering the ones already
+    made so a large write costs at most 256 mkdir calls.
+    """
+    directory = os.path.dirname(object_path)
+    if directory not in _object_writer["dirs"]:
+        os.makedirs(directory, exist_ok=True)
+        _object_writer["dirs"].add(directory)
 
-    # Create the file path based on the first two characters of the hash
-    object_dir = '.git/objects'
-    dir_name = sha1_hash[:2]
-    file_name = sha1_hash[2:]
+def open_object_temp_file():
+    """
+    Return (file, path) for a new temp file in .git/objects. Objects are written
+    there first and only renamed to their final name once complete.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix="tmp_obj_", dir=".git/objects")
+    return os.fdopen(fd, "wb"), tmp_path
 
-    object_path = os.path.join(object_dir, dir_name, file_name)
+def finish_object_temp_file(out_file, tmp_path, object_sha, object_path=None):
+    """
+    Close a completed temp file and move it to object_path (the loose object path
+    by default). If the object
+    already exists the temp file is dropped. With core.fsyncObjectFiles set, the
+    file is fsynced before the rename and its directory after it, or, inside
+    object_batch(), the rename waits for the end of the batch.
+    """
+    fsync = get_config_bool("core.fsyncObjectFiles")
+    batch = _object_writer["batch"]
+    if fsync:
+        out_file.flush()
+        os.fsync(out_file.fileno())
+    size = out_file.tell()
+    out_file.close()
+
+    with _object_writer["lock"]:
+        if object_exists(object_sha):
+            os.remove(tmp_path)
+            return False
+        object_path = object_path or loose_object_path(object_sha)
+        if fsync and batch is not None:
+            batch[object_sha] = (tmp_path, object_path)
+        else:
+            ensure_object_dir(object_path)
+            os.replace(tmp_path, object_path)
+            if fsync:
+                fsync_directory(os.path.dirname(object_path))
 
-    # Ensure the directory exists
-    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+    perf_count("objects_written")
+    perf_count("bytes_written", size)
+    return True
 
-    # Compress the data using zlib and write it to the object file
-    with open(object_path, 'wb') as out_file:
-        compressed_data = zlib.compress(data_to_hash)
+def write_loose_object(object_sha, compressed_data):
+    """
+    Store already-compressed object data under its SHA unless it exists.
+    """
+    out_file, tmp_path = open_object_temp_file()
+    try:
         out_file.write(compressed_data)
+        return finish_object_temp_file(out_file, tmp_path, object_sha)
+    except BaseException:
+        out_file.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def fsync_directory(directory):
+    """
+    Make the renames into a directory durable by fsyncing the directory itself.
+    """
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+@contextlib.contextmanager
+def object_batch():
+    """
+    Group loose-object writes into one transaction. With core.fsyncObjectFiles set,
+    each object is fsynced as it is written but stays in its temp file until the
+    batch ends. All of them are then renamed into place, and each object directory
+    is fsynced once, instead of once per object. Callers must not update refs or
+    the index to point at batched objects until the batch is closed. Nested
+    batches join the outer one.
+    """
+    if _object_writer["batch"] is not None:
+        yield
+        return
+
+    _object_writer["batch"] = {}
+    try:
+        yield
+    finally:
+        batch = _object_writer["batch"]
+        _object_writer["batch"] = None
+        if batch:
+            directories = set()
+            for tmp_path, object_path in batch.values():
+                ensure_object_dir(object_path)
+                os.replace(tmp_path, object_path)
+                directories.add(os.path.dirname(object_path))
+            for directory in sorted(directories):
+                fsync_directory(directory)
+
+def hash_object(file_path):
+    # Stream the file into the object store
+    sha1_hash = hash_file_streaming(file_path)
 
     # Output the hash to stdout
     print(sha1_hash)
     return sha1_hash
 
+def hash_file_streaming(file_path):
+    """
+    Store a file as a blob without holding it in memory. The file is read in fixed
+    chunks that feed both an incremental SHA-1 and a zlib compressor writing to a
+    temp file, which is renamed into place once the hash is known.
+    """
+    with open(file_path, "rb") as f:
+        # The header needs the size before any content is hashed
+        file_size = os.fstat(f.fileno()).st_size
+        threshold = get_config_size("chunking.threshold", 0)
+        if threshold and file_size >= threshold:
+            return hash_file_chunked(f, file_path, file_size)
+        header = f"blob {file_size}\0".encode()
+        sha1 = hashlib.sha1(header)
+
+        # The first chunk is the sample the compression level is chosen from
+        chunk = f.read(STREAM_CHUNK_SIZE)
+        compressor = zlib.compressobj(choose_compression_level("blob", sample_content(chunk), file_size))
+
+        out_file, tmp_path = open_object_temp_file()
+        try:
+            out_file.write(compressor.compress(header))
+            bytes_read = 0
+            while chunk:
+                bytes_read += len(chunk)
+                sha1.update(chunk)
+                out_file.write(compressor.compress(chunk))
+                chunk = f.read(STREAM_CHUNK_SIZE)
+            out_file.write(compressor.flush())
+
+            if bytes_read != file_size:
+                raise RuntimeError(f"{file_path} changed size while it was being hashed")
+
+            sha1_hash = sha1.hexdigest()
+            finish_object_temp_file(out_file, tmp_path, sha1_hash)
+        except BaseException:
+            out_file.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    return sha1_hash
+
+def chunk_manifest_path(object_sha):
+    return f"{CHUNKED_DIR}/{object_sha[:2]}/{object_sha[2:]}"
+
+# Gear hash tables, built on first use: the per-byte random values shifted by each
+# window position, and the prefiltered byte of each
+_gear_tables = None
+
+def load_gear_tables():
+    """
+    Return (shifted, prefilter): shifted[j][b] is the gear value of byte b after j
+    more bytes have been hashed, and prefilter[j] maps b to that value's bits 8-15,
+    as a translate table. The gear values come from SHA-256, so chunk boundaries
+    are the same on every machine.
+    """
+    global _gear_tables
+    if _gear_tables is None:
+        gear = [int.from_bytes(hashlib.sha256(bytes([b])).digest()[:8], "little") for b in range(256)]
+        shifted = [[(value << j) & CHUNK_HASH_MASK for value in gear] for j in range(CHUNK_WINDOW)]
+        prefilter = [bytes((value >> CHUNK_PREFILTER_SHIFT) & 0xff for value in shifted[j])
+                     for j in range(CHUNK_PREFILTER_SHIFT + 8)]
+        _gear_tables = (shifted, prefilter)
+    return _gear_tables
+
+def chunk_boundary_mask(bits):
+    """
+    Return a mask of the given number of bits for (hash & mask) == 0 boundary tests.
+    Up to 8 of them are the prefiltered bits 8-15. The rest are spread over the top
+    of the hash, which depends on every byte of the window. (The lowest bits depend
+    on only the last few bytes, so they are never used.)
+    """
+    prefilter_bits = min(bits, 8)
+    mask = ((1 << prefilter_bits) - 1) << CHUNK_PREFILTER_SHIFT
+    for i in range(bits - prefilter_bits):
+        mask |= 1 << (CHUNK_WINDOW - 1 - 2 * i)
+    return mask
+
+def find_chunk_end(data, start, end, min_size, normal_size, masks):
+    """
+    Return the end of the chunk that starts at data[start], looking no further than
+    end. A chunk ends after a byte where the gear hash of the last CHUNK_WINDOW
+    bytes, h = (h << 1) ^ gear[byte], is zero under the mask. Before normal_size
+    the stricter masks[0] applies and after it masks[1], which pulls chunk sizes
+    towards the average (FastCDC's normalized chunking).
+
+    Hashing every byte in Python would be far too slow. Bits 8-15 of the hash only
+    depend on the last 16 bytes, so they are computed for a whole segment at once:
+    each of those bytes is translated through its table and the results are XORed
+    as big integers. Only positions that pass on those bits are hashed in full.
+    """
+    shifted, prefilter = load_gear_tables()
+    regions = ((start + min_size, min(start + normal_size, end), masks[0]),
+               (start + max(min_size, normal_size), end, masks[1]))
+    for position, region_end, mask in regions:
+        byte_mask = (mask >> CHUNK_PREFILTER_SHIFT) & 0xff
+        passes = bytes(0 if value & byte_mask == 0 else 1 for value in range(256))
+        while position < region_end:
+            segment_end = min(position + CHUNK_SCAN_SEGMENT, region_end)
+            # Hash bits 8-15 for each chunk end in [position, segment_end)
+            hash_byte = 0
+            for j, table in enumerate(prefilter):
+                hash_byte ^= int.from_bytes(data[position - 1 - j:segment_end - 1 - j].translate(table), "little")
+            candidates = hash_byte.to_bytes(segment_end - position, "little").translate(passes)
+            candidate = candidates.find(0)
+            while candidate != -1:
+                last = position + candidate - 1
+                window = data[last:last - CHUNK_WINDOW:-1] if last >= CHUNK_WINDOW else data[last::-1]
+                if functools.reduce(operator.xor, map(list.__getitem__, shifted, window)) & mask == 0:
+                    return last + 1
+                candidate = candidates.find(0, candidate + 1)
+            position = segment_end
+    return end
+
+def iter_content_chunks(f, average_size):
+    """
+    Read a file and yield it as content-defined chunks of average_size on average,
+    never smaller than a quarter or larger than four times that (except the last).
+    Boundaries depend only on the CHUNK_WINDOW bytes before them, so an edit only
+    changes the chunks around it; the others keep their boundaries and hashes.
+    """
+    min_size = max(average_size // 4, CHUNK_WINDOW)
+    max_size = max(average_size * 4, min_size + 1)
+    # A mask of log2(average) bits cuts on average every average_size bytes. One
+    # more bit before normal_size and one less after keeps that mean while chunks
+    # cluster closer to it; normal_size is where the expected size is the average.
+    bits = min(max(average_size.bit_length() - 1, 2), 23)
+    masks = (chunk_boundary_mask(bits + 1), chunk_boundary_mask(bits - 1))
+    normal_size = min_size + int(2 * average_size * math.log(1.5 * average_size / (average_size + min_size)))
+
+    buffer = bytearray()
+    eof = False
+    while buffer or not eof:
+        while not eof and len(buffer) < max_size:
+            data = f.read(STREAM_CHUNK_SIZE)
+            eof = not data
+            buffer += data
+        if eof and len(buffer) <= min_size:
+            chunk_end = len(buffer)
+        else:
+            chunk_end = find_chunk_end(buffer, 0, min(max_size, len(buffer)), min_size, normal_size, masks)
+        yield bytes(buffer[:chunk_end])
+        # Deleting from the front of a bytearray doesn't move the rest
+        del buffer[:chunk_end]
+
+def hash_file_chunked(f, file_path, file_size):
+    """
+    Store a large file as content-defined chunks, each an ordinary blob written
+    (once) by the object writer, plus a manifest listing them. The blob's SHA is
+    still the hash of the whole content, so trees and commits are unaffected.
+    """
+    sha1 = hashlib.sha1(f"blob {file_size}\0".encode())
+    average_size = get_config_size("chunking.averageSize", CHUNK_AVERAGE_SIZE)
+    chunks = []
+    bytes_read = 0
+    for chunk in iter_content_chunks(f, average_size):
+        sha1.update(chunk)
+        bytes_read += len(chunk)
+        chunks.append((hash_object_tree(chunk, "blob"), len(chunk)))
+
+    if bytes_read != file_size:
+        raise RuntimeError(f"{file_path} changed size while it was being hashed")
+
+    blob_sha = sha1.hexdigest()
+    if not object_exists(blob_sha):
+        manifest = f"size {file_size}\n" + "".join(f"{sha} {size}\n" for sha, size in chunks)
+        out_file, tmp_path = open_object_temp_file()
+        try:
+            out_file.write(manifest.encode())
+            finish_object_temp_file(out_file, tmp_path, blob_sha, chunk_manifest_path(blob_sha))
+        except BaseException:
+            out_file.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return blob_sha
+
+def read_chunk_manifest(object_sha):
+    """
+    Return (size, [(chunk_sha, chunk_size), ...]) for a chunked blob, or None.
+    """
+    try:
+        with open(chunk_manifest_path(object_sha), "r") as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return None
+    chunks = []
+    for line in lines[1:]:
+        chunk_sha, size = line.split()
+        chunks.append((chunk_sha, int(size)))
+    return int(lines[0].split()[1]), chunks
+
+def iter_blob_data(blob_sha):
+    """
+    Yield a blob's content in pieces: chunk by chunk for a chunked blob, otherwise
+    in one piece, so large files can be written out without being joined in memory.
+    Chunks bypass the object cache.
+    """
+    manifest = read_chunk_manifest(blob_sha)
+    if manifest is None:
+        yield load_typed_object(blob_sha, Blob).data
+        return
+    for chunk_sha, _ in manifest[1]:
+        yield read_object(chunk_sha, cache=False)[1]
+
 def hash_object_tree(data, obj_type="blob"):
     """
     Hash the given data (file content or tree data) and store it as a Git object.
@@ -108,275 +920,2184 @@ def hash_object_tree(data, obj_type="blob"):
     # Compute SHA-1 hash
     sha1_hash = hashlib.sha1(content).hexdigest()
 
-    # Create the object file path
-    object_dir = f".git/objects/{sha1_hash[:2]}"
-    object_file = f"{object_dir}/{sha1_hash[2:]}"
-
-    # Ensure the directory exists
-    os.makedirs(object_dir, exist_ok=True)
-
-    # Write compressed data to the object file
-    if not os.path.exists(object_file):  # Avoid overwriting if object exists
-        with open(object_file, "wb") as f:
-            f.write(zlib.compress(content))
+    # Write compressed data unless the object is already stored
+    if not object_exists(sha1_hash):
+        level = choose_compression_level(obj_type, sample_content(data), len(data))
+        write_loose_object(sha1_hash, zlib.compress(content, level))
 
     return sha1_hash
 
 def get_object_content(object_sha):
-    # Construct the file path for the object
-    obj_dir = f".git/objects/{object_sha[:2]}"
-    obj_file = f"{obj_dir}/{object_sha[2:]}"
+    """
+    Return the decompressed object ("<type> <size>\\0<content>") for a SHA.
+    """
+    obj_type, content = read_object(object_sha)
+    return f"{obj_type} {len(content)}\0".encode() + content
 
-    if not os.path.exists(obj_file):
-        raise RuntimeError(f"Object {object_sha} not found")
+def read_object(object_sha, cache=True):
+    """
+    Return (type, content) for a SHA without the "<type> <size>\\0" header.
+    Objects come from the in-memory cache when possible, otherwise loose objects
+    are checked first, then every pack in .git/objects/pack. With cache=False the
+    object is not added to the cache, so streaming one large blob doesn't evict
+    everything else. Chunked blobs are never cached whole; iter_blob_data streams
+    them without joining the chunks.
+    """
+    cached = cache_get(object_sha)
+    if cached is not None:
+        return cached
+
+    decompressed_data = read_loose_object(object_sha)
+    if decompressed_data is not None:
+        header, content = decompressed_data.split(b"\0", 1)
+        obj = (header.split(b" ", 1)[0].decode(), content)
+        perf_count("objects_read")
+        perf_count("bytes_decompressed", len(decompressed_data))
+        if cache:
+            cache_put(object_sha, obj)
+        return obj
+
+    # A listing made by this very lookup is current, so it isn't repeated
+    listed_now = _pack_list is None
+    found = find_packed_object(object_sha)
+    if found is None:
+        # Large blobs may be stored as chunks
+        manifest = read_chunk_manifest(object_sha)
+        if manifest is not None:
+            obj = ("blob", b"".join(iter_blob_data(object_sha)))
+            perf_count("objects_read")
+            return obj
+        if not listed_now:
+            found = find_packed_object(object_sha, rescan=True)
+    if found is not None:
+        obj = read_pack_object(*found)
+        perf_count("objects_read")
+        if cache:
+            cache_put(object_sha, obj)
+        return obj
+
+    # A partial clone fetches the blobs its filter left out on first use
+    obj = fetch_promisor_object(object_sha)
+    if obj is not None:
+        if cache:
+            cache_put(object_sha, obj)
+        return obj
+
+    raise RuntimeError(f"Object {object_sha} not found")
+
+def read_loose_object(object_sha):
+    """
+    Read and decompress a loose object file. Returns None if it is not stored loose.
+    """
+    obj_file = f".git/objects/{object_sha[:2]}/{object_sha[2:]}"
 
-    # Read and decompress the object file
-    with open(obj_file, "rb") as f:
-        compressed_data = f.read()
+    try:
+        with open(obj_file, "rb") as f:
+            compressed_data = f.read()
+    except FileNotFoundError:
+        return None
 
-    decompressed_data = zlib.decompress(compressed_data)
-    return decompressed_data
+    return zlib.decompress(compressed_data)
 
-def parse_commit(commit_sha):
+def list_loose_objects():
     """
-    Parse a commit object to extract the tree SHA and return tree entries.
-    
-    Args:
-        commit_sha (str): The SHA of the commit object.
-    
-    Returns:
-        list: A list of tree entries (mode, name, sha) for the commit's tree object.
+    Yield the SHA of every loose object under .git/objects.
     """
-    # Get the raw content of the commit object
-    content = get_object_content(commit_sha)
-    
-    # Split header and data
-    header, commit_data = content.split(b'\0', 1)
-    object_type, size = header.split(b' ', 1)
-
-    if object_type == b"commit":
-        # Parse tree SHA for commit
-        tree_match = re.search(r'\b(tree [0-9a-f]{40})\b', commit_data.decode())
-        if tree_match:
-            tree_sha = tree_match.group(1).split()[1]
-        else:
-            raise RuntimeError(f"No tree SHA found in commit data for SHA {commit_sha}")
-        
-        # Return the entries from the tree object using parse_tree_object
-        return parse_tree_object(tree_sha)
-    
-    elif object_type == b"tree":
-        # If it's a tree, directly parse it using parse_tree_object
-        return parse_tree_object(commit_sha)
-    
-    else:
-        raise RuntimeError(f"Unexpected object type: {object_type.decode()}")
-
-def parse_tree_object(tree_sha):
-    # Get the raw content of the tree object
-    content = get_object_content(tree_sha)
-    
-    # Split header and data
-    header, tree_data = content.split(b'\0', 1)
-    object_type, size = header.split(b' ', 1)
+    object_dir = ".git/objects"
+    for dir_name in sorted(os.listdir(object_dir)):
+        if len(dir_name) != 2 or not os.path.isdir(os.path.join(object_dir, dir_name)):
+            continue
+        for file_name in sorted(os.listdir(os.path.join(object_dir, dir_name))):
+            if len(file_name) == 38:
+                yield dir_name + file_name
 
-    if object_type != b"tree":
-        raise RuntimeError(f"Unexpected object type: {object_type.decode()}")
+def read_loose_object_header(object_sha):
+    """
+    Return (type, size) of a loose object by decompressing only its header.
+    """
+    obj_file = f".git/objects/{object_sha[:2]}/{object_sha[2:]}"
+    decompressor = zlib.decompressobj()
+    header = b""
+    with open(obj_file, "rb") as f:
+        while b"\0" not in header:
+            chunk = f.read(4096)
+            if not chunk:
+                raise RuntimeError(f"Corrupt object {object_sha}")
+            header += decompressor.decompress(chunk, 64)
+    obj_type, size = header.split(b"\0", 1)[0].split(b" ", 1)
+    return obj_type.decode(), int(size)
+
+# Packs opened by this process, keyed by pack path
+_pack_cache = {}
+_pack_list = None
+
+def find_packed_object(object_sha, rescan=False):
+    """
+    Return (pack, offset) for a packed object, or None. The packs already known are
+    searched; with rescan the pack directory is listed again first, in case a
+    repack added a pack.
+    """
+    for pack in load_packs(rescan):
+        offset = find_pack_offset(pack, object_sha)
+        if offset is not None:
+            return pack, offset
+    return None
 
-    # Parse tree entries
-    entries = []
-    i = 0
-    while i < len(tree_data):
-        # Read mode (e.g., "100644" or "040000") and name
-        mode_end = tree_data.find(b' ', i)
-        mode = tree_data[i:mode_end].decode()
-        name_end = tree_data.find(b'\0', mode_end + 1)
-        name = tree_data[mode_end + 1:name_end].decode()
-        
-        # Read the raw SHA (20 bytes)
-        sha = tree_data[name_end + 1:name_end + 21]
-        sha_hex = sha.hex()
-        
-        entries.append((mode, name, sha_hex))
-        i = name_end + 21  # Move to the next entry
+def load_packs(rescan=False):
+    """
+    Return the packs in .git/objects/pack. The directory is listed once per process
+    (or again when rescan is set) and each pack is memory-mapped the first time it is seen.
+    """
+    global _pack_list
+    if _pack_list is not None and not rescan:
+        return _pack_list
+
+    pack_paths = []
+    if os.path.isdir(PACK_DIR):
+        pack_paths = sorted(
+            os.path.join(PACK_DIR, name) for name in os.listdir(PACK_DIR)
+            if name.endswith(".pack") and os.path.exists(os.path.join(PACK_DIR, name[:-5] + ".idx"))
+        )
+    for pack_path in pack_paths:
+        if pack_path not in _pack_cache:
+            _pack_cache[pack_path] = open_pack(pack_path)
+    for pack_path in list(_pack_cache):
+        if pack_path not in pack_paths:
+            close_pack(_pack_cache.pop(pack_path))
+
+    _pack_list = [_pack_cache[pack_path] for pack_path in pack_paths]
+    return _pack_list
+
+def open_pack(pack_path):
+    """
+    Memory-map a pack file and its .idx. Nothing is read up front, so a lookup only
+    touches the fan-out entry, the pages of the binary search and the object itself.
+    """
+    with open(pack_path[:-5] + ".idx", "rb") as f:
+        idx_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    with open(pack_path, "rb") as f:
+        pack_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
 
-    return entries
+    if idx_map[:4] != PACK_IDX_SIGNATURE or int.from_bytes(idx_map[4:8], "big") != PACK_IDX_VERSION:
+        raise RuntimeError(f"{pack_path[:-5]}.idx is not a version {PACK_IDX_VERSION} pack index")
+    if pack_map[:4] != PACK_SIGNATURE:
+        raise RuntimeError(f"{pack_path} is not a pack file")
 
-def ls_tree(tree_sha, name_only=False):
-    # Parse the tree object
-    entries = parse_tree_object(tree_sha)
-    if name_only:
-        # Print only names
-        for _, name, _ in sorted(entries, key=lambda x: x[1]):
-            print(name)
-    else:
-        # Print full details
-        for mode, name, sha in sorted(entries, key=lambda x: x[1]):
-            object_type = "tree" if mode == "40000" else "blob"
-            print(f"{mode} {object_type} {sha}    {name}")
+    count = int.from_bytes(idx_map[PACK_IDX_HEADER_SIZE - 4:PACK_IDX_HEADER_SIZE], "big")
+    return {"path": pack_path, "pack_map": pack_map, "idx_map": idx_map, "count": count}
 
+def close_pack(pack):
+    pack["pack_map"].close()
+    pack["idx_map"].close()
 
-def read_gitignore():
-    ignored_files = []
+def find_pack_offset(pack, object_sha):
+    """
+    Binary-search the pack index for an object, narrowed by the fan-out table.
+    Returns the object's offset in the pack, or None if the pack doesn't hold it.
+    """
+    idx_map = pack["idx_map"]
     try:
-        with open(".gitignore", "r") as f:
-            ignored_files = [line.strip() for line in f.readlines()]
-    except FileNotFoundError:
-        pass
-    return ignored_files
-
-def is_ignored(path, ignored_files):
+        target = bytes.fromhex(object_sha)
+    except ValueError:
+        return None
+    if len(target) != 20:
+        return None
+
+    position = find_in_sha_table(idx_map, 8, PACK_IDX_HEADER_SIZE, target)
+    if position is None:
+        return None
+    return read_pack_index_offset(pack, position)
+
+def find_in_sha_table(data, fanout_start, table_start, target):
     """
-    Determines if a file path matches any pattern in .gitignore.
+    Binary-search a sorted table of 20-byte SHAs, narrowed by a 256-entry fan-out
+    table where fanout[b] counts the SHAs whose first byte is <= b.
+    Returns the SHA's position in the table, or None.
     """
-    for pattern in ignored_files:
-        if pattern in path:
-            return True
-    return False
+    first = target[0]
+    fanout_pos = fanout_start + first * 4
+    lo = int.from_bytes(data[fanout_pos - 4:fanout_pos], "big") if first else 0
+    hi = int.from_bytes(data[fanout_pos:fanout_pos + 4], "big")
+
+    while lo < hi:
+        mid = (lo + hi) // 2
+        mid_sha = data[table_start + mid * 20:table_start + mid * 20 + 20]
+        if mid_sha < target:
+            lo = mid + 1
+        elif mid_sha > target:
+            hi = mid
+        else:
+            return mid
+    return None
 
-def update_index(file, sha, index_path=".git/index"):
+def read_pack_index_offset(pack, position):
     """
-    Updates the .git/index file to record a staged file.
+    Return the pack offset of the index entry at the given position, following the
+    64-bit offset table for packs larger than 2 GiB.
     """
-    with open(index_path, "a") as index_file:
-        timestamp = int(time.time())
-        index_entry = f"{sha} {file} {timestamp}\n"
-        index_file.write(index_entry)
-
-def stage(files):
+    idx_map = pack["idx_map"]
+    count = pack["count"]
+    offset_table = PACK_IDX_HEADER_SIZE + count * 24
+    pos = offset_table + position * 4
+    offset = int.from_bytes(idx_map[pos:pos + 4], "big")
+    if offset & 0x80000000:
+        large_pos = offset_table + count * 4 + (offset & 0x7fffffff) * 8
+        offset = int.from_bytes(idx_map[large_pos:large_pos + 8], "big")
+    return offset
+
+def iter_pack_entries(pack):
     """
-    Stages files by hashing their content, storing them in the .git/objects directory,
-    and updating the .git/index file.
+    Yield (sha, offset) for every object in a pack, in SHA order.
     """
-    staging_area = {}
-    ignored_files = read_gitignore()
-
-    for file in files:
-        if os.path.exists(file):
-            # Skip ignored files
-            if is_ignored(file, ignored_files):
-                print(f"Ignoring {file} (matched .gitignore)")
-                continue
+    idx_map = pack["idx_map"]
+    for position in range(pack["count"]):
+        sha_pos = PACK_IDX_HEADER_SIZE + position * 20
+        yield idx_map[sha_pos:sha_pos + 20].hex(), read_pack_index_offset(pack, position)
 
-            # Hash the file content
-            if os.path.isfile(file):
-                sha = hash_object(file)
-                staging_area[file] = sha
-                update_index(file, sha)
-                print(f"Staged: {file} -> {sha}")
-            else:
-                print(f"Skipping {file} (not a file)")
+def write_pack_index(idx_path, entries, pack_checksum):
+    """
+    Write a version 2 pack index. entries maps SHA -> (offset, crc32 of the packed entry).
+    """
+    shas = sorted(entries)
+    fanout = [0] * 256
+    for sha in shas:
+        fanout[int(sha[:2], 16)] += 1
+
+    idx = bytearray(PACK_IDX_SIGNATURE + PACK_IDX_VERSION.to_bytes(4, "big"))
+    total = 0
+    for count in fanout:
+        total += count
+        idx += total.to_bytes(4, "big")
+    for sha in shas:
+        idx += bytes.fromhex(sha)
+    for sha in shas:
+        idx += entries[sha][1].to_bytes(4, "big")
+
+    large_offsets = []
+    for sha in shas:
+        offset = entries[sha][0]
+        if offset < 0x80000000:
+            idx += offset.to_bytes(4, "big")
         else:
-            print(f"File {file} does not exist.")
+            idx += (0x80000000 | len(large_offsets)).to_bytes(4, "big")
+            large_offsets.append(offset)
+    for offset in large_offsets:
+        idx += offset.to_bytes(8, "big")
 
-    return staging_area
+    idx += pack_checksum
+    idx += hashlib.sha1(idx).digest()
+    with open(idx_path, "wb") as f:
+        f.write(idx)
 
-def write_tree(directory=".", staging_area=None):
+def parse_pack_entry_header(pack_map, offset):
     """
-    Recursively writes the directory's structure as a tree object.
-    Uses staged files and .gitignore rules.
+    Parse the header of the pack entry at offset.
+    Returns (type code, inflated size, position of the zlib data, delta base offset or None).
     """
-    entries = []
-    ignored_files = read_gitignore()
-
-    # If no staging area is provided, use an empty dictionary
-    if staging_area is None:
-        staging_area = {}
+    # Entry header: 3-bit type and a variable-length size
+    byte = pack_map[offset]
+    type_code = (byte >> 4) & 0x7
+    size = byte & 0x0f
+    shift = 4
+    pos = offset + 1
+    while byte & 0x80:
+        byte = pack_map[pos]
+        pos += 1
+        size |= (byte & 0x7f) << shift
+        shift += 7
+
+    base_offset = None
+    if type_code == PACK_OFS_DELTA:
+        # Base offset is a big-endian varint with an implicit +1 per continuation byte
+        byte = pack_map[pos]
+        pos += 1
+        distance = byte & 0x7f
+        while byte & 0x80:
+            byte = pack_map[pos]
+            pos += 1
+            distance = ((distance + 1) << 7) | (byte & 0x7f)
+        base_offset = offset - distance
+
+    return type_code, size, pos, base_offset
+
+def read_pack_object_header(pack, offset):
+    """
+    Return (type, size) of a packed object without inflating it. For deltas the
+    type comes from the base entry and the size from the first bytes of the delta.
+    """
+    pack_map = pack["pack_map"]
+    type_code, size, pos, base_offset = parse_pack_entry_header(pack_map, offset)
+    if base_offset is None:
+        return PACK_TYPE_NAMES[type_code], size
+
+    # The delta starts with the source and target sizes; inflating 32 bytes covers both
+    decompressor = zlib.decompressobj()
+    delta_start = decompressor.decompress(pack_map[pos:pos + 64], 32)
+    _, delta_pos = decode_delta_size(delta_start, 0)
+    target_size, _ = decode_delta_size(delta_start, delta_pos)
+
+    while base_offset is not None:
+        type_code, _, _, base_offset = parse_pack_entry_header(pack_map, base_offset)
+    return PACK_TYPE_NAMES[type_code], target_size
+
+def read_object_header(object_sha, fetch=True):
+    """
+    Return (type, size) for a SHA, inflating no more of the object than needed.
+    With fetch=False an object left out of a partial clone is reported as not
+    found instead of being downloaded from the promisor remote.
+    """
+    cached = cache_get(object_sha)
+    if cached is not None:
+        return cached[0], len(cached[1])
+
+    if os.path.exists(f".git/objects/{object_sha[:2]}/{object_sha[2:]}"):
+        return read_loose_object_header(object_sha)
+
+    # A listing made by this very lookup is current, so it isn't repeated
+    listed_now = _pack_list is None
+    found = find_packed_object(object_sha)
+    if found is None:
+        manifest = read_chunk_manifest(object_sha)
+        if manifest is not None:
+            return "blob", manifest[0]
+        if not listed_now:
+            found = find_packed_object(object_sha, rescan=True)
+    if found is not None:
+        return read_pack_object_header(*found)
+
+    obj = fetch_promisor_object(object_sha) if fetch else None
+    if obj is not None:
+        return obj[0], len(obj[1])
+
+    raise RuntimeError(f"Object {object_sha} not found")
+
+def cat_file_batch(with_content, input_stream=None, output_stream=None):
+    """
+    Serve object lookups from a stream of SHAs, one per line. For each SHA write
+    "<sha> <type> <size>" and, in full batch mode, the raw content and a newline.
+    Unknown SHAs produce "<sha> missing", and so do objects a partial clone left
+    out in --batch-check mode, which never fetches. Output is flushed per object so
+    callers can interleave requests and responses over a pipe. A reader that closes
+    the pipe early ends the batch quietly.
+    """
+    input_stream = input_stream or sys.stdin.buffer
+    output_stream = output_stream or sys.stdout.buffer
 
-    for entry in sorted(os.listdir(directory)):
-        # Skip ignored files and .git directory
-        if entry == ".git" or is_ignored(entry, ignored_files):
+    try:
+        write_batch_objects(with_content, input_stream, output_stream)
+    except BrokenPipeError:
+        if output_stream is sys.stdout.buffer:
+            # Point stdout at /dev/null so the flush at exit doesn't fail again
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+            os.close(devnull)
+
+def write_batch_objects(with_content, input_stream, output_stream):
+    """
+    Answer each SHA read from input_stream on output_stream for cat_file_batch.
+    """
+    for line in input_stream:
+        object_sha = line.strip().decode(errors="replace")
+        if not object_sha:
             continue
-
-        entry_path = os.path.join(directory, entry)
-        if os.path.isfile(entry_path):
-            # Use staged content if available
-            if entry_path in staging_area:
-                blob_sha = staging_area[entry_path]
+        try:
+            manifest = read_chunk_manifest(object_sha) if with_content else None
+            if manifest is not None:
+                # Chunked blobs are streamed below instead of being joined
+                obj_type, content, size = "blob", None, manifest[0]
+            elif with_content:
+                obj_type, content = read_object(object_sha)
+                size = len(content)
             else:
-                # Hash and stage the file content
-                with open(entry_path, "rb") as f:
-                    blob_data = f.read()
-                blob_sha = hash_object_tree(blob_data, obj_type="blob")
-                staging_area[entry_path] = blob_sha  # Stage the file
-
-            mode = "100644"  # Regular file mode
-            entries.append((mode, entry, blob_sha))
-        elif os.path.isdir(entry_path):
-            # Recursively write the directory as a tree object
-            tree_sha = write_tree(entry_path, staging_area)
-            mode = "40000"  # Directory mode
-            entries.append((mode, entry, tree_sha))
-
-    # Construct the tree data
-    tree_data = b""
-    for mode, name, sha in entries:
-        tree_data += f"{mode} {name}\0".encode() + bytes.fromhex(sha)
+                obj_type, size = read_object_header(object_sha, fetch=False)
+        except (RuntimeError, ValueError, zlib.error):
+            output_stream.write(f"{object_sha} missing\n".encode())
+            output_stream.flush()
+            continue
 
-    # Create and return the SHA of the tree object
-    return hash_object_tree(tree_data, obj_type="tree")
+        output_stream.write(f"{object_sha} {obj_type} {size}\n".encode())
+        if with_content:
+            for data in ([content] if content is not None else iter_blob_data(object_sha)):
+                output_stream.write(data)
+            output_stream.write(b"\n")
+        output_stream.flush()
 
-def create_commit_object(tree_sha, parent_sha, message, branch_name="main"):
+def read_pack_object(pack, offset, depth=0):
     """
-    Create a commit object and update the branch reference.
+    Read the object stored at the given offset of a pack, resolving delta chains.
+    The entry is inflated straight from the memory-mapped pack. Returns (type, content).
     """
-    author = "John Doe <johndoe@example.com>"
-    timestamp = int(time.time())
-    timezone_offset = time.strftime('%z')
+    if depth > DELTA_MAX_DEPTH:
+        raise RuntimeError(f"Delta chain too deep in {pack['path']}")
+
+    pack_map = pack["pack_map"]
+    type_code, size, pos, base_offset = parse_pack_entry_header(pack_map, offset)
+
+    # Inflate the entry data from the mapping; the header tells us the inflated size
+    view = memoryview(pack_map)
+    decompressor = zlib.decompressobj()
+    chunks = []
+    while not decompressor.eof:
+        chunk = view[pos:pos + 65536]
+        if not chunk:
+            raise RuntimeError(f"Truncated object at offset {offset} in {pack['path']}")
+        chunks.append(decompressor.decompress(chunk))
+        pos += len(chunk)
+    view.release()
+    data = b"".join(chunks)
+    perf_count("bytes_decompressed", len(data))
+    if len(data) != size:
+        raise RuntimeError(f"Corrupt object at offset {offset} in {pack['path']}")
+
+    if base_offset is None:
+        return PACK_TYPE_NAMES[type_code], data
+
+    # Delta bases are shared by many objects, so keep resolved bases in the cache
+    base_key = (pack["path"], base_offset)
+    base = cache_get(base_key)
+    if base is None:
+        base = read_pack_object(pack, base_offset, depth + 1)
+        cache_put(base_key, base)
+    base_type, base_data = base
+    return base_type, apply_delta(base_data, data)
+
+def encode_delta_size(size):
+    """
+    Encode a size as the little-endian base-128 varint used in delta headers.
+    """
+    out = bytearray()
+    while True:
+        byte = size & 0x7f
+        size >>= 7
+        if size:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def decode_delta_size(delta, pos):
+    size = 0
+    shift = 0
+    while True:
+        byte = delta[pos]
+        pos += 1
+        size |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return size, pos
+
+def create_delta(source, target):
+    """
+    Build a Git-style delta that turns source into target using copy and insert
+    instructions. Returns None when the delta would not be smaller than half the target.
+    """
+    max_size = len(target) // 2
+    block = DELTA_BLOCK_SIZE
 
-    # Format the commit content
-    content = f"tree {tree_sha}\n"
-    if parent_sha and parent_sha != "0" * 40:  # Validate parent SHA
-        content += f"parent {parent_sha}\n"
-    content += (
-        f"author {author} {timestamp} {timezone_offset}\n"
-        f"committer {author} {timestamp} {timezone_offset}\n\n"
-        f"{message}\n"  # Commit message
-    )
+    # Index the source by aligned blocks so matches can be found with one lookup
+    source_index = {}
+    for i in range(0, len(source) - block + 1, block):
+        source_index.setdefault(source[i:i + block], i)
 
-    try:
-        content_bytes = content.encode('utf-8')
-    except UnicodeEncodeError as e:
-        print(f"Encoding error: {e}")
-        print("Problematic content:", content)
-        raise
-    
-    # Compute the SHA-1 hash of the commit object
-    header = f"commit {len(content_bytes)}\0".encode('utf-8')
-    commit_data = header + content_bytes
-    sha1_hash = hashlib.sha1(commit_data).hexdigest()
+    delta = bytearray(encode_delta_size(len(source)) + encode_delta_size(len(target)))
+    insert_start = 0
+    i = 0
+    target_len = len(target)
+
+    def flush_insert(end):
+        for start in range(insert_start, end, 127):
+            chunk = target[start:min(start + 127, end)]
+            delta.append(len(chunk))
+            delta.extend(chunk)
+
+    while i + block <= target_len:
+        src_pos = source_index.get(target[i:i + block])
+        if src_pos is None:
+            i += 1
+            continue
 
-    # Save the commit object
-    object_dir = f".git/objects/{sha1_hash[:2]}"
-    object_file = f"{object_dir}/{sha1_hash[2:]}"
-    os.makedirs(object_dir, exist_ok=True)
-    if not os.path.exists(object_file):
-        with open(object_file, "wb") as f:
-            f.write(zlib.compress(commit_data))
+        # Extend the match forwards, then backwards into the pending insert
+        length = block
+        while (src_pos + length < len(source) and i + length < target_len
+               and source[src_pos + length] == target[i + length]):
+            length += 1
+        while i > insert_start and src_pos > 0 and source[src_pos - 1] == target[i - 1]:
+            i -= 1
+            src_pos -= 1
+            length += 1
+
+        flush_insert(i)
+        while length:
+            copy_len = min(length, 0xffffff)
+            delta.extend(encode_copy(src_pos, copy_len))
+            src_pos += copy_len
+            i += copy_len
+            length -= copy_len
+        insert_start = i
+
+        if len(delta) > max_size:
+            return None
+
+    flush_insert(target_len)
+    if len(delta) > max_size:
+        return None
+    return bytes(delta)
+
+def encode_copy(offset, size):
+    """
+    Encode a copy instruction: a flag byte followed by the non-zero offset and size bytes.
+    """
+    flags = 0x80
+    args = bytearray()
+    for i in range(4):
+        byte = (offset >> (8 * i)) & 0xff
+        if byte:
+            flags |= 1 << i
+            args.append(byte)
+    for i in range(3):
+        byte = (size >> (8 * i)) & 0xff
+        if byte:
+            flags |= 1 << (4 + i)
+            args.append(byte)
+    return bytes([flags]) + bytes(args)
+
+def apply_delta(base, delta):
+    """
+    Reconstruct an object from its delta base and delta instructions.
+    """
+    source_size, pos = decode_delta_size(delta, 0)
+    target_size, pos = decode_delta_size(delta, pos)
+    if source_size != len(base):
+        raise RuntimeError("Delta base size mismatch")
+
+    out = bytearray()
+    while pos < len(delta):
+        opcode = delta[pos]
+        pos += 1
+        if opcode & 0x80:
+            offset = 0
+            size = 0
+            for i in range(4):
+                if opcode & (1 << i):
+                    offset |= delta[pos] << (8 * i)
+                    pos += 1
+            for i in range(3):
+                if opcode & (1 << (4 + i)):
+                    size |= delta[pos] << (8 * i)
+                    pos += 1
+            if size == 0:
+                size = 0x10000
+            out += base[offset:offset + size]
+        elif opcode:
+            out += delta[pos:pos + opcode]
+            pos += opcode
+        else:
+            raise RuntimeError("Invalid delta opcode 0")
 
-    # Update the branch reference
-    branch_file = f".git/refs/heads/{branch_name}"
-    with open(branch_file, "w") as f:
-        f.write(sha1_hash)
-    
-    return sha1_hash
+    if len(out) != target_size:
+        raise RuntimeError("Delta result size mismatch")
+    return bytes(out)
 
-def get_commit_sha(branch_name):
+def encode_pack_entry_header(type_code, size):
     """
-    Retrieve the latest commit SHA from a branch.
+    Encode the type and size header that starts every pack entry.
     """
-    try:
-        with open(f".git/refs/heads/{branch_name}", "r") as f:
-            return f.read().strip()
-    except FileNotFoundError:
-        raise RuntimeError(f"Branch '{branch_name}' does not exist.")
-
-def get_parent_sha_from_head():
+    byte = (type_code << 4) | (size & 0x0f)
+    size >>= 4
+    out = bytearray()
+    while size:
+        out.append(byte | 0x80)
+        byte = size & 0x7f
+        size >>= 7
+    out.append(byte)
+    return bytes(out)
+
+def encode_ofs_delta_offset(distance):
     """
-    Retrieves the parent commit SHA by reading from HEAD.
-    It extracts the SHA of the current commit, then fetches its parent SHA.
+    Encode the distance back to a delta base for an OFS_DELTA entry.
     """
-    head_path = ".git/HEAD"
+    out = bytearray([distance & 0x7f])
+    distance >>= 7
+    while distance:
+        distance -= 1
+        out.insert(0, 0x80 | (distance & 0x7f))
+        distance >>= 7
+    return bytes(out)
+
+def collect_name_hints():
+    """
+    Map blob and tree SHAs to the file name they appear under in branch history.
+    Objects with the same name are good delta candidates for each other.
+    """
+    hints = {}
+    pending = list_branch_heads()
+
+    seen = set()
+    while pending:
+        commit_sha = pending.pop()
+        if commit_sha in seen or commit_sha == "0" * 40:
+            continue
+        seen.add(commit_sha)
+        try:
+            commit = load_typed_object(commit_sha, Commit)
+        except RuntimeError:
+            continue
+        pending.extend(commit.parents)
+        trees = [(commit.tree, "")]
+
+        while trees:
+            tree_sha, tree_name = trees.pop()
+            if tree_sha in seen:
+                continue
+            seen.add(tree_sha)
+            hints.setdefault(tree_sha, tree_name)
+            try:
+                entries = parse_tree_object(tree_sha)
+            except RuntimeError:
+                continue
+            for mode, name, sha in entries:
+                if mode.startswith("4"):
+                    trees.append((sha, name))
+                else:
+                    hints.setdefault(sha, name)
+
+    return hints
+
+@trace_phase("repack")
+def repack():
+    """
+    Gather every loose and packed object into a single new pack, storing similar
+    objects as deltas against each other, then remove the objects it replaces.
+    """
+    name_hints = collect_name_hints()
+
+    # Collect (sha, type, size) for every object without loading the content
+    objects = {}
+    for sha in list_loose_objects():
+        objects[sha] = read_loose_object_header(sha)
+    old_packs = load_packs()
+    for pack in old_packs:
+        for sha, offset in iter_pack_entries(pack):
+            if sha not in objects:
+                # Sizes come from the entry (or delta) header; nothing is inflated here
+                objects[sha] = read_pack_object_header(pack, offset)
+
+    if not objects:
+        print("Nothing to pack")
+        return None
+
+    # Order by type, then name (reversed so extensions group together), then size
+    # descending, so a window of neighbours holds the most likely delta bases
+    order = sorted(
+        objects,
+        key=lambda sha: (
+            PACK_TYPE_CODES[objects[sha][0]],
+            name_hints.get(sha, "")[::-1],
+            -objects[sha][1],
+            sha,
+        ),
+    )
+
+    os.makedirs(PACK_DIR, exist_ok=True)
+    tmp_path = os.path.join(PACK_DIR, f"tmp_pack_{os.getpid()}")
+    pack_hash = hashlib.sha1()
+    offsets = {}
+    crcs = {}
+    window = []  # (sha, type, content, offset, depth)
+    delta_count = 0
+
+    with open(tmp_path, "wb") as out:
+        def write(data):
+            pack_hash.update(data)
+            out.write(data)
+
+        write(PACK_SIGNATURE + PACK_VERSION.to_bytes(4, "big") + len(order).to_bytes(4, "big"))
+        position = 12
+
+        for sha in order:
+            obj_type, size = objects[sha]
+            content = read_object(sha)[1]
+
+            # Try the previous objects of the same type as delta bases
+            best = None
+            if size <= DELTA_MAX_OBJECT_SIZE:
+                for base_sha, base_type, base_content, base_offset, base_depth in window:
+                    if base_type != obj_type or base_depth >= DELTA_MAX_DEPTH:
+                        continue
+                    delta = create_delta(base_content, content)
+                    if delta is not None and (best is None or len(delta) < len(best[0])):
+                        best = (delta, base_offset, base_depth)
+
+            offsets[sha] = position
+            if best is not None:
+                delta, base_offset, base_depth = best
+                entry = (encode_pack_entry_header(PACK_OFS_DELTA, len(delta))
+                         + encode_ofs_delta_offset(position - base_offset)
+                         + zlib.compress(delta))
+                depth = base_depth + 1
+                delta_count += 1
+            else:
+                level = choose_compression_level(obj_type, sample_content(content), size)
+                entry = encode_pack_entry_header(PACK_TYPE_CODES[obj_type], size) + zlib.compress(content, level)
+                depth = 0
+            write(entry)
+            crcs[sha] = zlib.crc32(entry)
+            position += len(entry)
+
+            if size <= DELTA_MAX_OBJECT_SIZE:
+                window.append((sha, obj_type, content, offsets[sha], depth))
+                if len(window) > DELTA_WINDOW:
+                    window.pop(0)
+
+        checksum = pack_hash.digest()
+        out.write(checksum)
+
+    # Name the pack after its checksum and write the sorted index next to it
+    pack_name = f"pack-{checksum.hex()}"
+    pack_path = os.path.join(PACK_DIR, pack_name + ".pack")
+    os.replace(tmp_path, pack_path)
+    write_pack_index(
+        os.path.join(PACK_DIR, pack_name + ".idx"),
+        {sha: (offsets[sha], crcs[sha]) for sha in offsets},
+        checksum,
+    )
+
+    # Drop the old packs and the loose objects that are now packed
+    for pack in old_packs:
+        if pack["path"] == pack_path:
+            continue
+        close_pack(_pack_cache.pop(pack["path"]))
+        os.remove(pack["path"])
+        os.remove(pack["path"][:-5] + ".idx")
+    load_packs(rescan=True)
+    for sha in list_loose_objects():
+        if sha in offsets:
+            os.remove(f".git/objects/{sha[:2]}/{sha[2:]}")
+    for dir_name in os.listdir(".git/objects"):
+        dir_path = os.path.join(".git/objects", dir_name)
+        if len(dir_name) == 2 and os.path.isdir(dir_path) and not os.listdir(dir_path):
+            os.rmdir(dir_path)
+
+    print(f"Packed {len(order)} objects ({delta_count} deltas) into {pack_name}.pack")
+    return pack_path
+
+class Blob:
+    """
+    File content. The data is kept as raw bytes and never decoded.
+    """
+    __slots__ = ("sha", "data")
+    type_name = "blob"
+
+    def __init__(self, data, sha=None):
+        self.data = data
+        self.sha = sha
+
+    def serialize(self):
+        return self.data
+
+class TreeEntry:
+    """
+    One tree entry. Mode, name and SHA are kept as the raw bytes from the tree
+    object and only decoded (or hex-encoded) when accessed.
+    """
+    __slots__ = ("raw_mode", "raw_name", "raw_sha")
+
+    def __init__(self, raw_mode, raw_name, raw_sha):
+        self.raw_mode = raw_mode
+        self.raw_name = raw_name
+        self.raw_sha = raw_sha
+
+    @classmethod
+    def create(cls, mode, name, sha):
+        return cls(mode.encode(), name.encode(errors="surrogateescape"), bytes.fromhex(sha))
+
+    @property
+    def mode(self):
+        return self.raw_mode.decode()
+
+    @property
+    def name(self):
+        return self.raw_name.decode(errors="surrogateescape")
+
+    @property
+    def sha(self):
+        return self.raw_sha.hex()
+
+    @property
+    def is_tree(self):
+        return self.raw_mode.startswith(b"4")
+
+    def __iter__(self):
+        # Unpacks as (mode, name, sha), the tuple layout used throughout
+        return iter((self.mode, self.name, self.sha))
+
+class Tree:
+    """
+    A directory listing. Entries are parsed from the raw object bytes the first
+    time they are accessed.
+    """
+    __slots__ = ("sha", "_raw", "_entries")
+    type_name = "tree"
+
+    def __init__(self, entries=None, raw=None, sha=None):
+        self.sha = sha
+        self._raw = raw
+        self._entries = entries
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            raw = self._raw
+            entries = []
+            i = 0
+            while i < len(raw):
+                # <mode> <name>\0<20-byte SHA>
+                mode_end = raw.index(b" ", i)
+                name_end = raw.index(b"\0", mode_end + 1)
+                entries.append(TreeEntry(raw[i:mode_end], raw[mode_end + 1:name_end],
+                                         raw[name_end + 1:name_end + 21]))
+                i = name_end + 21
+            self._entries = entries
+        return self._entries
+
+    def serialize(self):
+        """
+        Serialize the entries into a single buffer sized up front, so building a
+        large tree is linear instead of repeated concatenation.
+        """
+        if self._raw is not None:
+            return self._raw
+        entries = self._entries
+        buffer = bytearray(sum(len(e.raw_mode) + len(e.raw_name) + 22 for e in entries))
+        pos = 0
+        for entry in entries:
+            for part in (entry.raw_mode, b" ", entry.raw_name, b"\0", entry.raw_sha):
+                buffer[pos:pos + len(part)] = part
+                pos += len(part)
+        self._raw = bytes(buffer)
+        return self._raw
+
+class Commit:
+    """
+    A commit. Header lines are split on first access and individual fields are
+    decoded only when read; commits are always UTF-8, so no charset detection is needed.
+    """
+    __slots__ = ("sha", "_raw", "_headers", "_message_start")
+    type_name = "commit"
+
+    def __init__(self, raw, sha=None):
+        self.sha = sha
+        self._raw = raw
+        self._headers = None
+        self._message_start = None
+
+    @classmethod
+    def create(cls, tree_sha, parents, author, committer, message):
+        """
+        Build a new commit from its fields.
+        """
+        lines = [b"tree " + tree_sha.encode()]
+        lines.extend(b"parent " + parent.encode() for parent in parents)
+        lines.append(b"author " + author.encode())
+        lines.append(b"committer " + committer.encode())
+        return cls(b"\n".join(lines) + b"\n\n" + message.encode() + b"\n")
+
+    def _parse(self):
+        if self._headers is None:
+            raw = self._raw
+            header_end = raw.find(b"\n\n")
+            if header_end < 0:
+                header_end = len(raw)
+            headers = []
+            for line in raw[:header_end].split(b"\n"):
+                if line.startswith(b" ") and headers:
+                    # Continuation of a multi-line header (e.g. a signature)
+                    key, value = headers[-1]
+                    headers[-1] = (key, value + b"\n" + line[1:])
+                else:
+                    key, _, value = line.partition(b" ")
+                    headers.append((key, value))
+            self._headers = headers
+            self._message_start = min(header_end + 2, len(raw))
+        return self._headers
+
+    def _header(self, key):
+        for header_key, value in self._parse():
+            if header_key == key:
+                return value
+        return None
+
+    @property
+    def tree(self):
+        value = self._header(b"tree")
+        if value is None:
+            raise RuntimeError(f"Invalid commit format for SHA {self.sha}. No 'tree' entry found.")
+        return value.decode()
+
+    @property
+    def parents(self):
+        return [value.decode() for key, value in self._parse() if key == b"parent"]
+
+    @property
+    def author(self):
+        value = self._header(b"author")
+        return value.decode(errors="replace") if value is not None else None
+
+    @property
+    def committer(self):
+        value = self._header(b"committer")
+        return value.decode(errors="replace") if value is not None else None
+
+    @property
+    def commit_time(self):
+        value = self._header(b"committer")
+        return int(value.rsplit(b" ", 2)[1]) if value is not None else 0
+
+    @property
+    def message(self):
+        self._parse()
+        return self._raw[self._message_start:].decode(errors="replace")
+
+    def serialize(self):
+        return self._raw
+
+OBJECT_CLASSES = {"blob": Blob, "tree": Tree, "commit": Commit}
+
+def load_object(object_sha):
+    """
+    Read an object and wrap it in its Blob, Tree or Commit class without parsing it.
+    """
+    # The repository daemon keeps parsed trees and commits between requests
+    if _daemon is not None:
+        with _daemon["lock"]:
+            obj = _daemon["objects"].get(object_sha)
+            if obj is not None:
+                _daemon["objects"].move_to_end(object_sha)
+                return obj
+
+    object_type, content = read_object(object_sha)
+    if object_type == "blob":
+        return Blob(content, sha=object_sha)
+    if object_type == "tree":
+        obj = Tree(raw=content, sha=object_sha)
+    elif object_type == "commit":
+        obj = Commit(content, sha=object_sha)
+    else:
+        raise RuntimeError(f"Unsupported object type: {object_type}")
+
+    if _daemon is not None:
+        with _daemon["lock"]:
+            _daemon["objects"][object_sha] = obj
+            if len(_daemon["objects"]) > DAEMON_PARSED_OBJECTS:
+                _daemon["objects"].popitem(last=False)
+    return obj
+
+def load_typed_object(object_sha, object_class):
+    obj = load_object(object_sha)
+    if not isinstance(obj, object_class):
+        raise RuntimeError(f"Unexpected object type: {obj.type_name}")
+    return obj
+
+def store_object(obj):
+    """
+    Write a Blob, Tree or Commit to the object store and record its SHA on it.
+    """
+    obj.sha = hash_object_tree(obj.serialize(), obj.type_name)
+    return obj.sha
+
+def parse_commit(commit_sha):
+    """
+    Parse a commit object to extract the tree SHA and return tree entries.
+    
+    Args:
+        commit_sha (str): The SHA of the commit object.
+    
+    Returns:
+        list: A list of tree entries (mode, name, sha) for the commit's tree object.
+    """
+    obj = load_object(commit_sha)
+
+    if isinstance(obj, Commit):
+        # Return the entries from the commit's tree
+        return parse_tree_object(obj.tree)
+    elif isinstance(obj, Tree):
+        # If it's a tree, directly parse it
+        return [tuple(entry) for entry in obj.entries]
+    else:
+        raise RuntimeError(f"Unexpected object type: {obj.type_name}")
+
+def parse_tree_object(tree_sha):
+    """
+    Return the entries of a tree object as (mode, name, sha) tuples.
+    """
+    return [tuple(entry) for entry in load_typed_object(tree_sha, Tree).entries]
+
+def ls_tree(tree_sha, name_only=False):
+    # Parse the tree object
+    entries = parse_tree_object(tree_sha)
+    if name_only:
+        # Print only names
+        for _, name, _ in sorted(entries, key=lambda x: x[1]):
+            print(name)
+    else:
+        # Print full details
+        for mode, name, sha in sorted(entries, key=lambda x: x[1]):
+            object_type = "tree" if mode == "40000" else "blob"
+            print(f"{mode} {object_type} {sha}    {name}")
+
+
+# Compiled .gitignore rules for this command, keyed by the directory holding the file
+_ignore_matcher = None
+
+def read_gitignore():
+    """
+    Return the ignore matcher for this command. Each .gitignore (the root one and
+    any nested ones) is read and compiled at most once, the first time a path under
+    its directory is checked.
+    """
+    global _ignore_matcher
+    if _ignore_matcher is None:
+        _ignore_matcher = {}
+    return _ignore_matcher
+
+def translate_ignore_glob(glob):
+    """
+    Translate a .gitignore glob to a regex: * and ? stop at slashes, ** crosses
+    directories, and [...] is a character class.
+    """
+    regex = ""
+    i = 0
+    while i < len(glob):
+        if glob.startswith("**/", i) and (i == 0 or glob[i - 1] == "/"):
+            regex += "(?:.*/)?"
+            i += 3
+        elif glob.startswith("/**", i) and i + 3 == len(glob):
+            regex += "/.*"
+            i += 3
+        elif glob[i] == "*":
+            regex += ".*" if glob.startswith("**", i) else "[^/]*"
+            i += 2 if glob.startswith("**", i) else 1
+        elif glob[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif glob[i] == "[" and "]" in glob[i + 2:]:
+            end = glob.index("]", i + 2)
+            body = glob[i + 1:end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            regex += "[" + body.replace("\\", "\\\\") + "]"
+            i = end + 1
+        elif glob[i] == "\\" and i + 1 < len(glob):
+            regex += re.escape(glob[i + 1])
+            i += 2
+        else:
+            regex += re.escape(glob[i])
+            i += 1
+    return regex
+
+def compile_ignore_patterns(lines, base):
+    """
+    Compile the lines of a .gitignore found in directory base. Consecutive rules with
+    the same polarity are joined into one regex, and the groups are returned
+    last-first so the first group that matches decides (the last matching pattern
+    wins, as in Git). Each group is (negate, regex for directories, regex for files).
+    """
+    prefix = re.escape(base + "/") if base else ""
+    rules = []
+    for line in lines:
+        line = line.rstrip("\n")
+        if not line.strip() or line.startswith("#"):
+            continue
+        # Trailing spaces are ignored unless escaped
+        while line.endswith(" ") and not line.endswith("\\ "):
+            line = line[:-1]
+
+        negate = line.startswith("!")
+        if negate or line.startswith("\\!") or line.startswith("\\#"):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+
+        # A slash anywhere but the end anchors the pattern to this directory
+        if "/" in line:
+            regex = prefix + translate_ignore_glob(line.lstrip("/"))
+        else:
+            regex = prefix + "(?:.*/)?" + translate_ignore_glob(line)
+        rules.append((negate, dir_only, regex))
+
+    groups = []
+    for negate, dir_only, regex in rules:
+        if groups and groups[-1][0] == negate:
+            groups[-1][1].append(regex)
+            if not dir_only:
+                groups[-1][2].append(regex)
+        else:
+            groups.append((negate, [regex], [] if dir_only else [regex]))
+
+    return [
+        (negate,
+         re.compile("|".join(f"(?:{regex})" for regex in dir_regexes)),
+         re.compile("|".join(f"(?:{regex})" for regex in file_regexes)) if file_regexes else None)
+        for negate, dir_regexes, file_regexes in reversed(groups)
+    ]
+
+def load_ignore_groups(ignored_files, directory):
+    """
+    Return the compiled rules of the .gitignore in directory ("" for the root).
+    """
+    groups = ignored_files.get(directory)
+    if groups is None:
+        try:
+            with open(os.path.join(directory, ".gitignore"), "r") as f:
+                lines = f.readlines()
+        except (FileNotFoundError, NotADirectoryError):
+            lines = []
+        groups = compile_ignore_patterns(lines, directory)
+        ignored_files[directory] = groups
+    return groups
+
+def is_ignored(path, ignored_files, is_dir=False, check_parents=True):
+    """
+    Determines if a file path matches the .gitignore rules. Rules in deeper
+    .gitignore files take precedence over the ones above them. A path inside an
+    ignored directory is ignored too; walks that prune ignored directories pass
+    check_parents=False to skip re-checking them.
+    """
+    path = os.path.normpath(path).replace(os.sep, "/")
+    parts = path.split("/")
+    if ".git" in parts:
+        return True
+
+    if check_parents:
+        for depth in range(1, len(parts)):
+            if is_ignored("/".join(parts[:depth]), ignored_files, is_dir=True, check_parents=False):
+                return True
+
+    for depth in range(len(parts) - 1, -1, -1):
+        for negate, dir_regex, file_regex in load_ignore_groups(ignored_files, "/".join(parts[:depth])):
+            regex = dir_regex if is_dir else file_regex
+            if regex is not None and regex.fullmatch(path):
+                return not negate
+    return False
+
+def index_path_for(path):
+    """
+    Normalise a working-tree path to the slash-separated form stored in the index.
+    """
+    return os.path.relpath(path).replace(os.sep, "/")
+
+def index_mode_for(st):
+    """
+    Reduce a stat mode to the file modes Git records: symlink, executable or regular.
+    """
+    if stat.S_ISLNK(st.st_mode):
+        return 0o120000
+    if st.st_mode & 0o111:
+        return 0o100755
+    return 0o100644
+
+def is_worktree_file(st):
+    """
+    Return True for the working-tree entries Git stores as blobs: regular files and
+    symlinks, whose blob is the link target.
+    """
+    return stat.S_ISREG(st.st_mode) or stat.S_ISLNK(st.st_mode)
+
+def hash_worktree_file(path, st):
+    """
+    Store a working-tree file (or the target of a symlink) as a blob and return its SHA.
+    """
+    if stat.S_ISLNK(st.st_mode):
+        return store_object(Blob(os.fsencode(os.readlink(path))))
+    return hash_file_streaming(path)
+
+@trace_phase("read_index")
+def read_index(index_path=INDEX_PATH):
+    """
+    Load the binary index with a single read. Returns {"entries": path -> entry,
+    "mtime_ns": mtime of the index file (for racy-entry checks), "changed": False,
+    "updated": paths whose entries this command rewrote, "trees": the cache-tree}.
+    """
+    try:
+        with open(index_path, "rb") as f:
+            data = f.read()
+            index_mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+    except FileNotFoundError:
+        return {"entries": {}, "mtime_ns": 0, "changed": False, "updated": set(), "trees": {}}
+
+    # Older repositories used an append-only text index with no stat data; start over
+    if data[:4] != INDEX_SIGNATURE:
+        return {"entries": {}, "mtime_ns": 0, "changed": True, "updated": set(), "trees": {}}
+
+    if hashlib.sha1(data[:-20]).digest() != data[-20:]:
+        raise RuntimeError("Index checksum mismatch: .git/index is corrupt")
+    version, count = struct.unpack_from(">II", data, 4)
+    if version != INDEX_VERSION:
+        raise RuntimeError(f"Unsupported index version {version}")
+
+    entries = {}
+    pos = 12
+    for _ in range(count):
+        (ctime_s, ctime_ns, mtime_s, mtime_ns, dev, ino, mode, uid, gid, size,
+         sha, flags) = INDEX_ENTRY_FORMAT.unpack_from(data, pos)
+        name_start = pos + INDEX_ENTRY_FORMAT.size
+        name_end = data.index(b"\0", name_start)
+        path = data[name_start:name_end].decode(errors="surrogateescape")
+        entries[path] = {
+            "ctime": (ctime_s, ctime_ns),
+            "mtime": (mtime_s, mtime_ns),
+            "dev": dev,
+            "ino": ino,
+            "mode": mode,
+            "uid": uid,
+            "gid": gid,
+            "size": size,
+            "sha": sha.hex(),
+        }
+        # Entries are NUL-padded to a multiple of 8 bytes
+        entry_len = name_end - pos
+        pos += entry_len + 8 - entry_len % 8
+
+    return {"entries": entries, "mtime_ns": index_mtime_ns, "changed": False, "updated": set(),
+            "trees": read_cache_tree(index_path, data[-20:].hex())}
+
+def read_cache_tree(index_path, index_checksum):
+    """
+    Return the cache-tree saved next to the index: {directory: tree SHA} for the
+    directories ("" is the top) whose index entries are exactly that tree. It is
+    only trusted if it was written with this very index, as its first line records.
+    """
+    try:
+        with open(index_path + CACHE_TREE_SUFFIX, "r") as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return {}
+    if not lines or lines[0] != f"index {index_checksum}":
+        return {}
+    trees = {}
+    for line in lines[1:]:
+        tree_sha, _, directory = line.partition(" ")
+        trees[directory] = tree_sha
+    return trees
+
+def invalidate_cache_tree(index, path):
+    """
+    Forget the cached trees of every directory containing path, as an entry under
+    them changed.
+    """
+    trees = index["trees"]
+    if not trees:
+        return
+    directory = path
+    while directory:
+        directory = directory.rpartition("/")[0]
+        trees.pop(directory, None)
+
+@trace_phase("write_index")
+def write_index(index, index_path=INDEX_PATH):
+    """
+    Write the index sorted by path, one entry per path, with a trailing SHA-1 checksum.
+    """
+    paths = sorted(index["entries"])
+    out = bytearray(INDEX_SIGNATURE + struct.pack(">II", INDEX_VERSION, len(paths)))
+
+    for path in paths:
+        entry = index["entries"][path]
+        name = path.encode(errors="surrogateescape")
+        out += INDEX_ENTRY_FORMAT.pack(
+            entry["ctime"][0] & 0xffffffff, entry["ctime"][1] & 0xffffffff,
+            entry["mtime"][0] & 0xffffffff, entry["mtime"][1] & 0xffffffff,
+            entry["dev"] & 0xffffffff, entry["ino"] & 0xffffffff,
+            entry["mode"], entry["uid"] & 0xffffffff, entry["gid"] & 0xffffffff,
+            entry["size"] & 0xffffffff, bytes.fromhex(entry["sha"]),
+            min(len(name), 0xfff),
+        )
+        entry_len = INDEX_ENTRY_FORMAT.size + len(name)
+        out += name + b"\0" * (8 - entry_len % 8)
+
+    checksum = hashlib.sha1(out).digest()
+    out += checksum
+
+    # Write to a temp file and rename so a crash never leaves a torn index
+    tmp_path = index_path + ".lock"
+    with open(tmp_path, "wb") as f:
+        f.write(out)
+    os.replace(tmp_path, index_path)
+    perf_count("bytes_written", len(out))
+    index["changed"] = False
+
+    # The cache-tree names the index it describes, so a stale one is never used
+    trees_path = index_path + CACHE_TREE_SUFFIX
+    if index.get("trees"):
+        with open(trees_path + ".lock", "w") as f:
+            f.write(f"index {checksum.hex()}\n"
+                    + "".join(f"{tree_sha} {directory}\n" for directory, tree_sha in sorted(index["trees"].items())))
+        os.replace(trees_path + ".lock", trees_path)
+    elif os.path.exists(trees_path):
+        os.remove(trees_path)
+
+def index_stat_data(st):
+    """
+    Return the stat fields an index entry records, truncated to the 32 bits the
+    on-disk format keeps, so entries compare the same before and after a reload.
+    """
+    return {
+        "ctime": (int(st.st_ctime) & 0xffffffff, st.st_ctime_ns % 1_000_000_000),
+        "mtime": (int(st.st_mtime) & 0xffffffff, st.st_mtime_ns % 1_000_000_000),
+        "dev": st.st_dev & 0xffffffff,
+        "ino": st.st_ino & 0xffffffff,
+        "mode": index_mode_for(st),
+        "uid": st.st_uid & 0xffffffff,
+        "gid": st.st_gid & 0xffffffff,
+        "size": st.st_size & 0xffffffff,
+    }
+
+def update_index(index, file, sha, st):
+    """
+    Record a staged file and its stat data in the in-memory index.
+    """
+    path = index_path_for(file)
+    old_entry = index["entries"].get(path)
+    if old_entry is None or old_entry["sha"] != sha:
+        invalidate_cache_tree(index, path)
+    index["changed"] = True
+    index["updated"].add(path)
+    index["entries"][path] = dict(index_stat_data(st), sha=sha)
+
+def index_entry_is_fresh(index, file, st):
+    """
+    Return the indexed SHA if the file's stat data is unchanged since it was hashed,
+    otherwise None. Entries modified at or after the index was written are "racy"
+    (a same-tick edit would keep the same mtime) and are always rehashed.
+    """
+    entry = index["entries"].get(index_path_for(file))
+    if entry is None:
+        return None
+    current = index_stat_data(st)
+    if any(entry[field] != current[field] for field in INDEX_STAT_FIELDS):
+        return None
+    if st.st_mtime_ns >= index["mtime_ns"]:
+        return None
+    return entry["sha"]
+
+def stage(files):
+    """
+    Stages files by hashing their content, storing them in the .git/objects directory,
+    and updating the .git/index file. Files whose stat data matches the index are
+    not rehashed.
+    """
+    staging_area = {}
+    ignored_files = read_gitignore()
+    index = read_index()
+    fsmonitor_query()
+
+    # Objects go in one batch, which must be closed before the index names them
+    with object_batch():
+        for file in files:
+            # Files fsmonitor reports unchanged keep their indexed SHA without a stat
+            if fsmonitor_is_clean(file, index):
+                sha = index["entries"][index_path_for(file)]["sha"]
+                staging_area[file] = sha
+                print(f"Staged: {file} -> {sha}")
+                continue
+            try:
+                perf_count("files_stated")
+                st = os.lstat(file)
+            except FileNotFoundError:
+                print(f"File {file} does not exist.")
+                continue
+
+            # Skip ignored files
+            if is_ignored(file, ignored_files, is_dir=stat.S_ISDIR(st.st_mode)):
+                print(f"Ignoring {file} (matched .gitignore)")
+                continue
+
+            # Hash the file content unless the index already knows it
+            if is_worktree_file(st):
+                sha = index_entry_is_fresh(index, file, st)
+                if sha is None:
+                    sha = hash_worktree_file(file, st)
+                    update_index(index, file, sha, st)
+                staging_area[file] = sha
+                print(f"Staged: {file} -> {sha}")
+            else:
+                print(f"Skipping {file} (not a file)")
+
+    if index["changed"]:
+        write_index(index)
+    fsmonitor_save(index)
+
+    return staging_area
+
+def list_worktree_entries(directory, ignored_files, index=None):
+    """
+    Return sorted (name, path, stat) for the entries of one working-tree directory,
+    skipping .git and ignored names. Ignored directories are dropped here, so walks
+    never descend into them, and ignored entries are never stat'ed. When an index is
+    given, files the fsmonitor daemon reports unchanged are not stat'ed either and
+    come back with a stat of None. Entries are lstat'ed: symlinks are reported as
+    links, never as what they point to.
+    """
+    entries = []
+    with os.scandir(directory) as scan:
+        for dir_entry in scan:
+            if dir_entry.name == ".git":
+                continue
+            is_dir = dir_entry.is_dir(follow_symlinks=False)
+            if is_ignored(dir_entry.path, ignored_files, is_dir=is_dir, check_parents=False):
+                continue
+            if index is not None and not is_dir and fsmonitor_is_clean(dir_entry.path, index):
+                entries.append((dir_entry.name, dir_entry.path, None))
+                continue
+            entries.append((dir_entry.name, dir_entry.path, dir_entry.stat(follow_symlinks=False)))
+            perf_count("files_stated")
+    entries.sort()
+    return entries
+
+def hash_files_parallel(directory, staging_area, index, jobs):
+    """
+    Hash every file under directory that is neither staged nor fresh in the index
+    using a pool of worker threads. zlib and SHA-1 release the GIL while they work on
+    each chunk, so the workers run on separate cores. Results go into staging_area.
+    Returns the directory listings it scanned, keyed by path, so write_tree can build
+    the trees without scanning and stat'ing the working tree a second time.
+    """
+    ignored_files = read_gitignore()
+    pending = []
+    listings = {}
+    directories = [directory]
+    with trace_phase("scan_worktree"):
+        while directories:
+            current = directories.pop()
+            listings[current] = list_worktree_entries(current, ignored_files, index)
+            for _, entry_path, st in listings[current]:
+                if st is None:
+                    # Unchanged according to fsmonitor; write_tree takes the indexed SHA
+                    continue
+                if stat.S_ISDIR(st.st_mode):
+                    directories.append(entry_path)
+                elif stat.S_ISREG(st.st_mode) and entry_path not in staging_area:
+                    blob_sha = index_entry_is_fresh(index, entry_path, st)
+                    if blob_sha is None:
+                        pending.append((entry_path, st))
+                    else:
+                        staging_area[entry_path] = blob_sha
+
+    with trace_phase("hash_files"), ThreadPoolExecutor(max_workers=jobs) as pool:
+        shas = pool.map(hash_file_streaming, [entry_path for entry_path, _ in pending])
+        for (entry_path, st), blob_sha in zip(pending, shas):
+            staging_area[entry_path] = blob_sha
+            update_index(index, entry_path, blob_sha, st)
+    return listings
+
+def write_tree(directory=".", staging_area=None, index=None, jobs=1, listings=None):
+    """
+    Recursively writes the directory's structure as a tree object.
+    Uses staged files and .gitignore rules. Files whose stat data matches the
+    index reuse the indexed SHA instead of being rehashed. With jobs > 1 the blobs
+    are hashed by a worker pool first; trees are still built in sorted order, so
+    the resulting SHAs are identical to the serial path, and the trees are built
+    from the listings the pool's scan already made.
+    """
+    entries = []
+
+    # If no staging area is provided, use an empty dictionary
+    if staging_area is None:
+        staging_area = {}
+
+    # The top-level call loads the index and writes it back when entries changed
+    if index is None:
+        index = read_index()
+        # With the fsmonitor daemon running, only the files it reported are stat'ed
+        full_scan = fsmonitor_query() is None
+        cached_trees = dict(index["trees"])
+        # Objects go in one batch, which must be closed before the index names them
+        with object_batch():
+            if jobs > 1:
+                listings = hash_files_parallel(directory, staging_area, index, jobs)
+            tree_sha = write_tree(directory, staging_area, index, listings=listings)
+        if directory == ".":
+            # The index mirrors the tree just written: drop files that are gone
+            written = {index_path_for(path) for path in staging_area}
+            for path in [path for path in index["entries"] if path not in written]:
+                del index["entries"][path]
+                index["changed"] = True
+        else:
+            # Entries outside the trees written weren't pruned, so they can't be cached
+            index["trees"] = {}
+        if index["trees"] != cached_trees:
+            index["changed"] = True
+        if index["changed"]:
+            write_index(index)
+        fsmonitor_save(index, full_scan=full_scan)
+        return tree_sha
+
+    if listings is not None and directory in listings:
+        directory_entries = listings.pop(directory)
+    else:
+        directory_entries = list_worktree_entries(directory, read_gitignore(), index)
+    for entry, entry_path, st in directory_entries:
+        if st is None or is_worktree_file(st):
+            # Use staged content if available
+            if entry_path in staging_area:
+                blob_sha = staging_area[entry_path]
+            else:
+                if st is None:
+                    blob_sha = index["entries"][index_path_for(entry_path)]["sha"]
+                else:
+                    blob_sha = index_entry_is_fresh(index, entry_path, st)
+                if blob_sha is None:
+                    # Hash and stage the file content
+                    blob_sha = hash_worktree_file(entry_path, st)
+                    update_index(index, entry_path, blob_sha, st)
+                staging_area[entry_path] = blob_sha  # Stage the file
+
+            # The tree records the same mode as the index: 100644, 100755 or 120000
+            file_mode = index["entries"][index_path_for(entry_path)]["mode"] if st is None else index_mode_for(st)
+            entries.append(TreeEntry.create(f"{file_mode:o}", entry, blob_sha))
+        elif stat.S_ISDIR(st.st_mode):
+            # Recursively write the directory as a tree object
+            tree_sha = write_tree(entry_path, staging_area, index, listings=listings)
+            # Like Git, leave out directories with nothing to track (e.g. all ignored)
+            if tree_sha != EMPTY_TREE_SHA:
+                mode = "40000"  # Directory mode
+                entries.append(TreeEntry.create(mode, entry, tree_sha))
+
+    # Create and return the SHA of the tree object, remembering it in the cache-tree
+    tree_sha = store_object(Tree(entries))
+    tree_path = index_path_for(directory)
+    index["trees"]["" if tree_path == "." else tree_path] = tree_sha
+    return tree_sha
+
+def parse_jobs_option(args):
+    """
+    Read "--jobs N" (or "-j N") from command arguments. 0 means one job per CPU.
+    """
+    for flag in ("--jobs", "-j"):
+        if flag in args:
+            position = args.index(flag)
+            if position + 1 >= len(args):
+                raise RuntimeError(f"{flag} requires a number")
+            jobs = int(args[position + 1])
+            return jobs if jobs > 0 else (os.cpu_count() or 1)
+    return 1
+
+def create_commit_object(tree_sha, parent_sha, message, branch_name="main"):
+    """
+    Create a commit object and update the branch reference.
+    parent_sha may be a single SHA or a list of parents for a merge commit.
+    """
+    author = "John Doe <johndoe@example.com>"
+    timestamp = int(time.time())
+    timezone_offset = time.strftime('%z')
+
+    # Build the commit (merge commits pass a list of parents)
+    parents = [
+        parent for parent in (parent_sha if isinstance(parent_sha, list) else [parent_sha])
+        if parent and parent != "0" * 40  # Validate parent SHA
+    ]
+    signature = f"{author} {timestamp} {timezone_offset}"
+    try:
+        commit = Commit.create(tree_sha, parents, signature, signature, message)
+    except UnicodeEncodeError as e:
+        print(f"Encoding error: {e}")
+        print("Problematic message:", message)
+        raise
+
+    # Save the commit object
+    sha1_hash = store_object(commit)
+
+    # Update the branch reference
+    write_ref(f"refs/heads/{branch_name}", sha1_hash)
+
+    # Keep the commit-graph in step with the new commit
+    update_commit_graph(sha1_hash)
+    
+    return sha1_hash
+
+# Memory-mapped commit-graph layers, loaded on first use
+_commit_graph = None
+
+def map_commit_graph_file(path, base_count):
+    """
+    Map one commit-graph file and locate its chunks. base_count is the number of
+    commits in the layers below it, which is where its global positions start.
+    """
+    with open(path, "rb") as f:
+        graph_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if graph_map[:4] != COMMIT_GRAPH_SIGNATURE or graph_map[4] != 1:
+        raise RuntimeError(f"{path} is not a version 1 commit-graph")
+
+    chunks = {}
+    for i in range(graph_map[6]):
+        pos = 8 + i * 12
+        chunks[graph_map[pos:pos + 4]] = int.from_bytes(graph_map[pos + 4:pos + 12], "big")
+
+    fanout = chunks[b"OIDF"]
+    return {
+        "map": graph_map,
+        "path": path,
+        "hash": graph_map[-20:].hex(),
+        "fanout": fanout,
+        "oids": chunks[b"OIDL"],
+        "data": chunks[b"CDAT"],
+        "edges": chunks.get(b"EDGE"),
+        "count": int.from_bytes(graph_map[fanout + 255 * 4:fanout + 256 * 4], "big"),
+        "base": base_count,
+    }
+
+def load_commit_graph():
+    """
+    Map the commit-graph and return its layers, oldest first, or None if there is
+    no graph. A single .git/objects/info/commit-graph file takes precedence, as in
+    Git; otherwise the layers named in commit-graphs/commit-graph-chain are mapped.
+    """
+    global _commit_graph
+    if _commit_graph is not None:
+        return _commit_graph or None
+
+    layers = []
+    try:
+        layers.append(map_commit_graph_file(COMMIT_GRAPH_PATH, 0))
+    except (FileNotFoundError, ValueError):
+        try:
+            with open(COMMIT_GRAPH_CHAIN_PATH, "r") as f:
+                layer_hashes = f.read().split()
+        except FileNotFoundError:
+            layer_hashes = []
+        for layer_hash in layer_hashes:
+            base_count = layers[-1]["base"] + layers[-1]["count"] if layers else 0
+            layers.append(map_commit_graph_file(commit_graph_layer_path(layer_hash), base_count))
+    _commit_graph = layers
+    return _commit_graph or None
+
+def commit_graph_layer_path(layer_hash):
+    """
+    Return the path of one layer of a split commit-graph.
+    """
+    return f"{COMMIT_GRAPHS_DIR}/graph-{layer_hash}.graph"
+
+def find_commit_graph_row(layers, commit_sha):
+    """
+    Return (layer, position) for a commit stored in the graph, or None.
+    """
+    try:
+        target = bytes.fromhex(commit_sha)
+    except ValueError:
+        return None
+    if len(target) != 20:
+        return None
+    for layer in reversed(layers):
+        position = find_in_sha_table(layer["map"], layer["fanout"], layer["oids"], target)
+        if position is not None:
+            return layer, position
+    return None
+
+def commit_graph_oid(layers, global_position):
+    """
+    Return the SHA at a position counted across all layers, as parent positions are.
+    """
+    for layer in layers:
+        if global_position < layer["base"] + layer["count"]:
+            oid = layer["oids"] + (global_position - layer["base"]) * 20
+            return layer["map"][oid:oid + 20].hex()
+    raise RuntimeError(f"commit-graph parent position {global_position} is out of range")
+
+def read_commit_graph_row(layers, layer, position):
+    """
+    Decode one fixed-width CDAT row: tree, parent positions, generation and time.
+    """
+    graph_map = layer["map"]
+    row = layer["data"] + position * 36
+    tree_sha = graph_map[row:row + 20].hex()
+    parent1, parent2, gen_high, time_low = struct.unpack_from(">IIII", graph_map, row + 20)
+
+    parent_positions = []
+    if parent1 != COMMIT_GRAPH_NO_PARENT:
+        parent_positions.append(parent1)
+    if parent2 & COMMIT_GRAPH_EXTRA_EDGES and parent2 != COMMIT_GRAPH_NO_PARENT:
+        # Octopus merges list their remaining parents in the EDGE chunk
+        edge = layer["edges"] + (parent2 & 0x7fffffff) * 4
+        while True:
+            value = int.from_bytes(graph_map[edge:edge + 4], "big")
+            parent_positions.append(value & 0x7fffffff)
+            if value & COMMIT_GRAPH_LAST_EDGE:
+                break
+            edge += 4
+    elif parent2 != COMMIT_GRAPH_NO_PARENT:
+        parent_positions.append(parent2)
+
+    return {
+        "tree": tree_sha,
+        "parents": [commit_graph_oid(layers, parent_position) for parent_position in parent_positions],
+        "generation": gen_high >> 2,
+        "time": ((gen_high & 0x3) << 32) | time_low,
+    }
+
+def get_commit_info(commit_sha):
+    """
+    Return {"tree", "parents", "generation", "time"} for a commit, from the
+    commit-graph when it covers the commit, otherwise by parsing the commit object
+    (generation is then None). Commits in .git/shallow have no parents, as their
+    parents were never copied.
+    """
+    info = None
+    layers = load_commit_graph()
+    if layers is not None:
+        found = find_commit_graph_row(layers, commit_sha)
+        if found is not None:
+            info = read_commit_graph_row(layers, *found)
+
+    if info is None:
+        commit = load_typed_object(commit_sha, Commit)
+        info = {"tree": commit.tree, "parents": commit.parents, "generation": None, "time": commit.commit_time}
+    if info["parents"] and commit_sha in load_shallow():
+        info["parents"] = []
+    return info
+
+# Commits listed in .git/shallow, read once per process
+_shallow = None
+
+def load_shallow():
+    """
+    Return the set of shallow commits: the boundary of a shallow clone, whose
+    parents are not in the repository.
+    """
+    global _shallow
+    if _shallow is None:
+        try:
+            with open(SHALLOW_PATH, "r") as f:
+                _shallow = set(f.read().split())
+        except FileNotFoundError:
+            _shallow = set()
+    return _shallow
+
+def iter_commit_graph_rows(layers, layer):
+    """
+    Yield (sha, row) for every commit stored in one layer of the graph.
+    """
+    for position in range(layer["count"]):
+        oid = layer["oids"] + position * 20
+        yield layer["map"][oid:oid + 20].hex(), read_commit_graph_row(layers, layer, position)
+
+def list_branch_heads():
+    """
+    Return the commit SHA of every branch, loose or packed.
+    """
+    return [sha for sha in list_refs("refs/heads/").values() if sha and sha != "0" * 40]
+
+def collect_graph_commits(start_commits, commits, stop=None):
+    """
+    Add tree, parents and time for every commit reachable from start_commits to
+    commits (sha -> row), reading commit objects. The walk doesn't enter commits
+    already in commits or for which stop(sha) is true.
+    """
+    pending = list(start_commits)
+    while pending:
+        commit_sha = pending.pop()
+        if commit_sha in commits or (stop is not None and stop(commit_sha)):
+            continue
+        try:
+            commit = load_typed_object(commit_sha, Commit)
+        except RuntimeError:
+            continue  # Missing history (e.g. beyond a shallow boundary)
+        commits[commit_sha] = {"tree": commit.tree, "parents": commit.parents, "time": commit.commit_time}
+        pending.extend(commit.parents)
+    return commits
+
+def encode_commit_graph(commits, base_layers=()):
+    """
+    Serialize commits (sha -> {"tree", "parents", "time"}) as a commit-graph file.
+    Parents may be in commits or in base_layers, the layers this one is written on
+    top of; positions are counted across the whole chain. Parents found in neither
+    are dropped so the graph stays closed under parents.
+    """
+    base_layers = list(base_layers)
+    base_count = base_layers[-1]["base"] + base_layers[-1]["count"] if base_layers else 0
+    shas = sorted(commits)
+    positions = {sha: base_count + position for position, sha in enumerate(shas)}
+
+    # Resolve each parent to its global position and note base-layer generations
+    generations = {}
+    parent_lists = {}
+    for sha in shas:
+        parent_lists[sha] = []
+        for parent in commits[sha]["parents"]:
+            if parent in positions:
+                parent_lists[sha].append(parent)
+                continue
+            found = find_commit_graph_row(base_layers, parent) if base_layers else None
+            if found is not None:
+                layer, position = found
+                positions[parent] = layer["base"] + position
+                generations[parent] = read_commit_graph_row(base_layers, layer, position)["generation"]
+                parent_lists[sha].append(parent)
+
+    # Generation number: 1 for roots, otherwise 1 + the highest parent generation
+    for commit_sha in shas:
+        stack = [commit_sha]
+        while stack:
+            current = stack[-1]
+            if current in generations:
+                stack.pop()
+                continue
+            missing = [parent for parent in parent_lists[current] if parent not in generations]
+            if missing:
+                stack.extend(missing)
+            else:
+                parent_generations = [generations[parent] for parent in parent_lists[current]]
+                generations[current] = 1 + max(parent_generations, default=0)
+                stack.pop()
+
+    fanout = [0] * 256
+    for sha in shas:
+        fanout[int(sha[:2], 16)] += 1
+    oidf = bytearray()
+    total = 0
+    for count in fanout:
+        total += count
+        oidf += total.to_bytes(4, "big")
+
+    oidl = b"".join(bytes.fromhex(sha) for sha in shas)
+
+    cdat = bytearray()
+    edges = bytearray()
+    for sha in shas:
+        parent_positions = [positions[parent] for parent in parent_lists[sha]]
+        parent1 = parent_positions[0] if parent_positions else COMMIT_GRAPH_NO_PARENT
+        if len(parent_positions) > 2:
+            parent2 = COMMIT_GRAPH_EXTRA_EDGES | (len(edges) // 4)
+            for i, position in enumerate(parent_positions[1:]):
+                last = COMMIT_GRAPH_LAST_EDGE if i == len(parent_positions) - 2 else 0
+                edges += (position | last).to_bytes(4, "big")
+        elif len(parent_positions) == 2:
+            parent2 = parent_positions[1]
+        else:
+            parent2 = COMMIT_GRAPH_NO_PARENT
+        commit_time = commits[sha]["time"]
+        cdat += bytes.fromhex(commits[sha]["tree"])
+        cdat += struct.pack(">IIII", parent1, parent2,
+                            (generations[sha] << 2) | ((commit_time >> 32) & 0x3),
+                            commit_time & 0xffffffff)
+
+    chunks = [(b"OIDF", bytes(oidf)), (b"OIDL", oidl), (b"CDAT", bytes(cdat))]
+    if edges:
+        chunks.append((b"EDGE", bytes(edges)))
+    if base_layers:
+        # BASE lists the checksums of the layers below, oldest first
+        chunks.append((b"BASE", b"".join(bytes.fromhex(layer["hash"]) for layer in base_layers)))
+
+    # Header, chunk lookup table (with a terminating entry), chunks, checksum
+    out = bytearray(COMMIT_GRAPH_SIGNATURE + bytes([1, 1, len(chunks), len(base_layers)]))
+    offset = 8 + (len(chunks) + 1) * 12
+    for chunk_id, chunk in chunks:
+        out += chunk_id + offset.to_bytes(8, "big")
+        offset += len(chunk)
+    out += b"\0\0\0\0" + offset.to_bytes(8, "big")
+    for _, chunk in chunks:
+        out += chunk
+    out += hashlib.sha1(out).digest()
+    return bytes(out)
+
+def close_commit_graph():
+    """
+    Unmap the loaded commit-graph so it is re-read after it changes.
+    """
+    global _commit_graph
+    for layer in _commit_graph or []:
+        layer["map"].close()
+    _commit_graph = None
+
+def write_commit_chain(layer_hashes):
+    """
+    Replace commit-graph-chain with the given layers, oldest first.
+    """
+    tmp_path = COMMIT_GRAPH_CHAIN_PATH + ".lock"
+    with open(tmp_path, "w") as f:
+        f.write("".join(f"{layer_hash}\n" for layer_hash in layer_hashes))
+    os.replace(tmp_path, COMMIT_GRAPH_CHAIN_PATH)
+
+def remove_commit_graph_layers(keep=()):
+    """
+    Delete the split commit-graph layers that are not in keep.
+    """
+    try:
+        names = os.listdir(COMMIT_GRAPHS_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.startswith("graph-") and name.endswith(".graph") and name[6:-6] not in keep:
+            os.remove(os.path.join(COMMIT_GRAPHS_DIR, name))
+
+@trace_phase("write_commit_graph")
+def write_commit_graph(start_commits=None):
+    """
+    Write a single commit-graph file for every commit reachable from start_commits
+    (all branch heads by default). It replaces any split layers, merging them all.
+    """
+    if start_commits is None:
+        start_commits = list_branch_heads()
+    commits = collect_graph_commits(start_commits, {})
+    data = encode_commit_graph(commits)
+
+    os.makedirs(os.path.dirname(COMMIT_GRAPH_PATH), exist_ok=True)
+    tmp_path = COMMIT_GRAPH_PATH + ".lock"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    close_commit_graph()
+    os.replace(tmp_path, COMMIT_GRAPH_PATH)
+    if os.path.exists(COMMIT_GRAPH_CHAIN_PATH):
+        os.remove(COMMIT_GRAPH_CHAIN_PATH)
+    remove_commit_graph_layers()
+
+    return len(commits)
+
+@trace_phase("write_commit_graph")
+def update_commit_graph(commit_sha):
+    """
+    Add a new commit to the commit-graph as a small layer on top of the existing
+    ones, so only the commits the graph doesn't know are read and written. While
+    the new layer holds at least 1/COMMIT_GRAPH_SIZE_MULTIPLE as many commits as
+    the layer below it, the two are merged, which keeps the chain logarithmic in
+    length. Returns the number of commits written to the new layer.
+    """
+    layers = load_commit_graph() or []
+    if len(layers) == 1 and layers[0]["path"] == COMMIT_GRAPH_PATH:
+        # A full graph from "commit-graph write" becomes the base of the chain
+        os.makedirs(COMMIT_GRAPHS_DIR, exist_ok=True)
+        base_hash = layers[0]["hash"]
+        close_commit_graph()
+        os.replace(COMMIT_GRAPH_PATH, commit_graph_layer_path(base_hash))
+        write_commit_chain([base_hash])
+        layers = load_commit_graph()
+
+    def in_graph(sha):
+        return find_commit_graph_row(layers, sha) is not None
+
+    commits = collect_graph_commits([commit_sha] + list_branch_heads(), {}, in_graph)
+    if not commits:
+        return 0
+
+    # Fold layers into the new one while they are not much bigger than it
+    while layers and layers[-1]["count"] <= COMMIT_GRAPH_SIZE_MULTIPLE * len(commits):
+        top = layers.pop()
+        for sha, row in iter_commit_graph_rows(layers + [top], top):
+            commits.setdefault(sha, {"tree": row["tree"], "parents": row["parents"], "time": row["time"]})
+
+    data = encode_commit_graph(commits, layers)
+    layer_hashes = [layer["hash"] for layer in layers] + [data[-20:].hex()]
+
+    os.makedirs(COMMIT_GRAPHS_DIR, exist_ok=True)
+    layer_path = commit_graph_layer_path(layer_hashes[-1])
+    tmp_path = layer_path + ".lock"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, layer_path)
+    close_commit_graph()
+    write_commit_chain(layer_hashes)
+    remove_commit_graph_layers(keep=layer_hashes)
+
+    return len(commits)
+
+# Contents of .git/packed-refs, read once per process
+_packed_refs = None
+
+def load_packed_refs():
+    """
+    Return the packed-refs file as bytes with the header removed. Files written
+    without the "sorted" trait are sorted in memory so they can be searched the same way.
+    """
+    global _packed_refs
+    if _packed_refs is None:
+        try:
+            with open(PACKED_REFS_PATH, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b""
+        header = b""
+        if data.startswith(b"#"):
+            header_end = data.find(b"\n") + 1 or len(data)
+            header, data = data[:header_end], data[header_end:]
+        if data and b" sorted " not in header:
+            lines = [line for line in data.splitlines() if line and not line.startswith(b"^")]
+            data = b"".join(line + b"\n" for line in sorted(lines, key=lambda line: line[41:]))
+        _packed_refs = data
+    return _packed_refs
+
+def find_packed_ref(refname):
+    """
+    Binary-search packed-refs for a ref name and return its SHA, or None. Each
+    probe backs up to the start of the line it lands in; "^" lines hold the peeled
+    value of the tag above them and are never compared.
+    """
+    data = load_packed_refs()
+    target = refname.encode()
+    lo, hi = 0, len(data)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start = data.rfind(b"\n", lo, mid) + 1 or lo
+        if data[start:start + 1] == b"^":
+            start = data.rfind(b"\n", lo, start - 1) + 1 or lo
+        end = data.find(b"\n", start, hi)
+        if end == -1:
+            end = hi
+        name = data[start + 41:end]
+        if name == target:
+            return data[start:start + 40].decode()
+        if name < target:
+            lo = end + 1
+            if data[lo:lo + 1] == b"^":
+                lo = data.find(b"\n", lo) + 1 or len(data)
+        else:
+            hi = start
+    return None
+
+def iter_packed_refs(prefix=""):
+    """
+    Yield (refname, sha) for the packed refs under prefix, in sorted order.
+    """
+    for line in load_packed_refs().splitlines():
+        if line.startswith(b"^"):
+            continue
+        name = line[41:].decode()
+        if name.startswith(prefix):
+            yield name, line[:40].decode()
+
+def read_ref(refname):
+    """
+    Return the SHA a ref like "refs/heads/main" points to, or None. A loose ref
+    file overrides the packed entry. The repository daemon remembers resolved refs
+    and only rereads one when its loose file's stat data changes.
+    """
+    if _daemon is not None:
+        key = file_stat_key(f".git/{refname}")
+        with _daemon["lock"]:
+            cached = _daemon["refs"].get(refname)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+    try:
+        with open(f".git/{refname}", "r") as f:
+            sha = f.read().strip()
+    except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+        sha = find_packed_ref(refname)
+    if _daemon is not None:
+        with _daemon["lock"]:
+            _daemon["refs"][refname] = (key, sha)
+    return sha
+
+def write_ref(refname, sha):
+    """
+    Point a ref at a SHA by writing its loose file, which overrides any packed entry.
+    """
+    ref_path = f".git/{refname}"
+    os.makedirs(os.path.dirname(ref_path), exist_ok=True)
+    tmp_path = ref_path + ".lock"
+    with open(tmp_path, "w") as f:
+        f.write(sha + "\n")
+    os.replace(tmp_path, ref_path)
+
+def list_refs(prefix="refs/heads/"):
+    """
+    Return {refname: sha} for every ref under prefix in one pass over the loose
+    ref directory and the packed-refs file, loose refs taking precedence.
+    """
+    refs = dict(iter_packed_refs(prefix))
+    loose_dir = f".git/{prefix}"
+    for root, _, files in os.walk(loose_dir):
+        for name in files:
+            if name.endswith(".lock"):
+                continue
+            path = os.path.join(root, name)
+            with open(path, "r") as f:
+                refs[prefix + os.path.relpath(path, loose_dir).replace(os.sep, "/")] = f.read().strip()
+    return dict(sorted(refs.items()))
+
+def peel_ref(sha):
+    """
+    Return the object an annotated tag finally points to (following tags of tags),
+    or None if sha isn't a tag. The header promises "fully-peeled", so Git trusts
+    these values instead of reading the tags itself.
+    """
+    peeled = None
+    while True:
+        try:
+            if read_object_header(sha)[0] != "tag":
+                return peeled
+        except RuntimeError:
+            return peeled  # e.g. the all-zero SHA of a branch without commits
+        content = read_object(sha)[1]
+        sha = content[len(b"object "):content.index(b"\n")].decode()
+        peeled = sha
+
+def pack_refs():
+    """
+    Move every loose ref into the packed-refs file and delete the loose files,
+    so thousands of branches are read with one open instead of one each. Each
+    annotated tag is followed by a "^<sha>" line holding what it peels to.
+    """
+    global _packed_refs
+    refs = list_refs("refs/")
+    lines = [PACKED_REFS_HEADER]
+    for refname, sha in refs.items():
+        lines.append(f"{sha} {refname}\n".encode())
+        peeled = peel_ref(sha)
+        if peeled is not None:
+            lines.append(f"^{peeled}\n".encode())
+    tmp_path = PACKED_REFS_PATH + ".lock"
+    with open(tmp_path, "wb") as f:
+        f.write(b"".join(lines))
+    os.replace(tmp_path, PACKED_REFS_PATH)
+    _packed_refs = None
+
+    # Only drop loose refs that still hold the value that was packed
+    removed = 0
+    for refname, sha in refs.items():
+        ref_path = f".git/{refname}"
+        try:
+            with open(ref_path, "r") as f:
+                if f.read().strip() != sha:
+                    continue
+            os.remove(ref_path)
+            removed += 1
+        except FileNotFoundError:
+            continue
+    # Prune the directories left empty, keeping the namespaces (refs/heads, refs/tags...)
+    for namespace in os.listdir(".git/refs"):
+        for root, dirs, _ in os.walk(os.path.join(".git/refs", namespace), topdown=False):
+            for name in dirs:
+                path = os.path.join(root, name)
+                if not os.listdir(path):
+                    os.rmdir(path)
+    print(f"Packed {len(refs)} refs ({removed} loose refs removed)")
+
+def list_branches(verbose=False):
+    """
+    Print every branch, marking the one HEAD points to with "*".
+    """
+    current = get_head_branch()
+    for refname, sha in list_refs("refs/heads/").items():
+        name = refname[len("refs/heads/"):]
+        marker = "*" if name == current else " "
+        print(f"{marker} {name} {sha[:7]}" if verbose else f"{marker} {name}")
+
+def get_commit_sha(branch_name):
+    """
+    Retrieve the latest commit SHA from a branch.
+    """
+    sha = read_ref(f"refs/heads/{branch_name}")
+    if sha is None:
+        raise RuntimeError(f"Branch '{branch_name}' does not exist.")
+    return sha
+
+def get_parent_sha_from_head():
+    """
+    Retrieves the parent commit SHA by reading from HEAD.
+    It extracts the SHA of the current commit, then fetches its parent SHA.
+    """
+    head_path = ".git/HEAD"
 
     if not os.path.exists(head_path):
         raise RuntimeError("No HEAD reference found. Are you in a Git repository?")
@@ -388,327 +3109,1456 @@ def get_parent_sha_from_head():
     if head_content.startswith("ref:"):
         # If HEAD is pointing to a branch (e.g., ref: refs/heads/main)
         branch_name = head_content.split(" ")[1]
-        branch_path = f".git/{branch_name}"
-
-        if not os.path.exists(branch_path):
-            raise RuntimeError(f"Branch '{branch_name}' does not exist.")
 
         # Read the commit SHA from the branch reference
-        with open(branch_path, "r") as branch_file:
-            commit_sha = branch_file.read().strip()
+        commit_sha = read_ref(branch_name)
+        if commit_sha is None:
+            raise RuntimeError(f"Branch '{branch_name}' does not exist.")
     else:
         # HEAD is pointing to a commit directly (detached HEAD state)
         commit_sha = head_content
         
     print(f"HEAD is at commit: {commit_sha}")
 
-def get_parent_commit_sha(commit_data):
+def get_commit_tree(commit_sha):
+    """
+    Retrieve the tree SHA from a commit object.
+    """
+    if not isinstance(commit_sha, str):
+        raise TypeError(f"Expected commit_sha to be a string, got {type(commit_sha)}")
+
+    if not (len(commit_sha) == 40 and all(c in "0123456789abcdef" for c in commit_sha)):
+        raise ValueError(f"Invalid SHA format: {commit_sha}. Must be a 40-character hexadecimal string.")
+
+    commit = load_typed_object(commit_sha, Commit)
+
+    # Inspect raw commit data as bytes
+    trace(f"Raw commit data for {commit_sha} (first 100 bytes): {commit.serialize()[:100]}")
+
+    tree_sha = commit.tree
+    trace(f"Found tree SHA for {commit_sha}: {tree_sha}")
+
+    if not (len(tree_sha) == 40 and all(c in "0123456789abcdef" for c in tree_sha)):
+        raise RuntimeError(f"Invalid tree SHA found in commit data: {tree_sha}")
+
+    return tree_sha
+
+def show_commit_history(branch_name="main"):
+    """
+    Display the commit history of a branch.
+    """
+    try:
+        commit_sha = get_commit_sha(branch_name)
+        while commit_sha:
+            print_commit(load_typed_object(commit_sha, Commit))
+            # Follow the first parent through the commit-graph rather than the commit text
+            parents = get_commit_info(commit_sha)["parents"]
+            commit_sha = parents[0] if parents else None
+    except FileNotFoundError:
+        print(f"Branch '{branch_name}' does not exist.")
+    except RuntimeError as e:
+        print(f"Error: {e}")
+
+def print_commit(commit):
+    try:
+        parents = commit.parents
+        # Display parsed data
+        print(f"Commit: {commit.sha or '(unknown)'}")
+        print(f"Tree: {commit.tree}")
+        print(f"Parent: {' '.join(parents) if parents else '(none)'}")
+        print(f"Author: {commit.author or '(unknown)'}")
+        print(f"Committer: {commit.committer or '(unknown)'}")
+        print(f"Message: {commit.message.strip() or '(No commit message provided)'}")
+    except Exception as e:
+        print(f"Error parsing commit: {e}")
+        raise RuntimeError("Malformed commit data.")
+
+def parse_log_date(value):
+    """
+    Parse a --since/--until date into a Unix timestamp. Accepts a timestamp, a local
+    date or time ("2024-05-01", "2024-05-01 13:30:00"), or "<n> <unit>s ago".
+    """
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    match = re.fullmatch(r"(\d+)[ .](second|minute|hour|day|week|month|year)s?[ .]ago", value)
+    if match:
+        return int(time.time()) - int(match.group(1)) * LOG_DATE_UNITS[match.group(2)]
+    for date_format in LOG_DATE_FORMATS:
+        try:
+            return int(time.mktime(time.strptime(value, date_format)))
+        except ValueError:
+            pass
+    raise RuntimeError(f"Invalid date: {value}")
+
+def tree_path_entry(tree_sha, path):
+    """
+    Return the (mode, sha) entry for a slash-separated path inside a tree, or None
+    if it isn't there. Only the trees along the path are read.
+    """
+    entry = ("40000", tree_sha)
+    for name in path.strip("/").split("/"):
+        if not entry[0].startswith("4"):
+            return None
+        entry = next(((mode, sha) for mode, entry_name, sha in parse_tree_object(entry[1]) if entry_name == name), None)
+        if entry is None:
+            return None
+    return entry
+
+def iter_log(start_commits, max_count=None, since=None, until=None, path=None):
+    """
+    Yield the SHAs of commits reachable from start_commits, newest commit date first,
+    following every parent. Commits are read only as the walk reaches them, so
+    stopping early (max_count, since, or the caller closing the generator) leaves
+    the rest of history untouched.
+
+    With a path, a commit is shown only if the path's entry differs from every parent
+    (a root commit, if the path exists). A commit that matches one of its parents is
+    hidden and only that parent is followed, as Git's default history
+    simplification does, so side branches that didn't touch the path aren't walked.
+    """
+    if max_count is not None and max_count <= 0:
+        return
+
+    # Path entries of queued commits, so each tree is walked once. Entries of
+    # parents that end up not being followed are dropped again.
+    path_entries = {}
+
+    def commit_path_entry(sha, info):
+        if sha not in path_entries:
+            path_entries[sha] = tree_path_entry(info["tree"], path)
+        return path_entries[sha]
+
+    # Equal dates come out in the order they were queued, as in Git, so a child
+    # is never shown after a parent with the same date
+    queue = []
+    sequence = itertools.count()
+    seen = set()
+    queued = set()
+    for sha in start_commits:
+        if sha not in seen:
+            seen.add(sha)
+            queued.add(sha)
+            info = get_commit_info(sha)
+            heapq.heappush(queue, (-info["time"], next(sequence), sha, info))
+
+    shown = 0
+    while queue:
+        negative_time, _, sha, info = heapq.heappop(queue)
+        queued.discard(sha)
+        perf_count("commits_walked")
+        commit_time = -negative_time
+        if since is not None and commit_time < since:
+            # Everything still queued is older still
+            break
+
+        parents = info["parents"]
+        show = until is None or commit_time <= until
+        if path is not None:
+            entry = commit_path_entry(sha, info)
+            path_entries.pop(sha)
+            if parents:
+                same = [parent for parent in parents
+                        if commit_path_entry(parent, get_commit_info(parent)) == entry]
+                if same:
+                    show = False
+                    parents = same[:1]
+            elif entry is None:
+                show = False
+
+        if show:
+            yield sha
+            shown += 1
+            if max_count is not None and shown >= max_count:
+                return
+
+        for parent in parents:
+            if parent not in seen:
+                seen.add(parent)
+                queued.add(parent)
+                parent_info = get_commit_info(parent)
+                heapq.heappush(queue, (-parent_info["time"], next(sequence), parent, parent_info))
+        if path is not None:
+            for parent in info["parents"]:
+                if parent not in queued:
+                    path_entries.pop(parent, None)
+
+def show_log(args):
+    """
+    log [<branch>|<commit>] [-n <count>|-n<count>|--max-count=<count>] [--since=<date>]
+    [--until=<date>] [-- <path>]. Commits are printed as the walk finds them.
+    """
+    options = {"max_count": None, "since": None, "until": None, "path": None}
+    revisions = []
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        name, has_value, value = arg.partition("=")
+        if arg == "--":
+            if len(args) != 1:
+                raise RuntimeError("log takes a single path after --")
+            options["path"] = args.pop(0)
+        elif name in ("-n", "--max-count", "--since", "--until"):
+            if not has_value:
+                if not args:
+                    raise RuntimeError(f"{name} needs a value")
+                value = args.pop(0)
+            if name in ("--since", "--until"):
+                options[name[2:]] = parse_log_date(value)
+            elif value.isdigit():
+                options["max_count"] = int(value)
+            else:
+                raise RuntimeError(f"Invalid count: {value}")
+        elif re.fullmatch(r"-\d+", arg):
+            options["max_count"] = int(arg[1:])
+        elif re.fullmatch(r"-n\d+", arg):
+            options["max_count"] = int(arg[2:])
+        elif arg.startswith("-"):
+            raise RuntimeError(f"Unknown log option: {arg}")
+        else:
+            revisions.append(arg)
+
+    if not revisions:
+        branch = get_head_branch()
+        if branch is None:
+            with open(".git/HEAD", "r") as f:
+                revisions.append(f.read().strip())
+        else:
+            revisions.append(branch)
+    start_commits = [rev if re.fullmatch(r"[0-9a-f]{40}", rev) else get_commit_sha(rev) for rev in revisions]
+    # init points main at the all-zero SHA until the first commit
+    start_commits = [commit_sha for commit_sha in start_commits if commit_sha and commit_sha != "0" * 40]
+    if not start_commits:
+        print("No commits yet.")
+        return
+
+    for commit_sha in iter_log(start_commits, **options):
+        print_commit(load_typed_object(commit_sha, Commit))
+        print()
+
+def myers_bisect(a, a_lo, a_hi, b, b_lo, b_hi):
+    """
+    Find the middle snake of a shortest edit script between a[a_lo:a_hi] and
+    b[b_lo:b_hi] by running Myers' greedy search from both ends at once. Only two
+    diagonal vectors are kept, so memory is O(N + M). Returns the split point
+    (x, y) where the two searches meet, or None if the ranges share no line.
+    """
+    n = a_hi - a_lo
+    m = b_hi - b_lo
+    max_d = (n + m + 1) // 2
+    offset = max_d
+    forward = [-1] * (2 * max_d + 2)
+    forward[offset + 1] = 0
+    backward = forward[:]
+    delta = n - m
+    # With an odd delta the paths meet during a forward step, otherwise a backward one
+    odd = delta % 2 != 0
+    k1_start = k1_end = k2_start = k2_end = 0
+
+    for d in range(max_d):
+        for k1 in range(-d + k1_start, d + 1 - k1_end, 2):
+            if k1 == -d or (k1 != d and forward[offset + k1 - 1] < forward[offset + k1 + 1]):
+                x1 = forward[offset + k1 + 1]
+            else:
+                x1 = forward[offset + k1 - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[a_lo + x1] == b[b_lo + y1]:
+                x1 += 1
+                y1 += 1
+            forward[offset + k1] = x1
+            if x1 > n:
+                k1_end += 2  # Ran off the right edge
+            elif y1 > m:
+                k1_start += 2  # Ran off the bottom edge
+            elif odd:
+                k2 = offset + delta - k1
+                if 0 <= k2 < len(backward) and backward[k2] != -1 and x1 >= n - backward[k2]:
+                    return a_lo + x1, b_lo + y1
+
+        for k2 in range(-d + k2_start, d + 1 - k2_end, 2):
+            if k2 == -d or (k2 != d and backward[offset + k2 - 1] < backward[offset + k2 + 1]):
+                x2 = backward[offset + k2 + 1]
+            else:
+                x2 = backward[offset + k2 - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[a_hi - 1 - x2] == b[b_hi - 1 - y2]:
+                x2 += 1
+                y2 += 1
+            backward[offset + k2] = x2
+            if x2 > n:
+                k2_end += 2
+            elif y2 > m:
+                k2_start += 2
+            elif not odd:
+                k1 = offset + delta - k2
+                if 0 <= k1 < len(forward) and forward[k1] != -1:
+                    x1 = forward[k1]
+                    if x1 >= n - x2:
+                        return a_lo + x1, b_lo + x1 - (k1 - offset)
+    return None
+
+def myers_matches(a, b):
+    """
+    Return {index in b: index in a} for the lines a minimal (Myers) diff keeps
+    unchanged. The ranges are split at middle snakes instead of storing the full
+    edit graph, so memory stays linear in the input size.
+    """
+    matches = {}
+    ranges = [(0, len(a), 0, len(b))]
+    while ranges:
+        a_lo, a_hi, b_lo, b_hi = ranges.pop()
+        # Common prefix and suffix match without any search
+        while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+            matches[b_lo] = a_lo
+            a_lo += 1
+            b_lo += 1
+        while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+            a_hi -= 1
+            b_hi -= 1
+            matches[b_hi] = a_hi
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+        split = myers_bisect(a, a_lo, a_hi, b, b_lo, b_hi)
+        if split is not None:
+            x, y = split
+            ranges.append((a_lo, x, b_lo, y))
+            ranges.append((x, a_hi, y, b_hi))
+    return matches
+
+def blame_file(start_commit, path):
+    """
+    Return (commit SHA, line) for every line of path as of start_commit, naming the
+    commit that last changed the line.
+
+    Lines are handed from a commit to its parents through a commit-date queue. If
+    a parent's tree entry for the path has the same blob SHA, every line moves to
+    that parent without reading either blob; otherwise the blobs are diffed and
+    only the unchanged lines move. A line stays with the commit once no parent has
+    it, and the walk ends as soon as every line is attributed, so history older
+    than the file's last change to each line is never read.
+    """
+    entry = tree_path_entry(get_commit_info(start_commit)["tree"], path)
+    if entry is None or entry[0].startswith("4"):
+        raise RuntimeError(f"No such file {path} in {start_commit}")
+
+    lines = load_typed_object(entry[1], Blob).data.splitlines(keepends=True)
+    owners = [None] * len(lines)
+
+    # commit -> (blob SHA, {line in that blob: [final line numbers]})
+    suspects = {start_commit: (entry[1], {number: [number] for number in range(len(lines))})}
+    queue = [(-get_commit_info(start_commit)["time"], start_commit)]
+
+    def hand_to(parent, blob_sha, parent_line, final_lines):
+        if parent not in suspects:
+            suspects[parent] = (blob_sha, {})
+            heapq.heappush(queue, (-get_commit_info(parent)["time"], parent))
+        suspects[parent][1].setdefault(parent_line, []).extend(final_lines)
+
+    while queue:
+        _, commit_sha = heapq.heappop(queue)
+        blob_sha, pending = suspects.pop(commit_sha)
+        perf_count("commits_walked")
+
+        parent_entries = []
+        for parent in get_commit_info(commit_sha)["parents"]:
+            parent_entry = tree_path_entry(get_commit_info(parent)["tree"], path)
+            if parent_entry is not None and not parent_entry[0].startswith("4"):
+                parent_entries.append((parent, parent_entry[1]))
+
+        unchanged = next((parent for parent, parent_blob in parent_entries if parent_blob == blob_sha), None)
+        if unchanged is not None:
+            # Same blob: pass everything on without diffing
+            for line, final_lines in pending.items():
+                hand_to(unchanged, blob_sha, line, final_lines)
+            continue
+
+        if parent_entries:
+            blob_lines = load_typed_object(blob_sha, Blob).data.splitlines(keepends=True)
+            for parent, parent_blob in parent_entries:
+                if not pending:
+                    break
+                parent_lines = load_typed_object(parent_blob, Blob).data.splitlines(keepends=True)
+                matches = myers_matches(parent_lines, blob_lines)
+                perf_count("blame_diffs")
+                for line in [line for line in pending if line in matches]:
+                    hand_to(parent, parent_blob, matches[line], pending.pop(line))
+
+        for final_lines in pending.values():
+            for number in final_lines:
+                owners[number] = commit_sha
+
+    return list(zip(owners, lines))
+
+def show_blame(args):
+    """
+    blame [<branch>|<commit>] <path>: print each line of the file with the commit,
+    author and date that last changed it.
+    """
+    if len(args) not in (1, 2):
+        raise RuntimeError("Usage: blame [<branch>|<commit>] <path>")
+    if len(args) == 2:
+        revision = args[0]
+    else:
+        revision = get_head_branch()
+        if revision is None:
+            with open(".git/HEAD", "r") as f:
+                revision = f.read().strip()
+    start_commit = revision if re.fullmatch(r"[0-9a-f]{40}", revision) else get_commit_sha(revision)
+
+    authors = {}
+    for number, (commit_sha, line) in enumerate(blame_file(start_commit, args[-1]), 1):
+        if commit_sha not in authors:
+            # "Name <email> timestamp timezone"
+            author = load_typed_object(commit_sha, Commit).author or ""
+            name, _, rest = author.partition(" <")
+            timestamp = rest.rsplit(" ", 2)[-2] if rest.count(" ") >= 2 else "0"
+            authors[commit_sha] = f"{name} {time.strftime('%Y-%m-%d', time.localtime(int(timestamp)))}"
+        text = line.decode(errors="replace").rstrip("\n")
+        print(f"{commit_sha[:8]} ({authors[commit_sha]} {number:>4}) {text}")
+
+def create_branch(branch_name, start_commit_sha):
+    if read_ref(f"refs/heads/{branch_name}") is not None:
+        raise RuntimeError(f"Branch {branch_name} already exists.")
+
+    write_ref(f"refs/heads/{branch_name}", start_commit_sha)
+        
+def iter_tree_diff(old_tree_sha, new_tree_sha, prefix="", removals_first=True):
+    """
+    Yield (path, old_entry, new_entry) for every file that differs between two trees,
+    where an entry is (mode, sha) or None when the path is absent on that side.
+    Subtrees with equal SHAs are skipped without being read, so the cost scales with
+    the size of the change. Paths come in Git's tree order (a directory sorts as
+    "name/"). When a directory is replaced by a file, the files under it are yielded
+    before the new file if removals_first is set, so they can be applied in order;
+    otherwise the file comes first, as in git diff.
+    """
+    if old_tree_sha == new_tree_sha:
+        return
+
+    old_entries = {name: (mode, sha) for mode, name, sha in parse_tree_object(old_tree_sha)} if old_tree_sha else {}
+    new_entries = {name: (mode, sha) for mode, name, sha in parse_tree_object(new_tree_sha)} if new_tree_sha else {}
+
+    def tree_order(name):
+        entries = [entry for entry in (old_entries.get(name), new_entries.get(name)) if entry is not None]
+        return name + "/" if all(mode.startswith("4") for mode, _ in entries) else name
+
+    for name in sorted(old_entries.keys() | new_entries.keys(), key=tree_order):
+        old = old_entries.get(name)
+        new = new_entries.get(name)
+        if old == new:
+            continue
+
+        path = prefix + name
+        old_is_tree = old is not None and old[0].startswith("4")
+        new_is_tree = new is not None and new[0].startswith("4")
+
+        if old_is_tree and new_is_tree:
+            yield from iter_tree_diff(old[1], new[1], path + "/", removals_first)
+            continue
+
+        # A directory replaced by a file (or removed) is emptied
+        if old_is_tree:
+            if new is not None and not removals_first:
+                yield (path, None, new)
+                new = None
+            yield from iter_tree_diff(old[1], None, path + "/", removals_first)
+            old = None
+
+        if new_is_tree:
+            if old is not None:
+                yield (path, old, None)
+            yield from iter_tree_diff(None, new[1], path + "/", removals_first)
+        elif old is not None or new is not None:
+            yield (path, old, new)
+
+def resolve_tree_sha(object_sha):
+    """
+    Return the tree SHA for a tree or commit SHA.
+    """
+    obj = load_object(object_sha)
+    if isinstance(obj, Tree):
+        return object_sha
+    if isinstance(obj, Commit):
+        return obj.tree
+    raise RuntimeError(f"Unexpected object type: {obj.type_name}")
+
+def diff_trees(tree_sha1, tree_sha2):
+    """
+    Yield (status, path) for every added ("A"), deleted ("D") or modified ("M") file
+    between two trees or commits. Only subtrees whose SHAs differ are read, and
+    results are produced as they are found so large diffs can be streamed.
+    """
+    old_tree_sha, new_tree_sha = resolve_tree_sha(tree_sha1), resolve_tree_sha(tree_sha2)
+    for path, old, new in iter_tree_diff(old_tree_sha, new_tree_sha, removals_first=False):
+        if old is None:
+            yield "A", path
+        elif new is None:
+            yield "D", path
+        else:
+            yield "M", path
+
+def compare_trees(tree_sha1, tree_sha2):
+    """
+    Compare two tree objects and return the full list of changed paths
+    as (status, path) tuples.
+    """
+    return list(diff_trees(tree_sha1, tree_sha2))
+
+def create_object(object_type, data):
+    """
+    Create an object of the given type and return its SHA.
+    This function will:
+    - Compress the object data using zlib.
+    - Store the compressed data in the .git/objects directory.
+    - Return the SHA-1 hash of the object.
+    """
+    # The SHA covers the uncompressed "<type> <size>\0" header and data
+    return hash_object_tree(data, object_type)
+
+def create_tree_object(entries):
+    """
+    Create a new tree object from (mode, name, sha) entries and return its SHA.
+    Entries are sorted by name, the same order write_tree uses.
+    """
+    tree = Tree([
+        TreeEntry.create(mode, name, sha)
+        for mode, name, sha in sorted(entries, key=lambda entry: entry[1])
+    ])
+
+    # Create the tree object and return its SHA
+    return store_object(tree)
+
+@trace_phase("merge_base")
+def find_merge_base(commit1, commit2):
     """
-    Extract the parent commit SHA from commit data.
-    Return None if no parent exists.
+    Find the best common ancestor of two commits. Commits are visited highest
+    generation first, then newest first. Commits the commit-graph doesn't cover
+    count as having an infinite generation, as in Git: the graph holds every
+    ancestor of its commits, so an uncovered commit is never an ancestor of a
+    covered one. The walk stops as soon as every commit left to visit is below a
+    common ancestor, so it never goes deeper in history than it has to. Returns
+    None if unrelated.
     """
-    lines = commit_data.decode().split("\n")
-    for line in lines:
-        if line.startswith("parent "):
-            return line.split()[1]
-    return None  # No parent found
+    if commit1 == commit2:
+        return commit1
+
+    PARENT1, PARENT2, STALE = 1, 2, 4
+    infos = {}
+
+    def info(commit_sha):
+        if commit_sha not in infos:
+            infos[commit_sha] = get_commit_info(commit_sha)
+        return infos[commit_sha]
+
+    def priority(commit_sha):
+        commit_info = info(commit_sha)
+        generation = commit_info["generation"]
+        return (-(math.inf if generation is None else generation), -commit_info["time"], commit_sha)
+
+    flags = {commit1: PARENT1, commit2: PARENT2}
+    queue = [priority(commit1), priority(commit2)]
+    heapq.heapify(queue)
+    # Queue entries per commit, and how many entries belong to commits not yet stale
+    queued = {commit1: 1, commit2: 1}
+    unfinished = 2
+    candidates = []
+
+    while unfinished:
+        commit_sha = heapq.heappop(queue)[2]
+        queued[commit_sha] -= 1
+        commit_flags = flags[commit_sha]
+        if not commit_flags & STALE:
+            unfinished -= 1
+        if commit_flags & (PARENT1 | PARENT2) == PARENT1 | PARENT2 and not commit_flags & STALE:
+            # Reachable from both sides: a candidate, and everything below it is stale
+            candidates.append(commit_sha)
+            commit_flags |= STALE
+            flags[commit_sha] = commit_flags
+            unfinished -= queued[commit_sha]
+
+        for parent in info(commit_sha)["parents"]:
+            parent_flags = flags.get(parent, 0)
+            if parent_flags | commit_flags == parent_flags:
+                continue
+            try:
+                entry = priority(parent)
+            except RuntimeError:
+                continue  # Missing history (e.g. beyond a shallow boundary)
+            if commit_flags & STALE and not parent_flags & STALE:
+                unfinished -= queued.get(parent, 0)
+            flags[parent] = parent_flags | commit_flags
+            heapq.heappush(queue, entry)
+            queued[parent] = queued.get(parent, 0) + 1
+            if not flags[parent] & STALE:
+                unfinished += 1
+
+    # With skewed commit dates a candidate can be found before a descendant of it
+    # that is also a candidate; like Git, keep only candidates that aren't redundant
+    for candidate in candidates:
+        if not any(other != candidate and is_ancestor(candidate, other, info) for other in candidates):
+            return candidate
+    return None
+
+def is_ancestor(ancestor, descendant, info=get_commit_info):
+    """
+    Return True if ancestor is reachable from descendant. When the commit-graph
+    covers ancestor, commits with a lower generation number can't lead to it and
+    aren't walked.
+    """
+    min_generation = info(ancestor)["generation"] or 0
+    seen = {descendant}
+    stack = [descendant]
+    while stack:
+        commit_sha = stack.pop()
+        if commit_sha == ancestor:
+            return True
+        for parent in info(commit_sha)["parents"]:
+            if parent in seen:
+                continue
+            seen.add(parent)
+            try:
+                generation = info(parent)["generation"]
+            except RuntimeError:
+                continue  # Missing history (e.g. beyond a shallow boundary)
+            if generation is None or generation >= min_generation:
+                stack.append(parent)
+    return False
 
-def get_commit_tree(commit_sha):
+def merge_blob_contents(base, ours, theirs):
     """
-    Retrieve the tree SHA from a commit object.
+    Three-way merge of file contents line by line. Changes that don't overlap are
+    combined; overlapping changes that differ become conflict regions.
+    Returns (merged bytes, conflict count). Binary content is never line-merged.
     """
-    if not isinstance(commit_sha, str):
-        raise TypeError(f"Expected commit_sha to be a string, got {type(commit_sha)}")
+    if any(content is not None and is_binary_content(content) for content in (base, ours, theirs)):
+        return None, 1
 
-    if not (len(commit_sha) == 40 and all(c in "0123456789abcdef" for c in commit_sha)):
-        raise ValueError(f"Invalid SHA format: {commit_sha}. Must be a 40-character hexadecimal string.")
+    base_lines = base.splitlines(keepends=True) if base else []
+    our_lines = ours.splitlines(keepends=True)
+    their_lines = theirs.splitlines(keepends=True)
 
-    commit_data = get_object_content(commit_sha)
+    def hunks(new_lines, side):
+        matcher = difflib.SequenceMatcher(None, base_lines, new_lines, autojunk=False)
+        return [(i1, i2, new_lines[j1:j2], side)
+                for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"]
 
-    # Inspect raw commit data as bytes before decoding
-    print(f"Raw commit data for {commit_sha} (first 100 bytes): {commit_data[:100]}")
+    changes = sorted(hunks(our_lines, 0) + hunks(their_lines, 1), key=lambda hunk: (hunk[0], hunk[1]))
 
-    # Try to decode commit data with fallback
-    try:
-        commit_data = safe_decode(commit_data)
-    except UnicodeDecodeError as e:
-        raise RuntimeError(f"Failed to decode commit data for SHA {commit_sha}: {e}")
-    
-    print(f"Decoded commit data for {commit_sha} (first 200 chars):\n{commit_data[:200]}")
+    merged = []
+    conflicts = 0
+    pos = 0
+    i = 0
+    while i < len(changes):
+        # Group changes whose base ranges overlap or touch
+        start, end = changes[i][0], changes[i][1]
+        cluster = [changes[i]]
+        i += 1
+        while i < len(changes) and changes[i][0] <= end:
+            end = max(end, changes[i][1])
+            cluster.append(changes[i])
+            i += 1
+
+        def apply(side):
+            out = []
+            cursor = start
+            for hunk_start, hunk_end, lines, hunk_side in cluster:
+                if hunk_side == side:
+                    out.extend(base_lines[cursor:hunk_start])
+                    out.extend(lines)
+                    cursor = hunk_end
+            out.extend(base_lines[cursor:end])
+            return out
+
+        merged.extend(base_lines[pos:start])
+        original = base_lines[start:end]
+        our_version = apply(0)
+        their_version = apply(1)
+        if our_version == original or our_version == their_version:
+            merged.extend(their_version)
+        elif their_version == original:
+            merged.extend(our_version)
+        else:
+            conflicts += 1
+            merged.append(b"<<<<<<< ours\n")
+            merged.extend(our_version)
+            merged.append(b"=======\n")
+            merged.extend(their_version)
+            merged.append(b">>>>>>> theirs\n")
+        pos = end
+
+    merged.extend(base_lines[pos:])
+    return b"".join(merged), conflicts
+
+def merge_trees(base_tree, ours_tree, theirs_tree, prefix=""):
+    """
+    Three-way merge of tree objects. Subtrees that are identical on both sides (or
+    unchanged on one side) are taken as-is without being read, so the cost follows
+    what actually changed. Returns (merged tree SHA, list of conflicting paths).
+    """
+    # Short-circuit whole subtrees
+    if ours_tree == theirs_tree or base_tree == theirs_tree:
+        return ours_tree, []
+    if base_tree == ours_tree:
+        return theirs_tree, []
+
+    def read_entries(tree_sha):
+        if tree_sha is None:
+            return {}
+        return {name: (mode, sha) for mode, name, sha in parse_tree_object(tree_sha)}
+
+    base_entries = read_entries(base_tree)
+    our_entries = read_entries(ours_tree)
+    their_entries = read_entries(theirs_tree)
+
+    merged = []
+    conflicts = []
+    for name in sorted(base_entries.keys() | our_entries.keys() | their_entries.keys()):
+        base, ours, theirs = base_entries.get(name), our_entries.get(name), their_entries.get(name)
+        path = prefix + name
+
+        # Trivial cases: one side unchanged, or both made the same change
+        if ours == theirs or base == theirs:
+            result = ours
+        elif base == ours:
+            result = theirs
+        elif ours is not None and theirs is not None and ours[0].startswith("4") and theirs[0].startswith("4"):
+            # Both sides changed a directory: merge it recursively
+            base_subtree = base[1] if base is not None and base[0].startswith("4") else None
+            subtree_sha, subtree_conflicts = merge_trees(base_subtree, ours[1], theirs[1], path + "/")
+            conflicts.extend(subtree_conflicts)
+            result = ("40000", subtree_sha)
+        elif (ours is not None and theirs is not None
+              and not ours[0].startswith("4") and not theirs[0].startswith("4")):
+            # Both sides changed a file: try a line-level merge
+            base_content = load_typed_object(base[1], Blob).data if base is not None and not base[0].startswith("4") else None
+            merged_content, conflict_count = merge_blob_contents(
+                base_content, load_typed_object(ours[1], Blob).data, load_typed_object(theirs[1], Blob).data)
+            if conflict_count:
+                conflicts.append(path)
+                result = ours
+            else:
+                mode = theirs[0] if base is not None and base[0] == ours[0] else ours[0]
+                result = (mode, hash_object_tree(merged_content, obj_type="blob"))
+        else:
+            # Modify/delete or file/directory conflicts can't be resolved automatically
+            conflicts.append(path)
+            result = ours
 
-    # Adjust the regex to capture potential garbage or additional characters
-    match = re.search(r'\b(tree [0-9a-f]{40})\b', commit_data)
-    if match:
-        tree_sha = match.group(1).split()[1]
-        print(f"Found tree SHA for {commit_sha}: {tree_sha}")
+        if result is not None:
+            merged.append((result[0], name, result[1]))
 
-        if not (len(tree_sha) == 40 and all(c in "0123456789abcdef" for c in tree_sha)):
-            raise RuntimeError(f"Invalid tree SHA found in commit data: {tree_sha}")
-        
-        return tree_sha
+    return create_tree_object(merged), conflicts
+
+def merge_branches(target_branch, source_branch):
+    """
+    Merge source_branch into target_branch. Finds the merge base, fast-forwards when
+    possible, and otherwise three-way merges the trees and records a merge commit
+    with both parents. If the target branch is checked out, the working tree is
+    updated to match. Conflicts abort the merge without changing anything.
+    """
+    target_commit = get_commit_sha(target_branch)
+    source_commit = get_commit_sha(source_branch)
 
-    raise RuntimeError(f"Invalid commit format for SHA {commit_sha}. No 'tree' entry found.")
+    base_commit = find_merge_base(target_commit, source_commit)
+    if base_commit == source_commit:
+        print("Already up to date.")
+        return None
+
+    target_tree = get_commit_info(target_commit)["tree"]
+    if base_commit == target_commit:
+        # Fast-forward: the target has nothing the source doesn't
+        new_commit_sha = source_commit
+        merged_tree = get_commit_info(source_commit)["tree"]
+        print(f"Fast-forward to {new_commit_sha}")
+    else:
+        base_tree = get_commit_info(base_commit)["tree"] if base_commit else None
+        source_tree = get_commit_info(source_commit)["tree"]
+        with trace_phase("merge_trees"), object_batch():
+            merged_tree, conflicts = merge_trees(base_tree, target_tree, source_tree)
+        if conflicts:
+            print("Conflicts detected during merge.")
+            for path in conflicts:
+                print(f"CONFLICT: {path}")
+            return None
+        new_commit_sha = None
+
+    # Bring the working tree along before moving the branch
+    if get_head_branch() == target_branch:
+        checkout_tree(target_tree, merged_tree)
+
+    if new_commit_sha is None:
+        new_commit_sha = create_commit_object(
+            merged_tree, [target_commit, source_commit],
+            f"Merge branch '{source_branch}' into {target_branch}", target_branch)
+        print(f"Merged commit: {new_commit_sha}")
+    else:
+        write_ref(f"refs/heads/{target_branch}", new_commit_sha)
+    return new_commit_sha
 
-def safe_decode(data):
+def get_head_commit():
     """
-    Try to decode data safely. If decoding fails, fallback to ignoring invalid bytes.
+    Return the commit SHA that HEAD points to, or None if there is no commit yet.
     """
-    # First, try using chardet to detect the encoding
-    detected = chardet.detect(data)
-    encoding = detected['encoding']
-    if encoding:
-        try:
-            # Decode using the detected encoding
-            return data.decode(encoding)
-        except (UnicodeDecodeError, TypeError):
-            pass
-    
-    # Fallback: try to decode using UTF-8 and ignore invalid characters
     try:
-        return data.decode('utf-8', errors='ignore')
-    except UnicodeDecodeError as e:
-        raise RuntimeError(f"Failed to decode data with fallback: {e}")
+        with open(".git/HEAD", "r") as f:
+            head_content = f.read().strip()
+    except FileNotFoundError:
+        return None
 
-def show_commit_history(branch_name="main"):
+    if head_content.startswith("ref:"):
+        head_content = read_ref(head_content.split(" ", 1)[1])
+
+    if not head_content or head_content == "0" * 40:
+        return None
+    return head_content
+
+def get_head_branch():
     """
-    Display the commit history of a branch.
+    Return the branch name HEAD points to, or None for a detached HEAD.
     """
     try:
-        commit_sha = get_commit_sha(branch_name)
-        while commit_sha:
-            commit_data = get_object_content(commit_sha)
-            print_commit(commit_data)
-            commit_sha = get_parent_commit_sha(commit_data)
+        with open(".git/HEAD", "r") as f:
+            head_content = f.read().strip()
     except FileNotFoundError:
-        print(f"Branch '{branch_name}' does not exist.")
-    except RuntimeError as e:
-        print(f"Error: {e}")
+        return None
+    if head_content.startswith("ref: refs/heads/"):
+        return head_content[len("ref: refs/heads/"):]
+    return None
 
-def print_commit(commit_data):
+def compute_blob_sha(file_path, st=None):
+    """
+    Compute a file's blob SHA in fixed-size chunks without writing an object. When
+    st (from lstat) says the path is a symlink, the blob is the link target.
+    """
+    if st is not None and stat.S_ISLNK(st.st_mode):
+        target = os.fsencode(os.readlink(file_path))
+        return hashlib.sha1(f"blob {len(target)}\0".encode() + target).hexdigest()
+    with open(file_path, "rb") as f:
+        sha1 = hashlib.sha1(f"blob {os.fstat(f.fileno()).st_size}\0".encode())
+        for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def worktree_file_matches(index, path, blob_sha):
+    """
+    Check whether a working-tree file holds the given blob, trusting the index's
+    stat data before falling back to hashing the file.
+    """
     try:
-        lines = commit_data.decode().split("\n")
-        commit_info = {
-            "Commit": "(unknown)",
-            "Tree": "(unknown)",
-            "Parent": "(none)",
-            "Author": "(unknown)",
-            "Committer": "(unknown)",
-            "Message": "(No commit message provided)",
-        }
-        
-        # Parse known prefixes
-        for line in lines:
-            if line.startswith("tree"):
-                commit_info["Tree"] = line.split()[1]
-            elif line.startswith("parent"):
-                commit_info["Parent"] = line.split()[1]
-            elif line.startswith("author"):
-                commit_info["Author"] = " ".join(line.split()[1:])
-            elif line.startswith("committer"):
-                commit_info["Committer"] = " ".join(line.split()[1:])
-            elif not line.strip():  # Empty line indicates message follows
-                message_index = lines.index(line) + 1
-                commit_info["Message"] = "\n".join(lines[message_index:]).strip()
-                break
-        
-        # Display parsed data
-        print(f"Commit: {commit_info['Commit']}")
-        print(f"Tree: {commit_info['Tree']}")
-        print(f"Parent: {commit_info['Parent']}")
-        print(f"Author: {commit_info['Author']}")
-        print(f"Committer: {commit_info['Committer']}")
-        print(f"Message: {commit_info['Message']}")
-    except Exception as e:
-        print(f"Error parsing commit: {e}")
-        raise RuntimeError("Malformed commit data.")
-
-def create_branch(branch_name, start_commit_sha):
-    branch_path = f".git/refs/heads/{branch_name}"
-    if os.path.exists(branch_path):
-        raise RuntimeError(f"Branch {branch_name} already exists.")
-    
-    with open(branch_path, "w") as f:
-        f.write(start_commit_sha)
-        
-def get_tree_entries(tree_sha):
+        perf_count("files_stated")
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return False
+    if not is_worktree_file(st):
+        return False
+    fresh_sha = index_entry_is_fresh(index, path, st)
+    if fresh_sha is not None:
+        return fresh_sha == blob_sha
+    return compute_blob_sha(path, st) == blob_sha
+
+def write_worktree_file(path, mode, blob_sha):
     """
-    Retrieve the entries from a tree object.
+    Write a blob to the working tree, honouring executable and symlink modes.
+    Chunked blobs are written chunk by chunk.
     """
-    tree_data = get_object_content(tree_sha)
-    entries = []
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    if os.path.lexists(path):
+        os.remove(path)
+
+    if mode == "120000":
+        os.symlink(load_typed_object(blob_sha, Blob).data, path)
+        return
+    with open(path, "wb") as f:
+        for data in iter_blob_data(blob_sha):
+            f.write(data)
+    if mode == "100755":
+        os.chmod(path, 0o755)
+
+@trace_phase("checkout")
+def checkout_tree(old_tree_sha, new_tree_sha):
+    """
+    Move the working tree from one tree to another, writing only added or modified
+    files and unlinking removed ones. Refuses to overwrite local changes.
+    Returns (files written, files removed).
+    """
+    index = read_index()
+    changes = list(iter_tree_diff(old_tree_sha, new_tree_sha))
 
-    # A tree object is a list of <mode> <sha> <file_name>
-    lines = tree_data.split(b'\n')
-    for line in lines:
-        parts = line.split(b' ')
-        if len(parts) == 3:
-            entry = {'mode': parts[0], 'sha': parts[1], 'name': parts[2].decode()}
-            entries.append(entry)
-    
-    return entries
+    # Check every path before touching anything so a refusal leaves the tree intact
+    for path, old, new in changes:
+        if not os.path.lexists(path) or os.path.isdir(path):
+            continue
+        if old is not None and worktree_file_matches(index, path, old[1]):
+            continue
+        if new is not None and worktree_file_matches(index, path, new[1]):
+            continue
+        raise RuntimeError(f"Your local changes to '{path}' would be overwritten by checkout.")
+
+    written = removed = 0
+    for path, old, new in changes:
+        if new is None:
+            if os.path.lexists(path):
+                os.remove(path)
+                removed += 1
+            index["entries"].pop(path, None)
+            invalidate_cache_tree(index, path)
+            index["changed"] = True
+            # Remove directories that became empty
+            parent = os.path.dirname(path)
+            if parent:
+                try:
+                    os.removedirs(parent)
+                except OSError:
+                    pass
+        else:
+            write_worktree_file(path, new[0], new[1])
+            update_index(index, path, new[1], os.lstat(path))
+            written += 1
 
-def compare_trees(tree_sha1, tree_sha2):
+    if index["changed"]:
+        write_index(index)
+    return written, removed
+
+def checkout(branch_name):
     """
-    Compare two tree objects and return a diff or conflict report.
+    Switches to the specified branch by updating HEAD and the working directory.
+    Only the files that differ between the current and target trees are touched.
     """
-    # Parse the tree objects and get their entries
-    entries1 = parse_commit(tree_sha1)
-    entries2 = parse_commit(tree_sha2)
-
-    diff = []
-    # Create dictionaries using filenames as keys for easy comparison
-    set1 = {entry[1]: entry for entry in entries1}  # Using file names as keys
-    set2 = {entry[1]: entry for entry in entries2}
+    # Get the commit SHA of the branch
+    commit_sha = get_commit_sha(branch_name)
 
-    # Check for conflicts between two trees
-    for file_name, entry in set1.items():
-        if file_name not in set2:
-            diff.append(f"File {file_name} exists only in tree1")
-        elif entry[2] != set2[file_name][2]:  # Different SHA means conflict
-            diff.append(f"Conflict: {file_name} differs in both trees")
+    # Diff the tree currently checked out against the target tree
+    head_commit = get_head_commit()
+    old_tree = get_commit_tree(head_commit) if head_commit else None
+    new_tree = get_commit_tree(commit_sha) if commit_sha != "0" * 40 else None
+    written, removed = checkout_tree(old_tree, new_tree)
 
-    for file_name, entry in set2.items():
-        if file_name not in set1:
-            diff.append(f"File {file_name} exists only in tree2")
+    # Update HEAD to point to the new branch
+    with open(".git/HEAD", "w") as f:
+        f.write(f"ref: refs/heads/{branch_name}\n")
 
-    return diff
+    print(f"Switched to branch '{branch_name}'")
+    print(f"Updated {written} files, removed {removed} files")
 
-def create_object(object_type, data):
+def get_branch_commit_hash(branch_name):
     """
-    Create an object of the given type and return its SHA.
-    This function will:
-    - Compress the object data using zlib.
-    - Store the compressed data in the .git/objects directory.
-    - Return the SHA-1 hash of the object.
+    Retrieve the commit hash for the latest commit in a given branch.
+    The branch may be a loose ref or an entry in packed-refs.
     """
-    # Create the object data (including the type and length prefix)
-    object_data = f"{object_type} {len(data)}\0".encode() + data
+    commit_sha = read_ref(f"refs/heads/{branch_name}")
 
-    # Compress the object data using zlib
-    compressed_data = zlib.compress(object_data)
+    # Check if the branch exists
+    if commit_sha is None:
+        raise ValueError(f"Branch '{branch_name}' not found.")
 
-    # Calculate the SHA-1 hash of the compressed data
-    object_sha = hashlib.sha1(compressed_data).hexdigest()
+    return commit_sha
 
-    # Get the directory and file path where the object will be stored
-    obj_dir = f".git/objects/{object_sha[:2]}"
-    obj_file = f"{obj_dir}/{object_sha[2:]}"
+# Client-side fsmonitor state for this command: the daemon's token, how far into its
+# log we have read, and the paths that are dirty as of that point
+_fsmonitor = None
 
-    # Create the directory if it doesn't exist
-    os.makedirs(obj_dir, exist_ok=True)
+def read_pid_file(pid_path):
+    """
+    Return the pid recorded in pid_path if that process is still running, or None.
+    """
+    try:
+        with open(pid_path, "r") as f:
+            pid = int(f.read().strip())
+        os.kill(pid, 0)
+        return pid
+    except (FileNotFoundError, ValueError, ProcessLookupError, PermissionError):
+        return None
+
+def write_pid_file(pid_path):
+    with open(pid_path + ".lock", "w") as f:
+        f.write(str(os.getpid()))
+    os.replace(pid_path + ".lock", pid_path)
+
+def start_background_process(name, run, pid_path):
+    """
+    Run a daemon function detached from the terminal (double fork, new session,
+    stdio on /dev/null) and wait until it has written its pid file, which it does
+    once it is ready to serve.
+    """
+    if not os.path.isdir(".git"):
+        raise RuntimeError(f"{name} must be started from the top of the working tree")
+    pid = read_pid_file(pid_path)
+    if pid is not None:
+        print(f"{name} is already running (pid {pid})")
+        return
+
+    if os.fork() == 0:
+        os.setsid()
+        if os.fork() == 0:
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+            try:
+                run()
+            finally:
+                # Skip the CLI's atexit handlers
+                os._exit(0)
+        os._exit(0)
+
+    deadline = time.monotonic() + DAEMON_START_TIMEOUT
+    while time.monotonic() < deadline:
+        pid = read_pid_file(pid_path)
+        if pid is not None:
+            print(f"{name} started (pid {pid})")
+            return
+        time.sleep(0.01)
+    raise RuntimeError(f"{name} did not start")
+
+def stop_background_process(name, pid_path):
+    pid = read_pid_file(pid_path)
+    if pid is None:
+        print(f"{name} is not running")
+        return
+    os.kill(pid, signal.SIGTERM)
+    deadline = time.monotonic() + DAEMON_START_TIMEOUT
+    while time.monotonic() < deadline and read_pid_file(pid_path) is not None:
+        time.sleep(0.01)
+    print(f"{name} stopped (pid {pid})")
+
+def fsmonitor_pid():
+    return read_pid_file(FSMONITOR_PID_PATH)
+
+def fsmonitor_daemon():
+    """
+    Watch every non-ignored directory of the working tree with inotify and append
+    the path of each changed file to the log. Directory events are logged as "dir/"
+    (everything under it may have changed), "*" means the kernel queue overflowed
+    or ignore rules changed and clients must rescan, and "cookie <name>" echoes a
+    client's sync cookie. The log starts with a token unique to this daemon.
+
+    Once the log has grown by FSMONITOR_LOG_LIMIT it is replaced by a compacted one
+    with a new token, a "previous <token>" line and each path the old log named, once.
+    Clients that were reading the old log read the new one from the top, which
+    tells them about every path they might have missed.
+    """
+    import ctypes
+    import ctypes.util
 
-    # Write the compressed data to the object file
-    with open(obj_file, "wb") as f:
-        f.write(compressed_data)
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    inotify_fd = libc.inotify_init1(IN_CLOEXEC)
+    if inotify_fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
 
-    # Return the SHA of the created object
-    return object_sha
+    ignored_files = read_gitignore()
+    watches = {}
+
+    def add_watches(directory):
+        # Watch a directory and everything below it that isn't ignored
+        pending = [directory]
+        while pending:
+            current = pending.pop()
+            wd = libc.inotify_add_watch(inotify_fd, os.fsencode(current or "."), FSMONITOR_WATCH_MASK)
+            if wd < 0:
+                continue
+            watches[wd] = current
+            try:
+                with os.scandir(current or ".") as scan:
+                    for dir_entry in scan:
+                        if not dir_entry.is_dir(follow_symlinks=False) or dir_entry.name == ".git":
+                            continue
+                        path = f"{current}/{dir_entry.name}" if current else dir_entry.name
+                        if not is_ignored(path, ignored_files, is_dir=True, check_parents=False):
+                            pending.append(path)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
 
-def create_tree_object(entries):
-    """
-    Create a new tree object and return its SHA.
-    """
-    tree_data = b''
-    for entry in entries:
-        tree_data += f"{entry['mode']} {entry['sha']} {entry['name']}".encode() + b'\n'
+    add_watches("")
+    # .git itself is only watched for sync cookies
+    git_wd = libc.inotify_add_watch(inotify_fd, b".git", IN_CREATE)
 
-    # Create the tree object and return its SHA
-    return create_object("tree", tree_data)
+    log = open(FSMONITOR_LOG_PATH, "w", buffering=1)
+    token = f"token {os.getpid()}-{time.time_ns()}"
+    log.write(f"{token}\n")
+    logged = set()
+    base_size = log.tell()
+    write_pid_file(FSMONITOR_PID_PATH)
+
+    def shutdown(signum, frame):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, shutdown)
 
-def merge_trees(target_tree, source_tree):
+    try:
+        while True:
+            data = os.read(inotify_fd, 64 * 1024)
+            lines = []
+            pos = 0
+            while pos < len(data):
+                wd, mask, _, name_len = FSMONITOR_EVENT_FORMAT.unpack_from(data, pos)
+                name = data[pos + FSMONITOR_EVENT_FORMAT.size:pos + FSMONITOR_EVENT_FORMAT.size + name_len]
+                name = name.rstrip(b"\0").decode(errors="surrogateescape")
+                pos += FSMONITOR_EVENT_FORMAT.size + name_len
+
+                if mask & IN_Q_OVERFLOW:
+                    lines.append("*")
+                    continue
+                if wd == git_wd:
+                    if name.startswith(FSMONITOR_COOKIE_PREFIX):
+                        lines.append(f"cookie {name}")
+                    continue
+                if mask & IN_IGNORED:
+                    watches.pop(wd, None)
+                    continue
+                directory = watches.get(wd)
+                if directory is None or not name:
+                    continue
+
+                path = f"{directory}/{name}" if directory else name
+                if name == ".gitignore":
+                    # Ignore rules changed: recompile them and make clients rescan
+                    ignored_files.clear()
+                    add_watches(directory)
+                    lines.append("*")
+                elif mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO) and not is_ignored(path, ignored_files, is_dir=True):
+                        add_watches(path)
+                    lines.append(path + "/")
+                else:
+                    lines.append(path)
+            if lines:
+                log.write("\n".join(lines) + "\n")
+                logged.update(line for line in lines if not line.startswith("cookie "))
+            if log.tell() > base_size + FSMONITOR_LOG_LIMIT:
+                previous = token
+                token = f"token {os.getpid()}-{time.time_ns()}"
+                tmp_path = FSMONITOR_LOG_PATH + ".lock"
+                with open(tmp_path, "w") as f:
+                    f.write(f"{token}\nprevious {previous}\n" + "".join(f"{line}\n" for line in sorted(logged)))
+                os.replace(tmp_path, FSMONITOR_LOG_PATH)
+                log.close()
+                log = open(FSMONITOR_LOG_PATH, "a", buffering=1)
+                logged = set()
+                base_size = log.tell()
+    finally:
+        log.close()
+        if fsmonitor_pid() == os.getpid():
+            os.remove(FSMONITOR_PID_PATH)
+
+def fsmonitor_sync(state):
+    """
+    Make sure every change made before now is in the daemon's log and return
+    (token, offset, new_entries). new_entries is the log text from the offset in
+    state, the previous command's .git/fsmonitor.state, up to the sync point, or
+    None when state doesn't continue this log and a full scan is needed. Returns
+    None if the daemon doesn't answer.
+
+    A cookie file is created in .git; inotify delivers events in order, so once
+    the daemon has logged the cookie it has logged everything before it too. Only
+    the bytes appended since the starting offset are read while waiting for it.
+    """
+    deadline = time.monotonic() + FSMONITOR_TIMEOUT
+    while time.monotonic() < deadline:
+        with open(FSMONITOR_LOG_PATH, "rb") as f:
+            token = f.readline().rstrip(b"\n").decode()
+            header_end = f.tell()
+            previous = f.readline().rstrip(b"\n").decode()
+            if previous.startswith("previous "):
+                header_end = f.tell()
+            log_size = os.fstat(f.fileno()).st_size
+            if state.get("token") == token and header_end <= state.get("offset", -1) <= log_size:
+                start = state["offset"]
+            elif previous == f"previous {state.get('token')}":
+                # The daemon compacted the log we were reading into this one
+                start = header_end
+            else:
+                start = None
+            position = log_size if start is None else start
+            f.seek(position)
+
+            cookie = f"{FSMONITOR_COOKIE_PREFIX}{os.getpid()}-{time.time_ns()}"
+            cookie_path = os.path.join(".git", cookie)
+            marker = f"cookie {cookie}\n".encode()
+            open(cookie_path, "w").close()
+            try:
+                data = bytearray()
+                while time.monotonic() < deadline:
+                    new_data = f.read()
+                    if new_data:
+                        search_from = max(0, len(data) - len(marker))
+                        data += new_data
+                        found = data.find(marker, search_from)
+                        if found != -1:
+                            end = found + len(marker)
+                            entries = data[:end].decode(errors="surrogateescape") if start is not None else None
+                            return token, position + end, entries
+                    elif os.stat(FSMONITOR_LOG_PATH).st_ino != os.fstat(f.fileno()).st_ino:
+                        break  # The log was compacted; start over on the new one
+                    else:
+                        time.sleep(0.001)
+            finally:
+                os.remove(cookie_path)
+    return None
+
+def fsmonitor_query():
     """
-    Merge two tree objects (representing directories).
-    Returns the SHA of the new merged tree.
+    Return the set of working-tree paths (index form) that may have changed since
+    the last command, or None when the caller must scan everything: no daemon is
+    running, it was restarted, or it lost events. The set includes paths found
+    dirty by earlier commands that haven't been settled in the index since.
     """
-    # Extract the list of entries from both trees (blobs or subtrees)
-    target_entries = get_tree_entries(target_tree)
-    source_entries = get_tree_entries(source_tree)
+    global _fsmonitor
+    _fsmonitor = None
+    if fsmonitor_pid() is None:
+        return None
 
-    merged_entries = {}
-    
-    # Merge the entries, handling conflicts
-    for entry in target_entries + source_entries:
-        file_name = entry['name']
-        if file_name in merged_entries:
-            # Resolve conflict (if the file is changed in both trees)
-            if merged_entries[file_name] != entry['sha']:
-                # Handle conflict (e.g., take the source file)
-                merged_entries[file_name] = entry['sha']
+    state = {}
+    try:
+        with open(FSMONITOR_STATE_PATH, "r") as f:
+            state = json.load(f)
+    except (FileNotFoundError, ValueError):
+        pass
+    synced = fsmonitor_sync(state)
+    if synced is None:
+        return None
+    token, offset, new_entries = synced
+
+    # A dirty set of None means the next full scan sets a new baseline
+    _fsmonitor = {"token": token, "offset": offset, "dirty": None}
+    if new_entries is None:
+        return None
+
+    dirty = set(state["dirty"])
+    for line in new_entries.splitlines():
+        if line == "*":
+            return None
+        if line.startswith("cookie "):
+            continue
+        if line.endswith("/"):
+            dirty.update(expand_dirty_directory(line))
         else:
-            merged_entries[file_name] = entry['sha']
-    
-    # Create a new tree object with the merged entries
-    return create_tree_object(merged_entries)
+            dirty.add(line)
+    _fsmonitor["dirty"] = dirty
+    perf_count("fsmonitor_dirty", len(dirty))
+    return set(dirty)
 
-def merge_branches(target_branch, source_branch):
-    target_commit = get_commit_sha(target_branch)
-    source_commit = get_commit_sha(source_branch)
-    
-    # Assuming that we have a function `compare_trees` that checks differences
-    target_tree = get_commit_tree(target_commit)
-    source_tree = get_commit_tree(source_commit)
-    
-    if compare_trees(target_tree, source_tree):
-        print("Conflicts detected during merge.")
-    else:
-        # Perform the merge (we won't resolve conflicts, just stage a merge commit)
-        merged_tree = merge_trees(target_tree, source_tree)
-        new_commit_sha = create_commit_object(merged_tree, target_commit, "Merged changes.")
-        print(f"Merged commit: {new_commit_sha}")
-        
-def checkout(branch_name):
+def expand_dirty_directory(prefix):
     """
-    Switches to the specified branch by updating HEAD and the working directory. 
+    List the files under a directory that changed as a whole (created, moved or
+    deleted): what is there now plus what the index has under it.
     """
-    branch_path = f".git/refs/heads/{branch_name}"
-
-    # Check if the branch exists
-    if not os.path.exists(branch_path):
-        raise RuntimeError(f"Branch '{branch_name}' does not exist.")
-
-    # Update HEAD to point to the new branch
-    with open(".git/HEAD", "w") as f:
-        f.write(f"ref: refs/heads/{branch_name}\n")
-
-    # Get the commit SHA of the branch
-    with open(branch_path, "r") as f:
-        commit_sha = f.read().strip()
+    paths = {path for path in read_index()["entries"] if path.startswith(prefix)}
+    for root, _, files in os.walk(prefix.rstrip("/")):
+        paths.update(index_path_for(os.path.join(root, name)) for name in files)
+    return paths
 
-    print(f"Switched to branch '{branch_name}'")
+def fsmonitor_is_clean(path, index):
+    """
+    Return True if the daemon vouches that an indexed file is unchanged since the
+    index recorded it, so it needn't even be stat'ed.
+    """
+    if _fsmonitor is None or _fsmonitor["dirty"] is None:
+        return False
+    path = os.path.normpath(path).replace(os.sep, "/")
+    return path in index["entries"] and path not in _fsmonitor["dirty"]
 
-    # Reset the working directory to match the branch
-    reset_to_commit(commit_sha)
+def fsmonitor_save(index, examined=(), full_scan=False):
+    """
+    Record how far into the daemon's log this command has read. The paths that were
+    dirty, the examined ones and racy index entries (modified in the same tick the
+    index was written) are checked: those whose index entry now matches the file,
+    or that are gone from both, are settled and the rest stay dirty for the next
+    command. A new baseline is only recorded after a full scan. Call after the
+    index is written.
+    """
+    if _fsmonitor is None or (_fsmonitor["dirty"] is None and not full_scan):
+        return
+    try:
+        index_mtime_ns = os.stat(INDEX_PATH).st_mtime_ns
+    except FileNotFoundError:
+        index_mtime_ns = 0
+    ignored_files = read_gitignore()
 
-def get_branch_commit_hash(branch_name):
+    # Only entries this command rewrote can have become racy: older ones were
+    # settled against an earlier index write or are still in the dirty set
+    candidates = set(_fsmonitor["dirty"] or ()) | set(examined)
+    for path in index["updated"]:
+        entry = index["entries"].get(path)
+        if entry is not None and entry["mtime"][0] * 1_000_000_000 + entry["mtime"][1] >= index_mtime_ns:
+            candidates.add(path)
+
+    dirty = set()
+    for path in candidates:
+        entry = index["entries"].get(path)
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            if entry is not None:
+                dirty.add(path)
+            continue
+        if not is_worktree_file(st) or (entry is None and is_ignored(path, ignored_files)):
+            continue
+        current = index_stat_data(st)
+        # Same test as index_entry_is_fresh, so a chmod or a replaced file stays dirty
+        if (entry is None
+                or any(entry[field] != current[field] for field in INDEX_STAT_FIELDS)
+                or st.st_mtime_ns >= index_mtime_ns):
+            dirty.add(path)
+
+    tmp_path = FSMONITOR_STATE_PATH + ".lock"
+    with open(tmp_path, "w") as f:
+        json.dump({"token": _fsmonitor["token"], "offset": _fsmonitor["offset"], "dirty": sorted(dirty)}, f)
+    os.replace(tmp_path, FSMONITOR_STATE_PATH)
+
+def iter_worktree_files(directory, ignored_files):
     """
-    Retrieve the commit hash for the latest commit in a given branch.
-    This function assumes that the branch names exist in the .git/refs/heads directory.
+    Yield (path, stat) for every regular file and symlink in the working tree that
+    isn't ignored.
     """
-    branch_ref_path = os.path.join('.git', 'refs', 'heads', branch_name)
-    
-    # Check if the branch exists
-    if not os.path.exists(branch_ref_path):
-        raise ValueError(f"Branch '{branch_name}' not found.")
-    
-    with open(branch_ref_path, 'r') as f:
-        return f.read().strip()
+    directories = [directory]
+    while directories:
+        current = directories.pop()
+        for _, entry_path, st in list_worktree_entries(current, ignored_files):
+            if stat.S_ISDIR(st.st_mode):
+                directories.append(entry_path)
+            elif is_worktree_file(st):
+                yield entry_path, st
+
+def iter_index_changes(index, tree_sha, index_paths, prefix=""):
+    """
+    Yield (code, path) for each index entry that differs from a tree: "A" for a
+    path only in the index, "D" for one only in the tree and "M" when the SHAs
+    or modes differ. index_paths is the sorted list of index paths. A directory whose
+    cache-tree SHA equals the tree's is skipped without being read, so after a
+    commit only the directories staged since then are compared.
+    """
+    if tree_sha is not None and index["trees"].get(prefix.rstrip("/")) == tree_sha:
+        return
+    tree_entries = {name: (mode, sha) for mode, name, sha in parse_tree_object(tree_sha)} if tree_sha else {}
+
+    # The index's files and subdirectories directly under prefix
+    files = {}
+    directories = set()
+    position = bisect.bisect_left(index_paths, prefix)
+    while position < len(index_paths) and index_paths[position].startswith(prefix):
+        name, slash, _ = index_paths[position][len(prefix):].partition("/")
+        if slash:
+            directories.add(name)
+            # "0" sorts right after "/", so this skips everything under the directory
+            position = bisect.bisect_left(index_paths, prefix + name + "0", position)
+        else:
+            entry = index["entries"][index_paths[position]]
+            files[name] = (f"{entry['mode']:o}", entry["sha"])
+            position += 1
+
+    for name in sorted(files.keys() | directories | tree_entries.keys()):
+        path = prefix + name
+        tree_entry = tree_entries.get(name)
+        tree_is_dir = tree_entry is not None and tree_entry[0].startswith("4")
+        if name in directories:
+            yield from iter_index_changes(index, tree_entry[1] if tree_is_dir else None, index_paths, path + "/")
+        elif tree_is_dir:
+            for deleted_path, _, _ in iter_tree_diff(tree_entry[1], None, path + "/"):
+                yield ("D", deleted_path)
+        if name in files:
+            if tree_entry is None or tree_is_dir:
+                yield ("A", path)
+            elif tree_entry != files[name]:
+                yield ("M", path)
+        elif tree_entry is not None and not tree_is_dir:
+            yield ("D", path)
+
+def status(short=False):
+    """
+    Show how the index differs from HEAD (changes to be committed) and how the
+    working tree differs from the index (unstaged changes and untracked files).
+    With the fsmonitor daemon running only the paths it reported are examined;
+    otherwise every file is. Files whose content still matches the index get
+    their stat data refreshed so the next run doesn't rehash them.
+    """
+    index = read_index()
+    ignored_files = read_gitignore()
+    entries = index["entries"]
+
+    # HEAD against the index: only directories changed since write-tree are read
+    head_commit = get_head_commit()
+    head_tree = get_commit_info(head_commit)["tree"] if head_commit else None
+    with trace_phase("status_index"):
+        staged = sorted(iter_index_changes(index, head_tree, sorted(entries)), key=lambda change: change[1])
+
+    candidates = fsmonitor_query()
+    full_scan = candidates is None
+    if full_scan:
+        candidates = set(entries)
+        candidates.update(index_path_for(path) for path, _ in iter_worktree_files(".", ignored_files))
+
+    unstaged = []
+    untracked = []
+    with trace_phase("status_worktree"):
+        for path in sorted(candidates):
+            try:
+                perf_count("files_stated")
+                st = os.lstat(path)
+            except FileNotFoundError:
+                if path in entries:
+                    unstaged.append(("D", path))
+                continue
+            if not is_worktree_file(st):
+                continue
+            if path not in entries:
+                if not is_ignored(path, ignored_files):
+                    untracked.append(path)
+                continue
+            if index_entry_is_fresh(index, path, st) is not None:
+                continue
+            sha = compute_blob_sha(path, st)
+            if sha == entries[path]["sha"] and index_mode_for(st) == entries[path]["mode"]:
+                update_index(index, path, sha, st)
+            else:
+                unstaged.append(("M", path))
+
+    if index["changed"]:
+        write_index(index)
+    fsmonitor_save(index, [path for _, path in unstaged] + untracked, full_scan=full_scan)
+
+    if short:
+        changes = {}
+        for code, path in staged:
+            changes[path] = [code, " "]
+        for code, path in unstaged:
+            changes.setdefault(path, [" ", " "])[1] = code
+        for path in sorted(changes):
+            print(f"{''.join(changes[path])} {path}")
+        for path in untracked:
+            print(f"?? {path}")
+        return
+
+    labels = {"A": "new file", "M": "modified", "D": "deleted"}
+    branch = get_head_branch()
+    print(f"On branch {branch}" if branch else "HEAD detached")
+    if staged:
+        print("Changes to be committed:")
+        for code, path in staged:
+            print(f"\t{labels[code] + ':':12}{path}")
+    if unstaged:
+        print("Changes not staged for commit:")
+        for code, path in unstaged:
+            print(f"\t{labels[code] + ':':12}{path}")
+    if untracked:
+        print("Untracked files:")
+        for path in untracked:
+            print(f"\t{path}")
+    if not (staged or unstaged or untracked):
+        print("nothing to commit, working tree clean")
 
 def diff_commits(branch1, branch2):
     """
-    Show the diff between the latest commits of two branches.
+    Show the diff between the latest commits of two branches (or two commit SHAs).
+    Changed paths are printed as they are found, one per line.
     """
     # Get the latest commit hashes for the two branches
-    commit_sha1 = get_branch_commit_hash(branch1)
-    commit_sha2 = get_branch_commit_hash(branch2)
+    commit_sha1 = branch1 if re.fullmatch(r"[0-9a-f]{40}", branch1) else get_branch_commit_hash(branch1)
+    commit_sha2 = branch2 if re.fullmatch(r"[0-9a-f]{40}", branch2) else get_branch_commit_hash(branch2)
 
-    # Fetch the tree for each commit
-    tree1 = get_commit_tree(commit_sha1)
-    tree2 = get_commit_tree(commit_sha2)
-    
-    # Compare the trees and display the diff
-    diff = compare_trees(tree1, tree2)
+    # Compare the trees and stream the diff
     print(f"Diff between {branch1} and {branch2}:")
-    print(diff)
+    for status, path in diff_trees(commit_sha1, commit_sha2):
+        print(f"{status}\t{path}")
 
 def restore_object_content(object_sha):
     """
@@ -721,20 +4571,15 @@ def restore_object_content(object_sha):
     if len(object_sha) != 40 or not all(c in "0123456789abcdef" for c in object_sha):
         raise ValueError(f"Invalid SHA format: {object_sha}")
 
-    # Fetch the object content using the get_object_content function
-    content = get_object_content(object_sha)
+    obj = load_object(object_sha)
 
     # Check if the object is a tree or a commit
-    if content.startswith(b"tree"):
+    if isinstance(obj, Tree):
         # Parse the tree object (no author data here)
-        entries = parse_tree_object(object_sha)
-        return "tree", entries
-    elif content.startswith(b"commit"):
-        # Parse the commit object to get the tree SHA
-        lines = content.split(b'\0')
-        tree_line = lines[1]  # The second line contains the tree SHA
-        tree_sha = tree_line.split(b' ')[1].decode()  # Extract tree SHA
-        return "commit", tree_sha  # Return the tree SHA for restoring
+        return "tree", [tuple(entry) for entry in obj.entries]
+    elif isinstance(obj, Commit):
+        # Return the tree SHA for restoring
+        return "commit", obj.tree
     else:
         # Handle other types, such as blob
         raise RuntimeError(f"Unsupported object type for {object_sha}")
@@ -755,10 +4600,11 @@ def restore_tree(tree_sha, current_dir=""):
         file_path = os.path.join(current_dir, file_name_decoded)
 
         if mode.startswith('4'):  # Directory mode
-            print(f"Restoring directory {file_path}")
+            trace(f"Restoring directory {file_path}")
+            os.makedirs(file_path, exist_ok=True)
             restore_tree(sha, current_dir=file_path)  # Recursive call for directories
         else:  # File mode (blob)
-            print(f"Restoring file {file_path}")
+            trace(f"Restoring file {file_path}")
             
             # Fetch the raw content of the blob (file)
             content = get_blob_content(sha)  # Get the raw content, either binary or text
@@ -777,7 +4623,7 @@ def restore_file(content, file_path):
     with open(file_path, mode) as f:
         f.write(content)
 
-    print(f"File restored at: {file_path}")
+    trace(f"File restored at: {file_path}")
 
 def reset_to_commit(commit_sha):
     """
@@ -792,92 +4638,593 @@ def reset_to_commit(commit_sha):
 
     # The commit content returns the tree SHA that we need to restore
     tree_sha = commit_content  # This is the tree SHA returned by the restore_object_content function
-    print(f"Commit {commit_sha} points to tree {tree_sha}")
-    
-    # Cleaning the tree_sha in case the author line is present
-    tree_sha_cleaned = tree_sha.splitlines()[0]
+    trace(f"Commit {commit_sha} points to tree {tree_sha}")
 
-    print(f"Restoring tree {tree_sha_cleaned} to working directory")
-    restore_tree(tree_sha_cleaned)
+    trace(f"Restoring tree {tree_sha} to working directory")
+    restore_tree(tree_sha)
 
     # Step 2: If there are other details to reset (e.g., index files or other state), handle them here
     # For simplicity, this example assumes the tree content is all we need.
     print(f"Reset to commit {commit_sha} complete.")
     
-def clone_repository(source_dir, destination_dir):
+def reflink_file(source_path, destination_path):
     """
-    Clone the repository from source_dir to destination_dir.
-    This copies the .git directory and restores the working directory files.
+    Clone a file's data blocks with the FICLONE ioctl. Raises OSError where the
+    filesystem (or platform) does not support it.
     """
-    # Step 1: Copy the .git directory
-    shutil.copytree(os.path.join(source_dir, ".git"), os.path.join(destination_dir, ".git"))
-    print(f"Cloned repository from {source_dir} to {destination_dir}")
+    import fcntl
+    with open(source_path, "rb") as src, open(destination_path, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(destination_path)
+            raise
 
-    # Step 2: Move into the destination directory and get the latest commit SHA from HEAD
-    head_path = os.path.join(destination_dir, ".git", "HEAD")
-    with open(head_path, "r") as f:
-        ref = f.read().strip()
-        
-    # If HEAD is in the format "ref: refs/heads/main", get the branch reference
-    if ref.startswith("ref:"):
-        ref_path = os.path.join(destination_dir, ".git", ref.split(" ")[1])
-        with open(ref_path, "r") as f:
-            commit_sha = f.read().strip()
+def link_object_file(source_path, destination_path, use_hardlinks):
+    """
+    Share an object file with the source repository: hardlink it, else reflink
+    it, else fall back to copying. Object files are never modified in place
+    (new versions are renamed over them), so sharing them is safe.
+    Returns "link", "reflink" or "copy".
+    """
+    if use_hardlinks:
+        try:
+            os.link(source_path, destination_path)
+            return "link"
+        except OSError:
+            pass
+    try:
+        reflink_file(source_path, destination_path)
+        return "reflink"
+    except (OSError, ImportError):
+        shutil.copy2(source_path, destination_path)
+        return "copy"
+
+def clone_objects(source_objects, destination_objects, use_hardlinks=True):
+    """
+    Populate destination_objects from source_objects, file by file, without copying
+    object data where the filesystem allows it. Returns a count per method.
+    """
+    counts = {"link": 0, "reflink": 0, "copy": 0}
+    for root, dirs, files in os.walk(source_objects):
+        relative = os.path.relpath(root, source_objects)
+        target_dir = os.path.normpath(os.path.join(destination_objects, relative))
+        os.makedirs(target_dir, exist_ok=True)
+        for name in files:
+            # Skip writes that were in flight in the source
+            if name.startswith("tmp_"):
+                continue
+            method = link_object_file(os.path.join(root, name), os.path.join(target_dir, name), use_hardlinks)
+            counts[method] += 1
+    return counts
+
+def checkout_files_parallel(tree_sha, jobs):
+    """
+    Write every file of a tree into an empty working directory using a pool of
+    worker threads, and record them in the index. Returns the number of files.
+    """
+    files = [(path, new) for path, _, new in iter_tree_diff(None, tree_sha)]
+    for directory in {os.path.dirname(path) for path, _ in files}:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    with trace_phase("checkout_files"), ThreadPoolExecutor(max_workers=jobs) as pool:
+        list(pool.map(lambda item: write_worktree_file(item[0], *item[1]), files))
+
+    # Record the new files so the next write-tree doesn't rehash them all
+    index = read_index()
+    for path, (mode, sha) in files:
+        if mode != "120000":
+            perf_count("files_stated")
+            update_index(index, path, sha, os.lstat(path))
+    if index["changed"]:
+        write_index(index)
+    return len(files)
+
+# Per-repository caches that in_repository() swaps out. The object cache is shared:
+# a SHA names the same content in every repository.
+REPOSITORY_CACHES = ["_config", "_compression_levels", "_pack_cache", "_pack_list", "_commit_graph",
+                     "_packed_refs", "_shallow", "_ignore_matcher", "_fsmonitor"]
+
+# Held while in_repository() has changed directory, so two switches never interleave
+_repository_switch = threading.RLock()
+
+@contextlib.contextmanager
+def in_repository(repo_dir):
+    """
+    Read from another repository: change into repo_dir with empty per-repository
+    caches and object writer directories, then restore the caller's directory and
+    state. The working directory is process-wide, so this is only for commands
+    that run no other threads meanwhile (clone, before its checkout starts).
+    """
+    module = globals()
+    with _repository_switch:
+        if _object_writer["batch"] is not None:
+            raise RuntimeError("Cannot switch repositories while an object batch is open")
+        saved = {name: module[name] for name in REPOSITORY_CACHES}
+        saved_dirs = _object_writer["dirs"]
+        previous_dir = os.getcwd()
+        os.chdir(repo_dir)
+        for name in REPOSITORY_CACHES:
+            module[name] = None
+        module["_pack_cache"] = {}
+        _object_writer["dirs"] = set()
+        try:
+            yield
+        finally:
+            for pack in module["_pack_cache"].values():
+                close_pack(pack)
+            os.chdir(previous_dir)
+            module.update(saved)
+            _object_writer["dirs"] = saved_dirs
+
+# Open connections to promisor remotes: URL -> "cat-file --batch" process serving it
+_promisor = {
+    "processes": {},
+    "lock": threading.Lock(),
+}
+
+def close_promisor_processes():
+    for process in _promisor["processes"].values():
+        process.stdin.close()
+        process.wait()
+    _promisor["processes"].clear()
+
+def get_promisor_process(url):
+    """
+    Return the "cat-file --batch" process running in the promisor repository at
+    url, starting it on first use. It runs in its own directory, so fetching never
+    changes ours, and one process serves every fetch of this command.
+    """
+    process = _promisor["processes"].get(url)
+    if process is None:
+        if not os.path.isdir(os.path.join(url, ".git")):
+            raise RuntimeError(f"Promisor remote {url} is not a repository")
+        env = dict(os.environ)
+        package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_root, env.get("PYTHONPATH")]))
+        process = subprocess.Popen([sys.executable, "-m", "app.main", "cat-file", "--batch"], cwd=url,
+                                   env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        if not _promisor["processes"]:
+            atexit.register(close_promisor_processes)
+        _promisor["processes"][url] = process
+    return process
+
+def fetch_promisor_object(object_sha):
+    """
+    Fetch an object that a filtered clone left out from the repository it was
+    cloned from (the promisor remote) and store it here, so it is only fetched
+    once. Returns (type, content), or None if this isn't a partial clone.
+    Safe to call from checkout's worker threads: requests to the remote are
+    serialized.
+    """
+    if not get_config_bool(f"remote.{PROMISOR_REMOTE}.promisor"):
+        return None
+    url = get_config(f"remote.{PROMISOR_REMOTE}.url")
+    with _promisor["lock"]:
+        process = get_promisor_process(url)
+        process.stdin.write(f"{object_sha}\n".encode())
+        process.stdin.flush()
+        header = process.stdout.readline().decode().split()
+        if not header:
+            # The remote's process died; start a new one next time
+            del _promisor["processes"][url]
+        if len(header) != 3:
+            raise RuntimeError(f"Object {object_sha} not found in promisor remote {url}")
+        content = process.stdout.read(int(header[2]) + 1)[:-1]
+    obj = (header[1], content)
+    # Never store what the remote sends under a name it doesn't hash to
+    received_sha = hashlib.sha1(f"{obj[0]} {len(content)}\0".encode() + content).hexdigest()
+    if received_sha != object_sha or len(content) != int(header[2]):
+        raise RuntimeError(f"Promisor remote {url} sent a corrupt object for {object_sha}")
+    hash_object_tree(obj[1], obj[0])
+    perf_count("promisor_fetches")
+    trace(f"Fetched {object_sha} from {url}")
+    return obj
+
+def collect_clone_objects(depth=None, blob_limit=None):
+    """
+    Return (objects, shallow) for cloning the current repository. objects holds
+    the SHAs of every commit within depth commits of a branch tip (all of them
+    when depth is None), plus the trees and blobs those commits reference.
+    shallow holds the commits whose parents were cut off. Blobs of blob_limit
+    bytes or more are left out, except the ones the checkout of HEAD needs.
+    """
+    head = get_head_commit()
+    tips = list(dict.fromkeys(list_branch_heads() + ([head] if head else [])))
+    source_shallow = load_shallow()
+
+    # Breadth-first, so each commit is reached at its shortest distance from a tip
+    commits = set(tips)
+    shallow = set()
+    frontier = tips
+    level = 1
+    while frontier:
+        next_frontier = []
+        for commit_sha in frontier:
+            parents = get_commit_info(commit_sha)["parents"]
+            if commit_sha in source_shallow or (parents and depth is not None and level >= depth):
+                shallow.add(commit_sha)
+                continue
+            for parent in parents:
+                if parent not in commits:
+                    commits.add(parent)
+                    next_frontier.append(parent)
+        frontier = next_frontier
+        level += 1
+
+    checkout_blobs = set()
+    if blob_limit is not None and head:
+        checkout_blobs = {new[1] for _, _, new in iter_tree_diff(None, get_commit_info(head)["tree"])}
+
+    objects = set(commits)
+    filtered = set()
+    pending = [get_commit_info(commit_sha)["tree"] for commit_sha in commits]
+    while pending:
+        tree_sha = pending.pop()
+        if tree_sha in objects:
+            continue
+        objects.add(tree_sha)
+        for mode, _, sha in parse_tree_object(tree_sha):
+            if mode.startswith("4"):
+                pending.append(sha)
+            elif mode == "160000" or sha in objects or sha in filtered:
+                continue  # Submodule commits live in another repository
+            elif blob_limit is None or sha in checkout_blobs or read_object_header(sha)[1] < blob_limit:
+                objects.add(sha)
+            else:
+                filtered.add(sha)
+
+    trace(f"Clone: {len(commits)} commits, {len(objects)} objects, {len(filtered)} blobs filtered out")
+    return objects, shallow
+
+def export_object(object_sha, destination_objects, use_hardlinks=True):
+    """
+    Copy one object of the current repository into another object directory. A
+    loose object file is shared like clone_objects does; packed and chunked objects
+    are written out as loose objects. Returns "link", "reflink", "copy" or "write".
+    """
+    object_path = loose_object_path(object_sha)
+    destination_path = os.path.join(destination_objects, object_sha[:2], object_sha[2:])
+    os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+    if os.path.exists(object_path):
+        return link_object_file(object_path, destination_path, use_hardlinks)
+
+    manifest = read_chunk_manifest(object_sha)
+    if manifest is not None:
+        # A chunked blob is compressed chunk by chunk instead of being joined in memory
+        obj_type, size, pieces = "blob", manifest[0], iter_blob_data(object_sha)
     else:
-        # If HEAD contains a SHA directly (detached HEAD), use it directly
-        commit_sha = ref
+        obj_type, content = read_object(object_sha)
+        size, pieces = len(content), [content]
+    compressor = zlib.compressobj()
+    fd, tmp_path = tempfile.mkstemp(prefix="tmp_obj_", dir=destination_objects)
+    with os.fdopen(fd, "wb") as f:
+        f.write(compressor.compress(f"{obj_type} {size}\0".encode()))
+        for data in pieces:
+            f.write(compressor.compress(data))
+        f.write(compressor.flush())
+    os.replace(tmp_path, destination_path)
+    return "write"
+
+def clone_repository(source_dir, destination_dir, use_hardlinks=True, jobs=None, depth=None, blob_limit=None):
+    """
+    Clone a local repository from source_dir to destination_dir. Object files are
+    hardlinked (or reflinked, or copied as a last resort) instead of copied, only
+    refs, HEAD and config are copied, and the working tree is written by
+    worker threads.
+
+    With depth, only the commits within depth of a branch tip (and their trees and
+    blobs) are copied and the cut-off commits are recorded in .git/shallow. With
+    blob_limit, blobs of that size or more are left out (apart from those checked
+    out) and the source is recorded as the promisor remote they are fetched from.
+    """
+    source_git = os.path.join(source_dir, ".git")
+    destination_git = os.path.join(destination_dir, ".git")
+    if not os.path.isdir(source_git):
+        raise RuntimeError(f"{source_dir} is not a repository")
+    if os.path.exists(destination_git):
+        raise RuntimeError(f"{destination_dir} already contains a repository")
+
+    # Step 1: Share the immutable objects and copy the small mutable metadata
+    destination_objects = os.path.abspath(os.path.join(destination_git, "objects"))
+    shallow = set()
+    with trace_phase("clone_objects"):
+        if depth is None and blob_limit is None:
+            counts = clone_objects(os.path.join(source_git, "objects"), destination_objects, use_hardlinks)
+        else:
+            # Only what the requested snapshot reaches, so the cost follows its size
+            os.makedirs(destination_objects)
+            counts = {"link": 0, "reflink": 0, "copy": 0, "write": 0}
+            with in_repository(source_dir):
+                objects, shallow = collect_clone_objects(depth, blob_limit)
+                for object_sha in objects:
+                    counts[export_object(object_sha, destination_objects, use_hardlinks)] += 1
+    for name in CLONE_METADATA:
+        source_path = os.path.join(source_git, name)
+        if os.path.isdir(source_path):
+            shutil.copytree(source_path, os.path.join(destination_git, name))
+        elif os.path.exists(source_path):
+            shutil.copy2(source_path, os.path.join(destination_git, name))
+    os.makedirs(os.path.join(destination_git, "refs", "heads"), exist_ok=True)
+    if shallow:
+        with open(os.path.join(destination_git, "shallow"), "w") as f:
+            f.write("".join(f"{commit_sha}\n" for commit_sha in sorted(shallow)))
+    print(f"Cloned repository from {source_dir} to {destination_dir}")
+    trace(f"Objects: {counts['link']} linked, {counts['reflink']} reflinked, {counts['copy']} copied"
+          + (f", {counts['write']} written" if "write" in counts else ""))
+
+    # Step 2: Move into the destination directory and check out HEAD
+    source_url = os.path.abspath(source_dir)
+    os.chdir(destination_dir)
+    if blob_limit is not None:
+        set_config(f"remote.{PROMISOR_REMOTE}.url", source_url)
+        set_config(f"remote.{PROMISOR_REMOTE}.promisor", "true")
+        set_config(f"remote.{PROMISOR_REMOTE}.partialclonefilter", f"blob:limit={blob_limit}")
+        # Tell Git too, so it fetches missing blobs instead of reporting corruption
+        set_config("core.repositoryformatversion", "1")
+        set_config("extensions.partialclone", PROMISOR_REMOTE)
+    commit_sha = get_head_commit()
+    if commit_sha is None:
+        print("Cloned an empty repository.")
+        return
 
     print(f"HEAD points to commit {commit_sha}")
+    written = checkout_files_parallel(get_commit_info(commit_sha)["tree"], jobs or os.cpu_count() or 1)
+    print(f"Checked out {written} files")
+
+# Repository daemon state, set only inside the daemon: parsed trees and commits,
+# resolved refs, and the stat keys of cached files so changes by other processes
+# are noticed
+_daemon = None
+
+def file_stat_key(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+def refresh_repository_state():
+    """
+    Drop the daemon's cached config, shallow list, packed-refs and commit-graph if
+    another process rewrote them since the last request. Objects never change, so
+    the object caches stay valid, and new packs are picked up by read_object's
+    rescan. The old commit-graph is only dropped, not unmapped, as requests
+    running on other threads may still be reading it.
+    """
+    global _config, _compression_levels, _shallow, _packed_refs, _commit_graph
+    with _daemon["lock"]:
+        keys = _daemon["stat_keys"]
+        config_key = file_stat_key(CONFIG_PATH)
+        if config_key != keys.get(CONFIG_PATH):
+            keys[CONFIG_PATH] = config_key
+            _config = None
+            _compression_levels = None
+        shallow_key = file_stat_key(SHALLOW_PATH)
+        if shallow_key != keys.get(SHALLOW_PATH):
+            keys[SHALLOW_PATH] = shallow_key
+            _shallow = None
+        packed_key = file_stat_key(PACKED_REFS_PATH)
+        if packed_key != keys.get(PACKED_REFS_PATH):
+            keys[PACKED_REFS_PATH] = packed_key
+            _packed_refs = None
+            _daemon["refs"].clear()
+        graph_key = (file_stat_key(COMMIT_GRAPH_PATH), file_stat_key(COMMIT_GRAPH_CHAIN_PATH))
+        if graph_key != keys.get(COMMIT_GRAPH_PATH):
+            keys[COMMIT_GRAPH_PATH] = graph_key
+            _commit_graph = None
+
+class DaemonOutput:
+    """
+    Stand-in for sys.stdout or sys.stderr in the daemon. Requests run on worker
+    threads at the same time, so each thread installs its own capture stream here;
+    other threads keep writing to the original stream.
+    """
+    def __init__(self, default):
+        self._default = default
+        self._local = threading.local()
+
+    def capture(self, stream):
+        self._local.stream = stream
+
+    def __getattr__(self, name):
+        return getattr(getattr(self._local, "stream", None) or self._default, name)
+
+def run_daemon_request(args):
+    """
+    Run one served command with its output captured. Returns (exit code, stdout
+    bytes, stderr bytes). Requests run on the event loop's worker threads, so
+    several are served at once; each captures its output through DaemonOutput.
+    """
+    import io
+
+    if not args or args[0] not in DAEMON_COMMANDS or "--batch" in args or "--batch-check" in args:
+        return 1, b"", f"Not served by the daemon: {' '.join(args)}\n".encode()
+
+    refresh_repository_state()
+    streams = [io.TextIOWrapper(io.BytesIO(), encoding="utf-8", errors="surrogateescape", write_through=True)
+               for _ in range(2)]
+    sys.stdout.capture(streams[0])
+    sys.stderr.capture(streams[1])
+    exit_code = 0
+    try:
+        run_command([sys.argv[0]] + args)
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else 1
+    except Exception as e:
+        print(f"{type(e).__name__}: {e}", file=sys.stderr)
+        exit_code = 1
+    finally:
+        sys.stdout.capture(None)
+        sys.stderr.capture(None)
+    with _daemon["lock"]:
+        _daemon["requests"] += 1
+    return exit_code, streams[0].buffer.getvalue(), streams[1].buffer.getvalue()
+
+async def handle_daemon_client(reader, writer):
+    """
+    Serve requests from one client connection until it closes. Each request is a
+    JSON line {"argv": [...]}; each response is a JSON line {"exit", "stdout",
+    "stderr"} giving the exit code and output lengths, followed by the output bytes.
+    Requests on one connection are answered in order; the command itself runs on
+    a worker thread, so other clients are served meanwhile.
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                args = json.loads(line)["argv"]
+            except (ValueError, KeyError, TypeError):
+                exit_code, out, err = 1, b"", b"Malformed request\n"
+            else:
+                exit_code, out, err = await loop.run_in_executor(None, run_daemon_request, args)
+            header = {"exit": exit_code, "stdout": len(out), "stderr": len(err)}
+            writer.write(json.dumps(header).encode() + b"\n" + out + err)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def serve_repository():
+    import asyncio
+
+    if os.path.exists(DAEMON_SOCKET_PATH):
+        os.remove(DAEMON_SOCKET_PATH)
+    server = await asyncio.start_unix_server(handle_daemon_client, path=DAEMON_SOCKET_PATH)
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    write_pid_file(DAEMON_PID_PATH)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        for path in (DAEMON_SOCKET_PATH, DAEMON_PID_PATH):
+            if os.path.exists(path):
+                os.remove(path)
+
+def repository_daemon():
+    """
+    Serve cat-file, ls-tree, show-history, diff and blame to local clients over a Unix
+    socket, keeping refs, parsed objects, packs and the commit-graph warm between
+    requests. asyncio is imported here rather than at startup, which it would
+    slow down for every other command.
+    """
+    import asyncio
 
-    # Step 3: Reset the working directory to match the commit
-    os.chdir(destination_dir)  # Change to the destination directory
-    reset_to_commit(commit_sha)
+    global _daemon
+    _daemon = {"objects": OrderedDict(), "refs": {}, "stat_keys": {}, "requests": 0,
+               "lock": threading.Lock()}
+    sys.stdout = DaemonOutput(sys.stdout)
+    sys.stderr = DaemonOutput(sys.stderr)
+    asyncio.run(serve_repository())
+
+def forward_to_daemon(args):
+    """
+    Send a command to the repository daemon and print its output. Returns the exit
+    code, or None when the command should run locally: it isn't one the daemon
+    serves, no daemon is running, GIT_NO_DAEMON is set, or the daemon went away.
+    """
+    if (not args or args[0] not in DAEMON_COMMANDS or "--batch" in args or "--batch-check" in args
+            or os.environ.get("GIT_NO_DAEMON") or not os.path.exists(DAEMON_SOCKET_PATH)):
+        return None
+
+    import socket
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(DAEMON_SOCKET_PATH)
+            sock.sendall(json.dumps({"argv": args}).encode() + b"\n")
+            with sock.makefile("rb") as response:
+                header = json.loads(response.readline())
+                out = response.read(header["stdout"])
+                err = response.read(header["stderr"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+    perf_count("daemon_requests")
+    sys.stdout.buffer.write(out)
+    sys.stdout.flush()
+    sys.stderr.buffer.write(err)
+    sys.stderr.flush()
+    return header["exit"]
 
 def main():
-    print("Logs from your program will appear here!", file=sys.stderr)
+    configure_tracing(sys.argv)
+    trace("Logs from your program will appear here!")
+
+    if os.environ.get("GIT_OBJECT_CACHE_STATS"):
+        atexit.register(print_object_cache_stats)
 
     if len(sys.argv) < 2:
         raise RuntimeError("No command provided")
 
-    command = sys.argv[1]
+    # Read-only commands go to the repository daemon when one is running
+    exit_code = forward_to_daemon(sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
+
+    run_command(sys.argv)
+
+def run_command(argv):
+    """
+    Run one command; argv is laid out like sys.argv, program name first.
+    """
+    command = argv[1]
 
     if command == "init":
         # Initialize the git repository
         initialize_git_repo()
         print("Initialized git repository")
+    elif command == "cat-file" and len(argv) == 3 and argv[2] in ("--batch", "--batch-check"):
+        # Stream object headers (and content with --batch) for SHAs read from stdin
+        cat_file_batch(with_content=argv[2] == "--batch")
     elif command == "cat-file":
-        if len(sys.argv) != 4 or sys.argv[2] != "-p":
-            raise RuntimeError("Usage: cat-file -p <blob_sha>")
+        if len(argv) != 4 or argv[2] != "-p":
+            raise RuntimeError("Usage: cat-file -p <blob_sha> | cat-file (--batch | --batch-check)")
 
         # Retrieve the content of the blob by its SHA hash
-        blob_sha = sys.argv[3]
-        content = get_blob_content(blob_sha)
-        print(content, end="")  # Print without a newline
-    elif command == "hash-object" and len(sys.argv) == 4 and sys.argv[2] == "-w":
-        file_path = sys.argv[3]  # Get the file path from the arguments
+        blob_sha = argv[3]
+        if read_chunk_manifest(blob_sha) is not None:
+            # Large chunked blobs are written out chunk by chunk
+            for data in iter_blob_data(blob_sha):
+                sys.stdout.buffer.write(data)
+            sys.stdout.flush()
+        else:
+            content = get_blob_content(blob_sha)
+            print(content, end="")  # Print without a newline
+    elif command == "hash-object" and len(argv) == 4 and argv[2] == "-w":
+        file_path = argv[3]  # Get the file path from the arguments
         hash_object(file_path)
     elif command == "ls-tree":
-        if len(sys.argv) < 3:
+        if len(argv) < 3:
             raise RuntimeError("Usage: ls-tree [--name-only] <tree_sha>")
         
-        name_only = "--name-only" in sys.argv
-        tree_sha = sys.argv[-1]
+        name_only = "--name-only" in argv
+        tree_sha = argv[-1]
         ls_tree(tree_sha, name_only)
     elif command == "write-tree":
         # Write the working directory as a tree object
-        tree_sha = write_tree()
+        tree_sha = write_tree(jobs=parse_jobs_option(argv[2:]))
         print(tree_sha)
     elif command == "commit-tree":
-        if len(sys.argv) < 7 or sys.argv[3] != "-p" or sys.argv[5] != "-m":
+        if len(argv) < 7 or argv[3] != "-p" or argv[5] != "-m":
             raise RuntimeError("Usage: commit-tree <tree_sha> -p <parent_sha> -m <message>")
 
-        tree_sha = sys.argv[2]
-        parent_sha = sys.argv[4]
-        message = sys.argv[6]  # Corrected to grab the next argument
+        tree_sha = argv[2]
+        parent_sha = argv[4]
+        message = argv[6]  # Corrected to grab the next argument
         print(message)
 
-        # Default branch name
-        branch_name = "main"
+        # Commit to the branch HEAD points to (main by default)
+        branch_name = get_head_branch() or "main"
 
         # Update parent SHA from the current branch if it's the first commit
         if parent_sha == "0" * 40:
@@ -890,54 +5237,128 @@ def main():
         print(f"Commit created with SHA: {commit_sha}")
 
     elif command == "show-history":
-        if len(sys.argv) != 3:
+        if len(argv) != 3:
             raise RuntimeError("Usage: show-history <branch_name>")
-        branch_name = sys.argv[2]
+        branch_name = argv[2]
         show_commit_history(branch_name)
+    elif command == "log":
+        show_log(argv[2:])
+    elif command == "blame":
+        show_blame(argv[2:])
     elif command == "create-branch":
-        if len(sys.argv) != 4:
+        if len(argv) != 4:
             raise RuntimeError("Usage: create-branch <branch_name> <commit_sha>")
-        branch_name = sys.argv[2]
-        commit_sha = sys.argv[3]
+        branch_name = argv[2]
+        commit_sha = argv[3]
         create_branch(branch_name, commit_sha)
     elif command == "merge":
-        if len(sys.argv) != 4:
+        if len(argv) != 4:
             raise RuntimeError("Usage: merge <target_branch> <source_branch>")
-        target_branch = sys.argv[2]
-        source_branch = sys.argv[3]
+        target_branch = argv[2]
+        source_branch = argv[3]
         merge_branches(target_branch, source_branch)
     elif command == "diff":
-        if len(sys.argv) != 4:
+        if len(argv) != 4:
             raise RuntimeError("Usage: diff <commit_sha1> <commit_sha2>")
-        commit_sha1 = sys.argv[2]
-        commit_sha2 = sys.argv[3]
+        commit_sha1 = argv[2]
+        commit_sha2 = argv[3]
         diff_commits(commit_sha1, commit_sha2)
     elif command == "clone":
-        if len(sys.argv) != 4:
-            raise RuntimeError("Usage: clone <source_dir> <destination_dir>")
-        source_dir = sys.argv[2]
-        destination_dir = sys.argv[3]
-        clone_repository(source_dir, destination_dir)
+        args = [arg for arg in argv[2:] if arg != "--no-hardlinks"]
+        jobs = None
+        if "--jobs" in args or "-j" in args:
+            jobs = parse_jobs_option(args)
+            position = args.index("--jobs" if "--jobs" in args else "-j")
+            del args[position:position + 2]
+        depth = blob_limit = None
+        for option in [arg for arg in args if arg.startswith("--depth") or arg.startswith("--filter")]:
+            position = args.index(option)
+            name, has_value, value = option.partition("=")
+            if not has_value and position + 1 < len(args):
+                value = args.pop(position + 1)
+            args.pop(position)
+            if name == "--depth":
+                if not value.isdigit() or int(value) < 1:
+                    raise RuntimeError(f"Invalid depth: {value}")
+                depth = int(value)
+            elif value == "blob:none":
+                blob_limit = 0
+            elif value.startswith("blob:limit="):
+                blob_limit = parse_size(value[len("blob:limit="):])
+            else:
+                raise RuntimeError(f"Unsupported filter: {value} (use blob:none or blob:limit=<n>)")
+        if len(args) != 2:
+            raise RuntimeError("Usage: clone [--no-hardlinks] [--jobs N] [--depth N] [--filter=blob:limit=<n>] <source_dir> <destination_dir>")
+        source_dir, destination_dir = args
+        clone_repository(source_dir, destination_dir, "--no-hardlinks" not in argv, jobs, depth, blob_limit)
     elif command == "stage":
-        if len(sys.argv) < 3:
+        if len(argv) < 3:
             raise RuntimeError("Usage: stage <file1> [<file2> ...]")
         # Stage the specified files
-        files = sys.argv[2:]
+        files = argv[2:]
         stage(files)
+    elif command == "status":
+        status(short="-s" in argv[2:] or "--short" in argv[2:])
+    elif command == "fsmonitor":
+        if len(argv) != 3 or argv[2] not in ("start", "stop", "status"):
+            raise RuntimeError("Usage: fsmonitor start|stop|status")
+        if argv[2] == "start":
+            start_background_process("fsmonitor", fsmonitor_daemon, FSMONITOR_PID_PATH)
+        elif argv[2] == "stop":
+            stop_background_process("fsmonitor", FSMONITOR_PID_PATH)
+        else:
+            pid = fsmonitor_pid()
+            print(f"fsmonitor is running (pid {pid})" if pid else "fsmonitor is not running")
+    elif command == "daemon":
+        if len(argv) != 3 or argv[2] not in ("start", "stop", "status"):
+            raise RuntimeError("Usage: daemon start|stop|status")
+        if argv[2] == "start":
+            start_background_process("daemon", repository_daemon, DAEMON_PID_PATH)
+        elif argv[2] == "stop":
+            stop_background_process("daemon", DAEMON_PID_PATH)
+        else:
+            pid = read_pid_file(DAEMON_PID_PATH)
+            print(f"daemon is running (pid {pid})" if pid else "daemon is not running")
     elif command == "checkout":
-        if len(sys.argv) < 3:
+        if len(argv) < 3:
             raise RuntimeError("Usage: checkout <branch_name>")
         # Checkout to the specified branch (e.g., "main")
-        branch_name = sys.argv[2]
+        branch_name = argv[2]
         checkout(branch_name)
     elif command == "parent":
         parent_sha = get_parent_sha_from_head()
         print(f"Parent commit SHA: {parent_sha if parent_sha else 'None'}")
+    elif command == "config":
+        if len(argv) not in (3, 4):
+            raise RuntimeError("Usage: config <section.key> [<value>]")
+        if len(argv) == 4:
+            set_config(argv[2], argv[3])
+        else:
+            value = get_config(argv[2])
+            if value is None:
+                raise RuntimeError(f"Config key '{argv[2]}' is not set")
+            print(value)
+    elif command == "commit-graph":
+        if len(argv) != 3 or argv[2] != "write":
+            raise RuntimeError("Usage: commit-graph write")
+        count = write_commit_graph()
+        print(f"Wrote commit-graph with {count} commits")
+    elif command == "repack":
+        # Move loose objects into a single delta-compressed pack
+        repack()
+    elif command == "stats":
+        # Object storage totals and compression savings
+        print_repository_stats()
+    elif command == "pack-refs":
+        # Move loose branch refs into .git/packed-refs
+        pack_refs()
+    elif command == "branch":
+        list_branches(verbose="-v" in argv[2:])
     elif command == "diff":
-        if len(sys.argv) != 4:
+        if len(argv) != 4:
             raise RuntimeError("Usage: diff <branch> <branch>")
-        commit_sha1 = sys.argv[2]
-        commit_sha2 = sys.argv[3]
+        commit_sha1 = argv[2]
+        commit_sha2 = argv[3]
         diff_commits(commit_sha1, commit_sha2)
     else:
         raise RuntimeError(f"Unknown command #{command}")
@@ -0,0 +1,95 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import main  # noqa: E402
+
+GIT_IDENTITY = {
+    "GIT_AUTHOR_NAME": "Test",
+    "GIT_AUTHOR_EMAIL": "test@example.com",
+    "GIT_COMMITTER_NAME": "Test",
+    "GIT_COMMITTER_EMAIL": "test@example.com",
+}
+
+requires_git = pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+
+
+def command_env():
+    env = {**os.environ, **GIT_IDENTITY, "PYTHONPATH": ROOT}
+    # Keep trace output out of what the tests compare
+    for name in ("GIT_TRACE", "GIT_TRACE_PERF", "GIT_OBJECT_CACHE_STATS"):
+        env.pop(name, None)
+    return env
+
+
+def git(repo, *args, input=None, env=None, check=True):
+    """
+    Run real git in repo, with extra environment variables from env, and return
+    its stdout as text.
+    """
+    result = subprocess.run(["git", *args], cwd=repo, env={**command_env(), **(env or {})}, input=input,
+                            capture_output=True, text=True, check=check)
+    return result.stdout
+
+
+def app(repo, *args, input=None):
+    """
+    Run this program in repo, as your_program.sh does, and return its stdout as text.
+    """
+    result = subprocess.run([sys.executable, "-m", "app.main", *args], cwd=repo, env=command_env(),
+                            input=input, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise AssertionError(f"{' '.join(args)} failed: {result.stderr}")
+    return result.stdout
+
+
+def write_files(repo, files):
+    """
+    Write {path: text} under repo, creating directories as needed.
+    """
+    for path, content in files.items():
+        full_path = os.path.join(repo, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w") as f:
+            f.write(content)
+
+
+def commit(repo, message, parent="0" * 40):
+    """
+    Commit the working tree with this program's write-tree and commit-tree and
+    return the new commit's SHA.
+    """
+    tree_sha = app(repo, "write-tree").strip()
+    output = app(repo, "commit-tree", tree_sha, "-p", parent, "-m", message)
+    return output.rsplit("Commit created with SHA: ", 1)[1].strip()
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """
+    An empty repository created by this program.
+    """
+    app(tmp_path, "init")
+    return tmp_path
+
+
+@pytest.fixture
+def in_repo(monkeypatch):
+    """
+    Return a function that moves the test into a repository for in-process calls,
+    with fresh per-repository caches that are restored afterwards.
+    """
+    def enter(path):
+        monkeypatch.chdir(path)
+        for name in main.REPOSITORY_CACHES:
+            monkeypatch.setattr(main, name, None)
+        monkeypatch.setattr(main, "_pack_cache", {})
+        monkeypatch.setattr(main, "_object_cache", None)
+        monkeypatch.setitem(main._object_writer, "dirs", set())
+    return enter
@@ -0,0 +1,17 @@
+"""
+The benchmark harness on a small synthetic repository.
+"""
+import os
+
+from app import bench
+
+
+def test_merge_benchmark_with_packed_refs(tmp_path):
+    options = dict(bench.DEFAULT_REPO_OPTIONS, files=20, commits=4)
+    repo = str(tmp_path / "repo")
+    paths = bench.generate_repository(repo, options)
+    bench.run_cli(repo, "pack-refs")
+    assert not os.path.exists(os.path.join(repo, ".git/refs/heads/main"))
+
+    assert bench.run_benchmark("merge", repo, paths, str(tmp_path), None) > 0
+    assert "bench-merge" not in bench.run_cli(repo, "branch")
@@ -0,0 +1,121 @@
+"""
+blame on histories made with git, compared line by line with git blame.
+"""
+import random
+
+import pytest
+
+from conftest import app, git, requires_git, write_files
+
+pytestmark = requires_git
+
+
+class History:
+    """
+    A git repository whose commits get increasing dates, one a minute.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.clock = 1_700_000_000
+        git(path, "init", "-q", "-b", "main")
+
+    def env(self):
+        self.clock += 60
+        date = f"{self.clock} +0000"
+        return {"GIT_AUTHOR_DATE": date, "GIT_COMMITTER_DATE": date}
+
+    def commit(self, files, message):
+        write_files(self.path, files)
+        git(self.path, "add", "-A")
+        git(self.path, "commit", "-q", "-m", message, env=self.env())
+
+    def merge(self, branch):
+        git(self.path, "merge", "-q", "--no-ff", "-m", f"merge {branch}", branch, env=self.env())
+
+
+def git_blame(repo, path, revision="HEAD"):
+    """
+    The commit of each line, from git blame --porcelain.
+    """
+    shas = []
+    for line in git(repo, "blame", "--porcelain", revision, "--", path).splitlines():
+        fields = line.split(" ")
+        if len(fields[0]) == 40 and len(fields) in (3, 4):
+            shas.append(fields[0])
+    return shas
+
+
+def app_blame(repo, path, revision="main"):
+    """
+    (commit prefix, line) for each line of our blame output.
+    """
+    lines = []
+    for line in app(repo, "blame", revision, path).splitlines():
+        prefix, _, rest = line.partition(" (")
+        lines.append((prefix, rest.split(") ", 1)[1] if ") " in rest else ""))
+    return lines
+
+
+def edit(rng, lines, label):
+    """
+    Replace, delete and insert a few lines; every new line is unique.
+    """
+    original, lines = lines, list(lines)
+    for i in range(rng.randint(1, 4)):
+        action = rng.choice(["replace", "delete", "insert"])
+        position = rng.randrange(len(lines) + (action == "insert"))
+        if action == "replace" and lines:
+            lines[position % len(lines)] = f"{label} replaced {i}"
+        elif action == "delete" and len(lines) > 5:
+            del lines[position % len(lines)]
+        else:
+            lines.insert(position, f"{label} inserted {i}")
+    # A line inserted and then deleted again leaves nothing to commit
+    if lines == original:
+        lines.append(f"{label} appended")
+    return lines
+
+
+def text(lines):
+    return "".join(f"{line}\n" for line in lines)
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_blame_matches_git_on_linear_history(tmp_path, seed):
+    rng = random.Random(seed)
+    history = History(tmp_path)
+    lines = [f"original line {i}" for i in range(30)]
+    history.commit({"file.txt": text(lines), "other.txt": "unrelated\n"}, "first")
+    for i in range(8):
+        if rng.random() < 0.3:
+            # Commits that don't touch the file are skipped without a diff
+            history.commit({"other.txt": f"unrelated {i}\n"}, f"other {i}")
+        lines = edit(rng, lines, f"c{i}")
+        history.commit({"file.txt": text(lines)}, f"edit {i}")
+
+    expected = git_blame(tmp_path, "file.txt")
+    ours = app_blame(tmp_path, "file.txt")
+    assert [prefix for prefix, _ in ours] == [sha[:8] for sha in expected]
+    assert text(line for _, line in ours) == git(tmp_path, "show", "HEAD:file.txt")
+
+
+def test_blame_matches_git_across_a_merge(tmp_path):
+    history = History(tmp_path)
+    lines = [f"line {i}" for i in range(20)]
+    history.commit({"file.txt": text(lines)}, "base")
+    git(tmp_path, "checkout", "-q", "-b", "topic")
+    topic = lines[:3] + ["topic change"] + lines[4:]
+    history.commit({"file.txt": text(topic)}, "topic")
+    git(tmp_path, "checkout", "-q", "main")
+    main_lines = lines[:15] + ["main change"] + lines[16:]
+    history.commit({"file.txt": text(main_lines)}, "main")
+    history.merge("topic")
+    history.commit({"file.txt": text(topic[:3] + ["topic change", "after merge"] + main_lines[4:])}, "after")
+
+    assert [prefix for prefix, _ in app_blame(tmp_path, "file.txt")] == [
+        sha[:8] for sha in git_blame(tmp_path, "file.txt")]
+    # Blame at an older commit, named by SHA
+    merge_sha = git(tmp_path, "rev-parse", "HEAD~1").strip()
+    assert [prefix for prefix, _ in app_blame(tmp_path, "file.txt", merge_sha)] == [
+        sha[:8] for sha in git_blame(tmp_path, "file.txt", merge_sha)]
@@ -0,0 +1,69 @@
+"""
+cat-file --batch, compared byte for byte with git cat-file --batch.
+"""
+import random
+import subprocess
+import sys
+
+from conftest import app, command_env, git, requires_git, write_files
+
+pytestmark = requires_git
+
+APP = [sys.executable, "-m", "app.main"]
+
+
+def run_batch(repo, program, input):
+    result = subprocess.run([*program, "cat-file", "--batch"], cwd=repo, env=command_env(), input=input,
+                            capture_output=True, check=True)
+    return result.stdout
+
+
+def test_batch_matches_git(tmp_path):
+    git(tmp_path, "init", "-q", "-b", "main")
+    write_files(tmp_path, {"text.txt": "hello\n", "dir/nested.txt": "nested\n", "empty.txt": ""})
+    with open(tmp_path / "binary.bin", "wb") as f:
+        f.write(random.Random(12).randbytes(5000) + b"\n\0\n")
+    git(tmp_path, "add", "-A")
+    git(tmp_path, "commit", "-q", "-m", "first")
+    git(tmp_path, "tag", "-a", "v1", "-m", "annotated")
+    # Pack the first commit's objects and leave the second one's loose
+    git(tmp_path, "gc", "-q")
+    write_files(tmp_path, {"text.txt": "hello again\n"})
+    git(tmp_path, "commit", "-q", "-am", "second")
+
+    objects = git(tmp_path, "rev-list", "--objects", "--all").split("\n")
+    shas = [line.split(" ")[0] for line in objects if line]
+    shas.append(git(tmp_path, "rev-parse", "v1").strip())
+    shas.append("0" * 40)
+    request = "".join(f"{sha}\n" for sha in shas).encode()
+
+    assert run_batch(tmp_path, APP, request) == run_batch(tmp_path, ["git"], request)
+
+
+def test_batch_streams_chunked_blob(repo):
+    app(repo, "config", "chunking.threshold", "64k")
+    content = "".join(f"line {i} of a large file\n" for i in range(20_000)).encode()
+    with open(repo / "big.txt", "wb") as f:
+        f.write(content)
+    blob_sha = app(repo, "hash-object", "-w", "big.txt").strip()
+
+    output = run_batch(repo, APP, f"{blob_sha}\n".encode())
+    assert output == f"{blob_sha} blob {len(content)}\n".encode() + content + b"\n"
+
+
+def test_batch_answers_each_request_before_the_next(repo):
+    write_files(repo, {"a.txt": "first\n", "b.txt": "second\n"})
+    shas = [app(repo, "hash-object", "-w", name).strip() for name in ("a.txt", "b.txt")]
+
+    process = subprocess.Popen([*APP, "cat-file", "--batch"], cwd=repo, env=command_env(),
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    try:
+        for sha, content in zip(shas, (b"first\n", b"second\n")):
+            process.stdin.write(f"{sha}\n".encode())
+            process.stdin.flush()
+            assert process.stdout.readline() == f"{sha} blob {len(content)}\n".encode()
+            assert process.stdout.read(len(content) + 1) == content + b"\n"
+    finally:
+        process.stdin.close()
+        process.wait(timeout=10)
+    assert process.returncode == 0
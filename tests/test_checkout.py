@@ -0,0 +1,95 @@
+"""
+checkout between branches made with git, compared with the trees git recorded.
+"""
+import os
+
+import pytest
+
+from conftest import app, git, requires_git, write_files
+
+pytestmark = requires_git
+
+
+def worktree_snapshot(repo):
+    """
+    Return {path: content} for the working tree, symlinks as "-> target".
+    """
+    snapshot = {}
+    for root, dirs, files in os.walk(repo):
+        dirs[:] = [name for name in dirs if name != ".git"]
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, repo)
+            if os.path.islink(path):
+                snapshot[relative] = "-> " + os.readlink(path)
+            elif os.path.isfile(path):
+                with open(path) as f:
+                    snapshot[relative] = f.read()
+    return snapshot
+
+
+def tree_snapshot(repo, revision):
+    snapshot = {}
+    for line in git(repo, "ls-tree", "-r", revision).splitlines():
+        info, path = line.split("\t")
+        mode, _, sha = info.split()
+        content = git(repo, "cat-file", "-p", sha)
+        snapshot[path] = "-> " + content if mode == "120000" else content
+    return snapshot
+
+
+def commit_all(repo, message):
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", message)
+
+
+@pytest.fixture
+def branches(tmp_path):
+    """
+    main has a file "top" and a directory "dir"; other has a directory "top" and
+    a file "dir", plus an executable and a symlink.
+    """
+    git(tmp_path, "init", "-q", "-b", "main")
+    write_files(tmp_path, {"top": "file on main\n", "dir/a.txt": "a\n", "dir/sub/b.txt": "b\n",
+                           "shared.txt": "same\n", "changes.txt": "main version\n"})
+    commit_all(tmp_path, "main")
+    git(tmp_path, "checkout", "-q", "-b", "other")
+    os.remove(tmp_path / "top")
+    for path in ("dir/a.txt", "dir/sub/b.txt"):
+        os.remove(tmp_path / path)
+    os.removedirs(tmp_path / "dir/sub")
+    write_files(tmp_path, {"top/inner.txt": "inside\n", "dir": "now a file\n", "changes.txt": "other version\n",
+                           "run.sh": "#!/bin/sh\n"})
+    os.chmod(tmp_path / "run.sh", 0o755)
+    os.symlink("shared.txt", tmp_path / "link")
+    commit_all(tmp_path, "other")
+    git(tmp_path, "checkout", "-q", "main")
+    return tmp_path
+
+
+def test_checkout_switches_files_and_directories(branches):
+    for branch in ("other", "main", "other"):
+        app(branches, "checkout", branch)
+        assert worktree_snapshot(branches) == tree_snapshot(branches, branch)
+        # Our index and HEAD agree with the tree git recorded: nothing to commit
+        assert git(branches, "status", "--porcelain") == ""
+    assert os.access(branches / "run.sh", os.X_OK)
+
+
+def test_checkout_refuses_to_overwrite_local_changes(branches):
+    write_files(branches, {"changes.txt": "edited locally\n"})
+    before = worktree_snapshot(branches)
+
+    with pytest.raises(AssertionError, match="changes.txt"):
+        app(branches, "checkout", "other")
+    assert worktree_snapshot(branches) == before
+    assert git(branches, "symbolic-ref", "HEAD").strip() == "refs/heads/main"
+
+
+def test_checkout_keeps_unrelated_local_changes(branches):
+    write_files(branches, {"shared.txt": "edited locally\n"})
+
+    app(branches, "checkout", "other")
+    with open(branches / "shared.txt") as f:
+        assert f.read() == "edited locally\n"
+    assert git(branches, "status", "--porcelain") == " M shared.txt\n"
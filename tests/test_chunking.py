@@ -0,0 +1,68 @@
+"""
+Content-defined chunking of large blobs.
+"""
+import os
+import random
+
+from conftest import app, git, requires_git
+
+pytestmark = requires_git
+
+
+def chunked_repo(repo):
+    app(repo, "config", "chunking.threshold", "64k")
+    app(repo, "config", "chunking.averageSize", "8k")
+    # Text-like content, so boundaries follow the same data as in real files
+    rng = random.Random(19)
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta"]
+    return "".join(" ".join(rng.choices(words, k=12)) + "\n" for _ in range(8000)).encode()
+
+
+def manifest_chunks(repo, blob_sha):
+    with open(os.path.join(repo, ".git/objects/chunked", blob_sha[:2], blob_sha[2:])) as f:
+        return [line.split()[0] for line in f.read().splitlines()[1:]]
+
+
+def test_chunked_blob_keeps_git_sha(repo):
+    content = chunked_repo(repo)
+    with open(repo / "big.txt", "wb") as f:
+        f.write(content)
+    blob_sha = app(repo, "hash-object", "-w", "big.txt").strip()
+
+    assert blob_sha == git(repo, "hash-object", "big.txt").strip()
+    chunks = manifest_chunks(repo, blob_sha)
+    assert 20 < len(chunks) < 200
+    assert app(repo, "cat-file", "-p", blob_sha).encode() == content
+    # Only the chunks and the manifest are stored, which is why git fsck reports the blob missing
+    assert not os.path.exists(repo / ".git/objects" / blob_sha[:2] / blob_sha[2:])
+
+
+def test_edit_stores_only_nearby_chunks(repo):
+    content = chunked_repo(repo)
+    with open(repo / "big.txt", "wb") as f:
+        f.write(content)
+    old_chunks = manifest_chunks(repo, app(repo, "hash-object", "-w", "big.txt").strip())
+
+    middle = len(content) // 2
+    with open(repo / "big.txt", "wb") as f:
+        f.write(content[:middle] + b"an inserted line\n" + content[middle:])
+    new_chunks = manifest_chunks(repo, app(repo, "hash-object", "-w", "big.txt").strip())
+
+    assert len(set(new_chunks) - set(old_chunks)) <= 3
+
+
+def test_clone_writes_chunked_blobs_for_git(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    app(source, "init")
+    content = chunked_repo(source)
+    with open(source / "big.txt", "wb") as f:
+        f.write(content)
+    tree_sha = app(source, "write-tree").strip()
+    app(source, "commit-tree", tree_sha, "-p", "0" * 40, "-m", "big file")
+
+    app(tmp_path, "clone", "--depth", "1", "source", "clone")
+    clone = tmp_path / "clone"
+    # The clone holds an ordinary loose blob, which git reads and checks
+    assert git(clone, "cat-file", "-p", "HEAD:big.txt").encode() == content
+    git(clone, "fsck", "--full")
@@ -0,0 +1,136 @@
+"""
+Clones made by this program, checked with git.
+"""
+import os
+import zlib
+
+import pytest
+
+from conftest import app, git, requires_git
+
+pytestmark = requires_git
+
+
+def source_repository(path):
+    """
+    A git repository with a few commits, each rewriting a large and a small file.
+    """
+    os.makedirs(path)
+    git(path, "init", "-q", "-b", "main")
+    for i in range(5):
+        with open(os.path.join(path, "big.txt"), "w") as f:
+            f.write(f"version {i}\n" * 2000)
+        with open(os.path.join(path, "small.txt"), "w") as f:
+            f.write(f"small {i}\n")
+        git(path, "add", "-A")
+        git(path, "commit", "-q", "-m", f"commit {i}")
+    return path
+
+
+def missing_objects(repo):
+    output = git(repo, "rev-list", "--objects", "--all", "--missing=print")
+    return [line[1:] for line in output.split() if line.startswith("?")]
+
+
+def test_shallow_clone(tmp_path):
+    source = source_repository(tmp_path / "source")
+    app(tmp_path, "clone", "--depth", "2", "source", "shallow")
+    clone = tmp_path / "shallow"
+
+    # Git honours .git/shallow: two commits, a complete snapshot, nothing missing
+    assert git(clone, "rev-list", "--count", "HEAD").strip() == "2"
+    assert git(clone, "rev-parse", "HEAD").strip() == git(source, "rev-parse", "HEAD").strip()
+    git(clone, "fsck", "--full")
+    assert git(clone, "status", "--porcelain") == ""
+
+
+def test_partial_clone_fetches_missing_blobs(tmp_path):
+    source = source_repository(tmp_path / "source")
+    app(tmp_path, "clone", "--filter=blob:limit=1k", "source", "partial")
+    clone = tmp_path / "partial"
+
+    # Old versions of big.txt were left out; the checked-out one was not
+    missing = missing_objects(clone)
+    assert len(missing) == 4
+    assert git(clone, "cat-file", "-p", "HEAD:big.txt") == git(source, "cat-file", "-p", "HEAD:big.txt")
+
+    for blob_sha in missing:
+        assert app(clone, "cat-file", "-p", blob_sha) == git(source, "cat-file", "-p", blob_sha)
+    # Each blob was stored on first use
+    assert missing_objects(clone) == []
+    git(clone, "fsck", "--full")
+
+
+def test_partial_clone_rejects_corrupt_objects(tmp_path):
+    source = source_repository(tmp_path / "source")
+    app(tmp_path, "clone", "--filter=blob:none", "source", "partial")
+    clone = tmp_path / "partial"
+    blob_sha = missing_objects(clone)[0]
+
+    # The remote's copy of the blob now holds different content
+    object_path = source / ".git/objects" / blob_sha[:2] / blob_sha[2:]
+    os.chmod(object_path, 0o644)
+    with open(object_path, "wb") as f:
+        f.write(zlib.compress(b"blob 5\0wrong"))
+
+    with pytest.raises(AssertionError, match="corrupt object"):
+        app(clone, "cat-file", "-p", blob_sha)
+    assert blob_sha in missing_objects(clone)
+
+
+def object_files(repo):
+    """
+    {path under .git/objects: inode} for every loose object and pack file.
+    """
+    objects_dir = os.path.join(repo, ".git/objects")
+    files = {}
+    for root, _, names in os.walk(objects_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            files[os.path.relpath(path, objects_dir)] = os.stat(path).st_ino
+    return files
+
+
+def check_full_clone(source, clone):
+    assert git(clone, "rev-parse", "HEAD").strip() == git(source, "rev-parse", "HEAD").strip()
+    assert git(clone, "status", "--porcelain") == ""
+    git(clone, "fsck", "--full", "--strict")
+
+
+def test_clone_hardlinks_objects(tmp_path):
+    source = source_repository(tmp_path / "source")
+    # Half the history packed, half loose
+    git(source, "gc", "-q")
+    with open(source / "small.txt", "w") as f:
+        f.write("after gc\n")
+    git(source, "commit", "-q", "-am", "loose")
+
+    app(tmp_path, "clone", "source", "clone")
+    clone = tmp_path / "clone"
+    check_full_clone(source, clone)
+    source_files, clone_files = object_files(source), object_files(clone)
+    assert any(path.startswith("pack") for path in clone_files)
+    assert {path: source_files[path] for path in clone_files} == clone_files
+
+    # New objects in the source don't show up in the clone
+    with open(source / "small.txt", "w") as f:
+        f.write("after clone\n")
+    git(source, "commit", "-q", "-am", "after clone")
+    assert object_files(clone) == clone_files
+    assert git(clone, "rev-parse", "HEAD").strip() == git(source, "rev-parse", "HEAD~1").strip()
+    git(clone, "fsck", "--full", "--strict")
+    git(source, "fsck", "--full", "--strict")
+
+
+def test_clone_without_hardlinks(tmp_path):
+    source = source_repository(tmp_path / "source")
+    app(tmp_path, "clone", "--no-hardlinks", "source", "copy")
+    clone = tmp_path / "copy"
+
+    check_full_clone(source, clone)
+    source_files, clone_files = object_files(source), object_files(clone)
+    assert clone_files.keys() <= source_files.keys()
+    assert not any(source_files[path] == inode for path, inode in clone_files.items())
+    for path in clone_files:
+        with open(source / ".git/objects" / path, "rb") as a, open(clone / ".git/objects" / path, "rb") as b:
+            assert a.read() == b.read()
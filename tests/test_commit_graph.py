@@ -0,0 +1,38 @@
+"""
+Commit-graph files written by this program, verified by git.
+"""
+import os
+
+from conftest import app, commit, git, requires_git, write_files
+
+pytestmark = requires_git
+
+
+def make_history(repo, count):
+    heads = []
+    for i in range(count):
+        write_files(repo, {f"file{i % 3}.txt": f"version {i}\n"})
+        heads.append(commit(repo, f"commit {i}"))
+    return heads
+
+
+def test_git_verifies_our_commit_graph(repo):
+    make_history(repo, 6)
+    app(repo, "create-branch", "side", git(repo, "rev-parse", "HEAD~3").strip())
+    app(repo, "commit-graph", "write")
+
+    assert os.path.exists(os.path.join(repo, ".git/objects/info/commit-graph"))
+    git(repo, "commit-graph", "verify")
+
+
+def test_git_verifies_our_commit_graph_chain(repo):
+    make_history(repo, 8)
+    app(repo, "commit-graph", "write")
+    # Small enough next to the 8 written commits to stay a layer of its own
+    make_history(repo, 3)
+
+    with open(os.path.join(repo, ".git/objects/info/commit-graphs/commit-graph-chain")) as f:
+        assert len(f.read().split()) >= 2
+    git(repo, "commit-graph", "verify")
+    # Git walks the same history through our layers
+    assert git(repo, "rev-list", "--count", "HEAD").strip() == "11"
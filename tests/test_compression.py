@@ -0,0 +1,56 @@
+"""
+Compression policy: levels from config, raw storage of incompressible blobs.
+"""
+import os
+import random
+
+from conftest import app, git, main, requires_git
+
+pytestmark = requires_git
+
+
+def loose_size(repo, object_sha):
+    return os.path.getsize(os.path.join(repo, ".git/objects", object_sha[:2], object_sha[2:]))
+
+
+def test_incompressible_blobs_are_stored_raw(repo):
+    noise = random.Random(20).randbytes(200_000)
+    text = "".join(f"line {i}\n" for i in range(20_000))
+    with open(repo / "noise.bin", "wb") as f:
+        f.write(noise)
+    with open(repo / "text.txt", "w") as f:
+        f.write(text)
+    noise_sha = app(repo, "hash-object", "-w", "noise.bin").strip()
+    text_sha = app(repo, "hash-object", "-w", "text.txt").strip()
+
+    # Level 0 adds only the stored-block overhead; text is still deflated
+    assert len(noise) < loose_size(repo, noise_sha) < len(noise) * 1.01
+    assert loose_size(repo, text_sha) < len(text) / 3
+    # Both are ordinary zlib streams to git
+    assert noise_sha == git(repo, "hash-object", "noise.bin").strip()
+    assert git(repo, "cat-file", "-s", noise_sha).strip() == str(len(noise))
+    assert git(repo, "cat-file", "-p", text_sha) == text
+
+
+def test_compression_level_from_config(repo):
+    text = "".join(f"line {i}\n" for i in range(20_000))
+    with open(repo / "text.txt", "w") as f:
+        f.write(text)
+    app(repo, "config", "compression.blob", "0")
+    text_sha = app(repo, "hash-object", "-w", "text.txt").strip()
+
+    assert loose_size(repo, text_sha) > len(text)
+    assert git(repo, "cat-file", "-p", text_sha) == text
+
+
+def test_levels_are_per_repository(tmp_path, in_repo):
+    for name in ("one", "two"):
+        (tmp_path / name).mkdir()
+        app(tmp_path / name, "init")
+    app(tmp_path / "one", "config", "compression.blob", "1")
+    in_repo(tmp_path / "one")
+    assert main.get_compression_level("blob") == 1
+
+    with main.in_repository(tmp_path / "two"):
+        assert main.get_compression_level("blob") == -1
+    assert main.get_compression_level("blob") == 1
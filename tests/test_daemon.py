@@ -0,0 +1,76 @@
+"""
+The repository daemon serves the same answers as a plain run, and notices files
+that other processes change while it runs.
+"""
+import pytest
+
+from conftest import app, commit, git, requires_git, write_files
+
+pytestmark = requires_git
+
+
+@pytest.fixture
+def daemon():
+    """
+    Return a function that starts the daemon in a repository; it is stopped afterwards.
+    """
+    started = []
+
+    def start(repo):
+        assert "started" in app(repo, "daemon", "start")
+        started.append(repo)
+    yield start
+    for repo in started:
+        app(repo, "daemon", "stop")
+
+
+def test_daemon_answers_like_a_plain_run(repo, daemon):
+    heads = []
+    for i in range(4):
+        write_files(repo, {"file.txt": f"version {i}\n", f"dir/{i}.txt": "new\n"})
+        heads.append(commit(repo, f"commit {i}"))
+    tree_sha = git(repo, "rev-parse", "HEAD^{tree}").strip()
+    commands = [["show-history", "main"], ["ls-tree", tree_sha], ["diff", heads[0], heads[-1]],
+                ["blame", "file.txt"], ["cat-file", "-p", git(repo, "rev-parse", "HEAD:file.txt").strip()]]
+    expected = [app(repo, *command) for command in commands]
+
+    daemon(repo)
+    assert [app(repo, *command) for command in commands] == expected
+    assert "daemon is running" in app(repo, "daemon", "status")
+
+
+def test_daemon_rereads_shallow(repo, daemon):
+    heads = [None]
+    for i in range(4):
+        write_files(repo, {"file.txt": f"version {i}\n"})
+        heads.append(commit(repo, f"commit {i}"))
+    daemon(repo)
+    full = app(repo, "show-history", "main")
+
+    # Another process makes the repository shallow at the second commit
+    with open(repo / ".git/shallow", "w") as f:
+        f.write(heads[2] + "\n")
+    shallow = app(repo, "show-history", "main")
+    assert f"Commit: {heads[1]}" in full
+    assert f"Commit: {heads[1]}" not in shallow and f"Commit: {heads[2]}" in shallow
+
+
+def test_daemon_rereads_config(tmp_path, daemon):
+    source = tmp_path / "source"
+    source.mkdir()
+    git(source, "init", "-q", "-b", "main")
+    for i in range(2):
+        write_files(source, {"file.txt": f"version {i}\n"})
+        git(source, "add", "-A")
+        git(source, "commit", "-q", "-m", f"commit {i}")
+    app(tmp_path, "clone", "--filter=blob:none", "source", "partial")
+    clone = tmp_path / "partial"
+    old_blob = git(source, "rev-parse", "HEAD~1:file.txt").strip()
+    daemon(clone)
+
+    # With the promisor remote switched off, a missing blob must not be fetched
+    app(clone, "config", "remote.origin.promisor", "false")
+    with pytest.raises(AssertionError, match="not found"):
+        app(clone, "cat-file", "-p", old_blob)
+    app(clone, "config", "remote.origin.promisor", "true")
+    assert app(clone, "cat-file", "-p", old_blob) == "version 0\n"
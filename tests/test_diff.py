@@ -0,0 +1,65 @@
+"""
+Properties of the linear-space Myers diff behind blame.
+"""
+import random
+
+import pytest
+
+from conftest import main
+
+
+def lcs_length(a, b):
+    """
+    Length of the longest common subsequence, by the quadratic dynamic program.
+    """
+    previous = [0] * (len(b) + 1)
+    for x in a:
+        current = [0]
+        for j, y in enumerate(b):
+            current.append(previous[j] + 1 if x == y else max(previous[j + 1], current[j]))
+        previous = current
+    return previous[-1]
+
+
+def check_matches(a, b):
+    matches = main.myers_matches(a, b)
+    pairs = sorted(matches.items())
+    # Matched lines are equal, and neither side's order is crossed
+    for b_index, a_index in pairs:
+        assert a[a_index] == b[b_index]
+    for (b1, a1), (b2, a2) in zip(pairs, pairs[1:]):
+        assert b1 < b2 and a1 < a2
+    # A minimal diff keeps a longest common subsequence
+    assert len(pairs) == lcs_length(a, b)
+
+
+@pytest.mark.parametrize("a, b", [
+    ([], []),
+    ([], ["x"]),
+    (["x"], []),
+    (["x", "y", "z"], ["x", "y", "z"]),
+    (["a", "b"], ["c", "d"]),
+    (list("abcabba"), list("cbabac")),
+    (["same"] * 20, ["same"] * 7),
+])
+def test_myers_edge_cases(a, b):
+    check_matches(a, b)
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_myers_matches_lcs_length(seed):
+    rng = random.Random(seed)
+    alphabet = "abcdefgh"[:rng.randint(1, 8)]
+    a = [rng.choice(alphabet) for _ in range(rng.randint(0, 60))]
+    if rng.random() < 0.5:
+        # Small edits of a, the usual shape of a file between two commits
+        b = list(a)
+        for _ in range(rng.randint(0, 8)):
+            position = rng.randint(0, len(b))
+            if b and rng.random() < 0.5:
+                del b[min(position, len(b) - 1)]
+            else:
+                b.insert(position, rng.choice(alphabet))
+    else:
+        b = [rng.choice(alphabet) for _ in range(rng.randint(0, 60))]
+    check_matches(a, b)
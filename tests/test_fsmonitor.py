@@ -0,0 +1,78 @@
+"""
+status with the fsmonitor daemon running, compared with git status after each
+change to the working tree.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import app, command_env, commit, git, requires_git, write_files
+
+pytestmark = [requires_git, pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux-only")]
+
+
+@pytest.fixture
+def fsmonitor(repo):
+    """
+    A committed repository with the fsmonitor daemon running; it is stopped afterwards.
+    """
+    write_files(repo, {".gitignore": "*.log\n", **{f"dir{i % 4}/file{i}.txt": f"content {i}\n" for i in range(40)}})
+    commit(repo, "initial")
+    assert "started" in app(repo, "fsmonitor", "start")
+    yield repo
+    app(repo, "fsmonitor", "stop")
+
+
+def status_with_stats(repo):
+    """
+    Return (status --short output, files stat'ed by it).
+    """
+    result = subprocess.run([sys.executable, "-m", "app.main", "status", "--short"], cwd=repo,
+                            env={**command_env(), "GIT_TRACE_PERF": "1"}, capture_output=True, text=True, check=True)
+    report = json.loads(result.stderr.splitlines()[-1])
+    return result.stdout, report["counters"].get("files_stated", 0)
+
+
+def git_status(repo):
+    # --no-optional-locks keeps git from rewriting the index it reads
+    return git(repo, "--no-optional-locks", "status", "--short", "--untracked-files=all")
+
+
+def test_status_matches_git_while_watching(fsmonitor):
+    repo = fsmonitor
+    # The first run after start scans everything and sets the baseline
+    assert status_with_stats(repo)[0] == git_status(repo) == ""
+
+    steps = [
+        lambda: write_files(repo, {"dir1/file5.txt": "modified\n"}),
+        lambda: os.remove(repo / "dir2/file6.txt"),
+        lambda: write_files(repo, {"dir3/new.txt": "untracked\n", "newdir/deep/file.txt": "untracked\n"}),
+        lambda: write_files(repo, {"dir0/debug.log": "ignored\n"}),
+        lambda: os.chmod(repo / "dir0/file0.txt", 0o755),
+        # Back to the committed content: no longer modified
+        lambda: write_files(repo, {"dir1/file5.txt": "content 5\n"}),
+    ]
+    for step in steps:
+        step()
+        output, stated = status_with_stats(repo)
+        assert output == git_status(repo)
+        # Only the paths the daemon reported, not all 40 files
+        assert stated < 10
+
+    app(repo, "fsmonitor", "stop")
+    assert app(repo, "status", "--short") == git_status(repo)
+    assert "started" in app(repo, "fsmonitor", "start")
+
+
+def test_write_tree_while_watching_matches_git(fsmonitor):
+    repo = fsmonitor
+    app(repo, "status", "--short")
+    write_files(repo, {"dir2/file2.txt": "changed\n", "extra/file.txt": "new\n", "dir3/skip.log": "ignored\n"})
+    os.remove(repo / "dir1/file1.txt")
+
+    tree_sha = app(repo, "write-tree").strip()
+    git(repo, "add", "-A")
+    assert tree_sha == git(repo, "write-tree").strip()
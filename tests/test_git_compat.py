@@ -0,0 +1,141 @@
+"""
+Round trips between this program and real git: whatever one writes, the other reads.
+"""
+import glob
+import os
+
+from conftest import app, commit, git, requires_git, write_files
+
+pytestmark = requires_git
+
+
+SAMPLE_FILES = {
+    "README.md": "# Sample\n",
+    "src/main.py": "".join(f"line {i}\n" for i in range(200)),
+    "src/util.py": "".join(f"line {i}\n" for i in range(190)) + "changed\n",
+    "src/deep/nested/file.txt": "nested\n",
+    ".hidden/config": "dot directory\n",
+    "docs/a.txt": "a\n",
+}
+
+
+def test_write_tree_matches_git(repo):
+    write_files(repo, SAMPLE_FILES)
+    tree_sha = app(repo, "write-tree").strip()
+
+    git(repo, "add", "-A")
+    assert git(repo, "write-tree").strip() == tree_sha
+
+
+def test_write_tree_stores_symlinks(repo):
+    write_files(repo, SAMPLE_FILES)
+    os.symlink("README.md", os.path.join(repo, "link"))
+    os.symlink("src/deep", os.path.join(repo, "dlink"))
+    tree_sha = app(repo, "write-tree").strip()
+
+    # Links are blobs of their target with mode 120000, in our index and tree alike
+    stages = dict(line.split("\t")[::-1] for line in git(repo, "ls-files", "--stage").splitlines())
+    assert stages["link"].startswith("120000 ") and stages["dlink"].startswith("120000 ")
+    assert "dlink/nested/file.txt" not in stages
+    git(repo, "add", "-A")
+    assert git(repo, "write-tree").strip() == tree_sha
+
+
+def test_executable_mode_matches_git(repo):
+    write_files(repo, SAMPLE_FILES)
+    write_files(repo, {"bin/run.sh": "#!/bin/sh\necho run\n"})
+    os.chmod(os.path.join(repo, "bin/run.sh"), 0o755)
+    commit(repo, "first")
+
+    # Index and tree agree on 100755, so nothing shows as a staged mode change
+    assert git(repo, "ls-tree", "HEAD", "bin/run.sh").startswith("100755 blob")
+    assert git(repo, "status", "--porcelain") == ""
+    git(repo, "add", "-A")
+    assert git(repo, "write-tree").strip() == git(repo, "rev-parse", "HEAD^{tree}").strip()
+
+    # Losing the executable bit is an unstaged change, as in git
+    os.chmod(os.path.join(repo, "bin/run.sh"), 0o644)
+    assert app(repo, "status", "-s").splitlines() == git(repo, "status", "--short").splitlines() == [" M bin/run.sh"]
+
+
+def test_git_reads_our_index(repo):
+    write_files(repo, SAMPLE_FILES)
+    tree_sha = app(repo, "write-tree").strip()
+
+    # Git must accept the index we wrote as is: same entries, same tree
+    entries = git(repo, "ls-files", "--stage").splitlines()
+    assert sorted(line.split("\t", 1)[1] for line in entries) == sorted(SAMPLE_FILES)
+    for line in entries:
+        info, path = line.split("\t", 1)
+        assert info.split()[1] == git(repo, "hash-object", path).strip()
+    assert git(repo, "write-tree").strip() == tree_sha
+    assert git(repo, "diff-files", "--name-only") == ""
+
+
+def test_status_reads_git_index(repo):
+    write_files(repo, SAMPLE_FILES)
+    commit(repo, "first")
+    git(repo, "add", "-A")
+    write_files(repo, {"docs/a.txt": "edited\n"})
+
+    assert app(repo, "status", "-s").splitlines() == git(repo, "status", "--short").splitlines()
+
+
+def test_git_reads_our_pack(repo):
+    write_files(repo, SAMPLE_FILES)
+    commit(repo, "first")
+    write_files(repo, {"src/main.py": SAMPLE_FILES["src/main.py"] + "more\n"})
+    head = commit(repo, "second")
+    objects = git(repo, "rev-list", "--objects", "--all").split()
+    objects = [sha for sha in objects if len(sha) == 40]
+    contents = {sha: git(repo, "cat-file", "-p", sha) for sha in objects}
+
+    app(repo, "repack")
+    idx_paths = glob.glob(os.path.join(repo, ".git/objects/pack/*.idx"))
+    assert len(idx_paths) == 1
+    assert not glob.glob(os.path.join(repo, ".git/objects/??/*"))
+
+    rows = [line.split() for line in git(repo, "verify-pack", "-v", idx_paths[0]).splitlines()]
+    rows = [row for row in rows if len(row[0]) == 40]
+    assert {row[0] for row in rows} == set(objects)
+    # The two versions of src/main.py are stored as a delta: "<sha> <type> <size> <packed> <offset> <depth> <base>"
+    assert any(len(row) == 7 for row in rows)
+    for sha, content in contents.items():
+        assert git(repo, "cat-file", "-p", sha) == content
+    git(repo, "fsck", "--full", "--strict")
+    assert git(repo, "rev-parse", "HEAD").strip() == head
+
+
+def test_we_read_git_pack(repo):
+    write_files(repo, SAMPLE_FILES)
+    commit(repo, "first")
+    write_files(repo, {"src/util.py": SAMPLE_FILES["src/util.py"] * 2})
+    commit(repo, "second")
+    git(repo, "repack", "-a", "-d", "-f", "--depth=10")
+    assert not glob.glob(os.path.join(repo, ".git/objects/??/*"))
+
+    objects = [line.split()[0] for line in git(repo, "rev-list", "--objects", "--all").splitlines()]
+    expected = git(repo, "cat-file", "--batch-check", input="\n".join(objects) + "\n")
+    assert app(repo, "cat-file", "--batch-check", input="\n".join(objects) + "\n") == expected
+    blobs = [line.split()[0] for line in expected.splitlines() if line.split()[1] == "blob"]
+    for sha in blobs:
+        assert app(repo, "cat-file", "-p", sha) == git(repo, "cat-file", "-p", sha)
+
+
+def test_repack_over_existing_packs(repo):
+    write_files(repo, SAMPLE_FILES)
+    commit(repo, "first")
+    write_files(repo, {"src/util.py": SAMPLE_FILES["src/util.py"] * 2})
+    commit(repo, "second")
+    # A git pack full of deltas, then loose objects on top of it
+    git(repo, "repack", "-a", "-d", "-f", "--depth=10")
+    write_files(repo, {"src/main.py": "rewritten\n" + SAMPLE_FILES["src/main.py"]})
+    commit(repo, "third")
+    objects = sorted(line.split()[0] for line in git(repo, "rev-list", "--objects", "--all").splitlines())
+
+    app(repo, "repack")
+    idx_paths = glob.glob(os.path.join(repo, ".git/objects/pack/*.idx"))
+    assert len(idx_paths) == 1
+    rows = [line.split() for line in git(repo, "verify-pack", "-v", idx_paths[0]).splitlines()]
+    assert sorted(row[0] for row in rows if len(row[0]) == 40) == objects
+    git(repo, "fsck", "--full", "--strict")
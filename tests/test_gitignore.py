@@ -0,0 +1,77 @@
+"""
+.gitignore rules, compared with git check-ignore and with what git add stages.
+"""
+import os
+
+from conftest import app, git, main, requires_git, write_files
+
+pytestmark = requires_git
+
+GITIGNORE = {
+    ".gitignore": "\n".join([
+        "# comment",
+        "*.o",
+        "!keep.o",
+        "/rooted.txt",
+        "build/",
+        "docs/**/*.tmp",
+        "**/cache",
+        "data/*/raw",
+        "log?.txt",
+        "[ab]x.txt",
+        "spaced.txt   ",
+        "\\#hash.txt",
+        "",
+    ]),
+    "sub/.gitignore": "!*.o\nlocal.txt\n/anchored/\n",
+}
+
+FILES = [
+    "main.o", "keep.o", "lib/util.o", "lib/keep.o", "rooted.txt", "lib/rooted.txt",
+    "build/out.txt", "lib/build/out.txt", "build.txt",
+    "docs/a.tmp", "docs/x/a.tmp", "docs/x/y/a.tmp", "docs/a.txt",
+    "cache/entry", "lib/deep/cache/entry", "cache.txt",
+    "data/set/raw/1", "data/set/cooked/1", "data/raw/1",
+    "log1.txt", "log10.txt", "ax.txt", "cx.txt", "spaced.txt", "#hash.txt",
+    "sub/a.o", "sub/local.txt", "sub/deeper/local.txt", "local.txt",
+    "sub/anchored/f", "sub/x/anchored/f", "anchored/f", "plain.txt",
+]
+
+
+def build(repo):
+    write_files(repo, GITIGNORE)
+    write_files(repo, {path: f"{path}\n" for path in FILES})
+
+
+def all_paths(repo):
+    """
+    Every file and directory under repo, relative to it, outside .git.
+    """
+    paths = []
+    for root, dirs, files in os.walk(repo):
+        dirs[:] = [name for name in dirs if name != ".git"]
+        for name in dirs:
+            paths.append((os.path.relpath(os.path.join(root, name), repo), True))
+        for name in files:
+            paths.append((os.path.relpath(os.path.join(root, name), repo), False))
+    return sorted(paths)
+
+
+def test_is_ignored_matches_check_ignore(repo, in_repo):
+    build(repo)
+    paths = all_paths(repo)
+    result = git(repo, "check-ignore", "--stdin", input="".join(f"{path}\n" for path, _ in paths), check=False)
+    expected = set(result.splitlines())
+
+    in_repo(repo)
+    ignored_files = main.read_gitignore()
+    ours = {path for path, is_dir in paths if main.is_ignored(path, ignored_files, is_dir=is_dir)}
+    assert ours == expected
+
+
+def test_write_tree_stages_what_git_add_stages(repo):
+    build(repo)
+    tree_sha = app(repo, "write-tree").strip()
+
+    git(repo, "add", "-A")
+    assert tree_sha == git(repo, "write-tree").strip()
@@ -0,0 +1,65 @@
+"""
+log filters compared with git log on the same history.
+"""
+import os
+import random
+
+import pytest
+
+from conftest import app, git, requires_git
+
+pytestmark = requires_git
+
+START_TIME = 1700000000
+
+
+def branching_history(repo):
+    """
+    A git history with side branches merged back, commits touching different files
+    and two commits sharing a timestamp.
+    """
+    rng = random.Random(23)
+    git(repo, "init", "-q", "-b", "main")
+    for i in range(30):
+        if i % 7 == 3:
+            git(repo, "checkout", "-q", "-b", f"side{i}")
+        name = rng.choice(["a.txt", "b.txt", "dir/c.txt"])
+        os.makedirs(os.path.join(repo, "dir"), exist_ok=True)
+        with open(os.path.join(repo, name), "a") as f:
+            f.write(f"change {i}\n")
+        git(repo, "add", name)
+        timestamp = START_TIME + (i - 1 if i == 12 else i) * 3600
+        date = {"GIT_AUTHOR_DATE": f"{timestamp} +0000", "GIT_COMMITTER_DATE": f"{timestamp} +0000"}
+        git(repo, "commit", "-q", "-m", f"commit {i}", env=date)
+        if i % 7 == 5:
+            git(repo, "checkout", "-q", "main")
+            git(repo, "merge", "-q", "--no-ff", "-m", f"merge {i}", f"side{i - 2}", env=date)
+
+
+def logged_commits(output):
+    return [line.split()[1] for line in output.splitlines() if line.startswith("Commit: ")]
+
+
+@pytest.mark.parametrize("options", [
+    [],
+    ["-n", "5"],
+    ["-n3"],
+    ["-7"],
+    ["--max-count=12"],
+    ["--since", str(START_TIME + 10 * 3600)],
+    ["--until", str(START_TIME + 20 * 3600)],
+    ["--since", str(START_TIME + 5 * 3600), "--until", str(START_TIME + 25 * 3600), "-n", "8"],
+    ["--", "a.txt"],
+    ["--", "dir"],
+    ["-n", "4", "--", "dir/c.txt"],
+    ["--since", str(START_TIME + 8 * 3600), "--", "b.txt"],
+    ["side10"],
+])
+def test_log_matches_git(tmp_path, options):
+    branching_history(tmp_path)
+    expected = git(tmp_path, "log", "--format=%H", *options).split()
+    assert logged_commits(app(tmp_path, "log", *options)) == expected
+
+
+def test_log_without_commits(repo):
+    assert app(repo, "log") == "No commits yet.\n"
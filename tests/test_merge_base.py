@@ -0,0 +1,55 @@
+"""
+find_merge_base on random histories, checked against git merge-base --all.
+"""
+import random
+
+import pytest
+
+from conftest import git, main, requires_git
+
+pytestmark = requires_git
+
+
+def random_history(repo, rng, count):
+    """
+    Build count commits with git. The first three are unrelated roots; every later
+    one has one to three parents picked from the earlier commits. Commit dates are
+    jittered so they don't always follow the topology.
+    """
+    git(repo, "init", "-q")
+    tree_sha = git(repo, "write-tree").strip()
+    commits = []
+    for i in range(count):
+        args = ["commit-tree", tree_sha, "-m", f"commit {i}"]
+        if i > 2:
+            for parent in rng.sample(commits, rng.choice([1, 1, 1, 2, 2, 3])):
+                args += ["-p", parent]
+        date = f"{1700000000 + i * 60 + rng.randint(-150, 150)} +0000"
+        commits.append(git(repo, *args, env={"GIT_AUTHOR_DATE": date, "GIT_COMMITTER_DATE": date}).strip())
+    # A branch per commit, so the commit-graph covers all of them
+    for i, commit_sha in enumerate(commits):
+        git(repo, "update-ref", f"refs/heads/c{i}", commit_sha)
+    return commits
+
+
+@pytest.mark.parametrize("coverage", ["none", "partial", "full"])
+@pytest.mark.parametrize("seed", range(16))
+def test_merge_base_matches_git(tmp_path, in_repo, seed, coverage):
+    rng = random.Random(seed)
+    commits = random_history(tmp_path, rng, 40)
+    in_repo(tmp_path)
+    if coverage == "full":
+        main.write_commit_graph()
+    elif coverage == "partial":
+        # As after committing on top of a written graph: the newer commits aren't in it
+        main.write_commit_graph(commits[:20])
+
+    for _ in range(25):
+        commit1, commit2 = rng.choice(commits), rng.choice(commits)
+        # Exits 1 with no output for unrelated commits
+        expected = git(tmp_path, "merge-base", "--all", commit1, commit2, check=False).split()
+        base = main.find_merge_base(commit1, commit2)
+        if expected:
+            assert base in expected, (commit1, commit2)
+        else:
+            assert base is None, (commit1, commit2)
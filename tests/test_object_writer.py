@@ -0,0 +1,69 @@
+"""
+Loose objects are written through temp files and renamed into place; with
+core.fsyncObjectFiles a batch fsyncs each fan-out directory once.
+"""
+import os
+import stat
+
+from conftest import app, git, main, requires_git, write_files
+
+pytestmark = requires_git
+
+
+def leftover_temp_files(repo):
+    return [name for name in os.listdir(repo / ".git/objects") if name.startswith("tmp_obj_")]
+
+
+def test_fsynced_write_tree_matches_git(repo, in_repo, monkeypatch):
+    files = {f"dir{i % 3}/file{i}.txt": f"content {i}\n" for i in range(30)}
+    write_files(repo, files)
+    app(repo, "config", "core.fsyncObjectFiles", "true")
+    in_repo(repo)
+
+    synced = {"files": 0, "dirs": []}
+    real_fsync = os.fsync
+
+    def counting_fsync(fd):
+        st = os.fstat(fd)
+        if stat.S_ISDIR(st.st_mode):
+            synced["dirs"].append(st.st_ino)
+        else:
+            synced["files"] += 1
+        real_fsync(fd)
+    monkeypatch.setattr(os, "fsync", counting_fsync)
+    tree_sha = main.write_tree()
+
+    fanout = [os.stat(repo / ".git/objects" / name).st_ino for name in os.listdir(repo / ".git/objects")
+              if len(name) == 2]
+    # Every object file once, then every fan-out directory once, however many objects it got
+    assert synced["files"] == 30 + 4
+    assert sorted(synced["dirs"]) == sorted(fanout)
+    assert leftover_temp_files(repo) == []
+    app(repo, "commit-tree", tree_sha, "-p", "0" * 40, "-m", "fsynced")
+    git(repo, "fsck", "--full", "--strict")
+    git(repo, "add", "-A")
+    assert tree_sha == git(repo, "write-tree").strip()
+
+
+def test_batched_objects_appear_when_the_batch_ends(repo, in_repo):
+    app(repo, "config", "core.fsyncObjectFiles", "true")
+    in_repo(repo)
+
+    with main.object_batch():
+        blob_sha = main.store_object(main.Blob(b"batched\n"))
+        assert not os.path.exists(repo / main.loose_object_path(blob_sha))
+        # The pending object still counts as stored, so it isn't written twice
+        assert main.object_exists(blob_sha)
+        assert main.store_object(main.Blob(b"batched\n")) == blob_sha
+        assert len(leftover_temp_files(repo)) == 1
+    assert leftover_temp_files(repo) == []
+    assert git(repo, "cat-file", "-p", blob_sha) == "batched\n"
+
+
+def test_unsynced_writes_leave_no_temp_files(repo):
+    write_files(repo, {f"file{i}.txt": f"content {i}\n" for i in range(10)})
+    tree_sha = app(repo, "write-tree").strip()
+    app(repo, "commit-tree", tree_sha, "-p", "0" * 40, "-m", "unsynced")
+
+    assert leftover_temp_files(repo) == []
+    git(repo, "fsck", "--full", "--strict")
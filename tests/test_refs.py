@@ -0,0 +1,68 @@
+"""
+packed-refs written by pack-refs and read by binary search, compared with git.
+"""
+import os
+
+from conftest import app, git, main, requires_git
+
+pytestmark = requires_git
+
+
+def tagged_history(repo):
+    """
+    A git repository with branches in nested directories, an annotated tag, a tag
+    of that tag and a lightweight tag.
+    """
+    git(repo, "init", "-q", "-b", "main")
+    for i in range(3):
+        with open(os.path.join(repo, "file.txt"), "w") as f:
+            f.write(f"version {i}\n")
+        git(repo, "add", "file.txt")
+        git(repo, "commit", "-q", "-m", f"commit {i}")
+        git(repo, "branch", f"feature/deep/b{i}")
+    git(repo, "tag", "-a", "v1", "-m", "release", "HEAD~1")
+    git(repo, "tag", "-a", "v1-signed", "-m", "tag of a tag", "v1")
+    git(repo, "tag", "nested/light", "HEAD~2")
+
+
+def test_pack_refs_keeps_peeled_tags(tmp_path):
+    tagged_history(tmp_path)
+    expected = git(tmp_path, "show-ref", "-d")
+    description = git(tmp_path, "describe")
+
+    app(tmp_path, "pack-refs")
+
+    assert git(tmp_path, "show-ref", "-d") == expected
+    assert git(tmp_path, "describe") == description
+    with open(tmp_path / ".git/packed-refs") as f:
+        packed = f.read()
+    assert packed.startswith("# pack-refs with: peeled fully-peeled sorted")
+    # Both annotated tags peel to the commit, the tag of a tag included
+    commit_sha = git(tmp_path, "rev-parse", "v1^{commit}").strip()
+    assert packed.count(f"^{commit_sha}\n") == 2
+
+
+def test_pack_refs_prunes_empty_directories(tmp_path):
+    tagged_history(tmp_path)
+    app(tmp_path, "pack-refs")
+
+    refs = tmp_path / ".git/refs"
+    assert not os.path.exists(refs / "heads/feature")
+    assert not os.path.exists(refs / "tags/nested")
+    assert os.path.isdir(refs / "heads") and os.path.isdir(refs / "tags")
+
+
+def test_packed_ref_lookup_matches_git(tmp_path, in_repo):
+    tagged_history(tmp_path)
+    # Git's own packed-refs, "^" lines included
+    git(tmp_path, "pack-refs", "--all")
+    in_repo(tmp_path)
+
+    for line in git(tmp_path, "show-ref").splitlines():
+        sha, refname = line.split()
+        assert main.find_packed_ref(refname) == sha
+        assert main.read_ref(refname) == sha
+    for missing in ("refs/heads/feature", "refs/heads/a", "refs/tags/zzz", "refs/tags/v1^{}"):
+        assert main.find_packed_ref(missing) is None
+    assert main.list_refs("refs/heads/") == dict(
+        line.split()[::-1] for line in git(tmp_path, "show-ref", "--heads").splitlines())
@@ -0,0 +1,66 @@
+"""
+Tracing goes to stderr or a log file and leaves a command's output alone; the
+perf report's counters agree with what git sees in the repository.
+"""
+import json
+import subprocess
+import sys
+
+from conftest import app, command_env, git, requires_git, write_files
+
+pytestmark = requires_git
+
+
+def run_traced(repo, *args, env=None):
+    """
+    Run this program with extra environment variables and return (stdout, stderr).
+    """
+    result = subprocess.run([sys.executable, "-m", "app.main", *args], cwd=repo,
+                            env={**command_env(), **(env or {})}, capture_output=True, text=True, check=True)
+    return result.stdout, result.stderr
+
+
+def loose_object_count(repo):
+    counts = dict(line.split(": ") for line in git(repo, "count-objects", "-v").splitlines())
+    return int(counts["count"])
+
+
+def test_quiet_by_default_and_same_output_when_traced(repo):
+    write_files(repo, {f"dir/{i}.txt": f"file {i}\n" for i in range(5)})
+    quiet, quiet_errors = run_traced(repo, "write-tree")
+    traced, traced_errors = run_traced(repo, "--trace", "write-tree")
+    env_traced, _ = run_traced(repo, "write-tree", env={"GIT_TRACE": "1"})
+
+    assert quiet_errors == ""
+    assert quiet == traced == env_traced
+    assert quiet.strip() == git(repo, "write-tree").strip()
+    # Debug output ends with the perf report
+    assert json.loads(traced_errors.splitlines()[-1])["command"] == "write-tree"
+
+
+def test_perf_report_counts_what_git_sees(repo):
+    files = {f"dir/{i}.txt": f"file {i}\n" for i in range(7)}
+    write_files(repo, files)
+    _, errors = run_traced(repo, "write-tree", "--jobs", "2", env={"GIT_TRACE_PERF": "1"})
+    report = json.loads(errors)
+
+    # Seven blobs and two trees, all new and loose
+    assert report["counters"]["objects_written"] == loose_object_count(repo) == len(files) + 2
+    assert report["counters"]["files_stated"] >= len(files)
+    assert {"read_index", "scan_worktree", "hash_files", "write_index"} <= report["phases"].keys()
+    assert all(phase["calls"] >= 1 and phase["seconds"] >= 0 for phase in report["phases"].values())
+
+
+def test_perf_report_appends_to_a_file(repo, tmp_path):
+    log_path = tmp_path / "perf.log"
+    write_files(repo, {"file.txt": "content\n"})
+    blob_sha = app(repo, "hash-object", "-w", "file.txt").strip()
+
+    run_traced(repo, "cat-file", "-p", blob_sha, env={"GIT_TRACE_PERF": str(log_path)})
+    stdout, stderr = run_traced(repo, "cat-file", "-p", blob_sha, env={"GIT_TRACE_PERF": str(log_path)})
+    assert stdout == git(repo, "cat-file", "-p", blob_sha) and stderr == ""
+
+    with open(log_path) as f:
+        reports = [json.loads(line) for line in f]
+    assert [report["command"] for report in reports] == ["cat-file", "cat-file"]
+    assert all(report["counters"]["objects_read"] >= 1 for report in reports)
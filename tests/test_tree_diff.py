@@ -0,0 +1,55 @@
+"""
+diff between two commits, compared with git diff --name-status.
+"""
+import os
+
+from conftest import app, git, requires_git, write_files
+
+pytestmark = requires_git
+
+
+def commit_all(repo, message):
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", message)
+    return git(repo, "rev-parse", "HEAD").strip()
+
+
+def git_name_status(repo, old, new):
+    return git(repo, "diff", "--name-status", "--no-renames", old, new).splitlines()
+
+
+def app_name_status(repo, old, new):
+    lines = app(repo, "diff", old, new).splitlines()
+    assert lines[0] == f"Diff between {old} and {new}:"
+    return lines[1:]
+
+
+def test_diff_matches_git(tmp_path):
+    git(tmp_path, "init", "-q", "-b", "main")
+    write_files(tmp_path, {"top": "file\n", "dir/a.txt": "a\n", "dir/sub/b.txt": "b\n", "same/c.txt": "c\n",
+                           "a-b.txt": "dash\n", "edit.txt": "old\n", "gone.txt": "bye\n", "run.sh": "#!/bin/sh\n"})
+    old = commit_all(tmp_path, "old")
+
+    os.remove(tmp_path / "top")
+    os.remove(tmp_path / "gone.txt")
+    os.remove(tmp_path / "dir/sub/b.txt")
+    os.rmdir(tmp_path / "dir/sub")
+    os.chmod(tmp_path / "run.sh", 0o755)
+    write_files(tmp_path, {"top/inner.txt": "now a directory\n", "dir/sub": "now a file\n", "edit.txt": "new\n", "a-b.txt": "changed\n",
+                           "a/new.txt": "sorted next to a-b.txt\n", "dir/z.txt": "z\n"})
+    new = commit_all(tmp_path, "new")
+
+    assert app_name_status(tmp_path, old, new) == git_name_status(tmp_path, old, new)
+    assert app_name_status(tmp_path, new, old) == git_name_status(tmp_path, new, old)
+    assert app_name_status(tmp_path, old, old) == []
+
+
+def test_diff_between_branches(tmp_path):
+    git(tmp_path, "init", "-q", "-b", "main")
+    write_files(tmp_path, {"file.txt": "one\n"})
+    commit_all(tmp_path, "main")
+    git(tmp_path, "checkout", "-q", "-b", "topic")
+    write_files(tmp_path, {"file.txt": "two\n", "deep/er/new.txt": "new\n"})
+    commit_all(tmp_path, "topic")
+
+    assert app_name_status(tmp_path, "main", "topic") == git_name_status(tmp_path, "main", "topic")